@@ -5,3 +5,7 @@ class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
     verbose_name = 'Core'
+
+    def ready(self):
+        from .images import connect_signals
+        connect_signals()
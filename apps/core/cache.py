@@ -0,0 +1,27 @@
+"""
+Cache version keys for New Class Royal Ministries website.
+
+Cached data is invalidated in bulk by embedding a version number in its
+keys and bumping the version. Versions are seeded from the clock in
+microseconds, so a version key that was evicted or flushed restarts above
+every version handed out before it, never reusing one whose entries may
+still be cached.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def new_version():
+    return time.time_ns() // 1000
+
+
+def get_version(key):
+    return cache.get_or_set(key, new_version, None)
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), None)
@@ -0,0 +1,209 @@
+"""
+Image derivatives for New Class Royal Ministries website.
+
+Uploaded images are resized and recompressed into the variants listed in
+``IMAGE_VARIANTS`` (one WebP and one JPEG file each). Derivative names are
+derived from the original file name, so serializers can expose variant
+URLs without any extra queries.
+
+Each model with an image field also has a ``derivatives_of`` field, set to
+the image's name once all of its derivatives have been written. Until it
+matches the current image (before the build finishes, or after it
+failed), every variant URL points at the original. Rows where the two
+differ are the build queue: ``build_image_derivatives --loop`` (or the
+same command from cron) resizes them in worker processes, away from the
+web workers. With ``DEBUG`` on, uploads are also built in a background
+thread of the web process so local development needs no worker.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# (model label, image field) pairs that get derivatives.
+IMAGE_FIELDS = [
+    ('sermons.Sermon', 'thumbnail'),
+    ('sermons.SermonSeries', 'image'),
+    ('core.Staff', 'photo'),
+    ('events.Event', 'image'),
+    ('livestream.LiveStream', 'thumbnail'),
+    ('donations.DonationCampaign', 'image'),
+]
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def variants():
+    return getattr(settings, 'IMAGE_VARIANTS', {'thumb': 320, 'medium': 960})
+
+
+def derivative_name(name, variant, fmt):
+    """
+    Storage name of one derivative of the original file ``name``.
+    """
+    root, _ = os.path.splitext(name)
+    extension = 'jpg' if fmt == 'jpeg' else fmt
+    return f'derivatives/{root}_{variant}.{extension}'
+
+
+def has_derivatives(field_file):
+    return getattr(field_file.instance, 'derivatives_of', None) == field_file.name
+
+
+def variant_urls(field_file, storage=None):
+    """
+    Return ``{variant: {format: url}}`` for an image, or None if empty.
+    Variants that have not been built yet all use the original's URL.
+    """
+    if not field_file:
+        return None
+    if not has_derivatives(field_file):
+        url = field_file.url
+        return {variant: {fmt: url for fmt in FORMATS} for variant in variants()}
+    storage = storage or field_file.storage
+    return {
+        variant: {fmt: storage.url(derivative_name(field_file.name, variant, fmt)) for fmt in FORMATS}
+        for variant in variants()
+    }
+
+
+def build_derivatives(name, force=False):
+    """
+    Create every derivative of the stored image ``name``.
+
+    Returns the number of files written. Existing derivatives are kept
+    unless ``force`` is set.
+    """
+    storage = default_storage
+    targets = [
+        (variant, size, fmt)
+        for variant, size in variants().items()
+        for fmt in FORMATS
+        if force or not storage.exists(derivative_name(name, variant, fmt))
+    ]
+    if not targets:
+        return 0
+
+    with storage.open(name, 'rb') as fh:
+        original = ImageOps.exif_transpose(Image.open(fh))
+        original.load()
+    if original.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', original.size, 'white')
+        background.paste(original.convert('RGBA'), mask=original.convert('RGBA').getchannel('A'))
+        original = background
+
+    written = 0
+    for variant, size, fmt in targets:
+        image = original.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        pil_format, options = FORMATS[fmt]
+        image.save(buffer, pil_format, **options)
+        target = derivative_name(name, variant, fmt)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(buffer.getvalue()))
+        written += 1
+    return written
+
+
+def mark_built(model, field_name, names):
+    """
+    Record that the derivatives of ``names`` exist on every row of
+    ``model`` whose ``field_name`` holds one of them.
+    """
+    return model.objects.filter(**{f'{field_name}__in': names}).exclude(
+        derivatives_of=F(field_name)
+    ).update(derivatives_of=F(field_name))
+
+
+def _build_safely(model, field_name, name):
+    try:
+        build_derivatives(name)
+    except Exception:
+        logger.exception('Failed to build image derivatives for %s', name)
+        return
+    mark_built(model, field_name, [name])
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+            thread_name_prefix='image-derivatives'
+        )
+    return _executor
+
+
+def pending(model, field_name):
+    """
+    Rows of ``model`` whose ``field_name`` image has no derivatives yet.
+    """
+    return model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).exclude(
+        derivatives_of=F(field_name)
+    )
+
+
+def schedule_derivatives(model, field_name, name):
+    """
+    Build derivatives for ``name`` in a background thread once the current
+    transaction commits, then mark the rows holding it. Only used with
+    ``DEBUG`` on; otherwise ``build_image_derivatives`` picks the row up.
+    """
+    transaction.on_commit(lambda: get_executor().submit(_build_safely, model, field_name, name))
+
+
+def make_post_save_handler(field_name):
+    def handler(sender, instance, update_fields=None, **kwargs):
+        if not settings.DEBUG:
+            return  # Queued by its derivatives_of; built by build_image_derivatives
+        if update_fields is not None and field_name not in update_fields:
+            return
+        field_file = getattr(instance, field_name)
+        if field_file and not has_derivatives(field_file):
+            schedule_derivatives(sender, field_name, field_file.name)
+    return handler
+
+
+def connect_signals():
+    for label, field_name in IMAGE_FIELDS:
+        post_save.connect(
+            make_post_save_handler(field_name),
+            sender=apps.get_model(label),
+            weak=False,
+            dispatch_uid=f'image-derivatives-{label}-{field_name}'
+        )
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Read-only serializer field exposing the derivative URLs of an image.
+    """
+
+    def to_representation(self, value):
+        urls = variant_urls(value)
+        request = self.context.get('request')
+        if urls and request is not None:
+            urls = {
+                variant: {fmt: request.build_absolute_uri(url) for fmt, url in formats.items()}
+                for variant, formats in urls.items()
+            }
+        return urls
@@ -0,0 +1,95 @@
+"""
+Build resized image derivatives for uploaded images.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from apps.core.images import IMAGE_FIELDS, build_derivatives, mark_built, pending
+
+MARK_BATCH_SIZE = 500
+
+
+def _build(name, force):
+    try:
+        return name, build_derivatives(name, force=force), None
+    except Exception as exc:
+        return name, 0, str(exc)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create WebP/JPEG derivatives for uploaded images that do not have them yet, in "
+        "parallel worker processes. Run it with --loop (or from cron) to build new uploads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (defaults to CPU count)")
+        parser.add_argument('--all', action='store_true', help="Check every image, not only the queued ones")
+        parser.add_argument('--force', action='store_true', help="Rebuild derivatives that already exist (implies --all)")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new uploads")
+        parser.add_argument(
+            '--interval', type=float, default=settings.IMAGE_DERIVATIVE_POLL_INTERVAL,
+            help="Seconds to wait between polls when nothing is queued (with --loop)"
+        )
+
+    def handle(self, *args, **options):
+        everything = options['all'] or options['force']
+        totals = [0, 0, 0]
+        # Images that fail are not retried until the next run.
+        failed_names = set()
+        try:
+            while True:
+                names = self.queued_names(everything) - failed_names
+                if names:
+                    counts = self.build(names, options['workers'], options['force'], failed_names)
+                    totals = [total + count for total, count in zip(totals, counts)]
+                if not options['loop']:
+                    break
+                everything = False
+                if not names:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        processed, written, failed = totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} image(s): {written} derivative(s) written, {failed} failed."
+        ))
+
+    def queued_names(self, everything):
+        names = set()
+        for label, field_name in IMAGE_FIELDS:
+            model = apps.get_model(label)
+            if everything:
+                rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            else:
+                rows = pending(model, field_name)
+            names.update(rows.values_list(field_name, flat=True).iterator())
+        return names
+
+    def build(self, names, workers, force, failed_names):
+        # Worker processes must not inherit open database connections.
+        connections.close_all()
+
+        written = 0
+        built = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_build, name, force) for name in sorted(names)]
+            for future in as_completed(futures):
+                name, count, error = future.result()
+                if error:
+                    failed_names.add(name)
+                    self.stderr.write(f"{name}: {error}")
+                else:
+                    built.append(name)
+                written += count
+
+        for label, field_name in IMAGE_FIELDS:
+            model = apps.get_model(label)
+            for start in range(0, len(built), MARK_BATCH_SIZE):
+                mark_built(model, field_name, built[start:start + MARK_BATCH_SIZE])
+        return len(names), written, len(names) - len(built)
@@ -99,6 +99,7 @@ class Staff(TimeStampedModel):
     position = models.CharField(max_length=20, choices=POSITION_CHOICES)
     bio = RichTextField(blank=True)
     photo = models.ImageField(upload_to='staff/', blank=True, null=True)
+    derivatives_of = models.CharField(max_length=100, blank=True, editable=False)
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=20, blank=True)
     
@@ -0,0 +1,183 @@
+"""
+Pagination classes for New Class Royal Ministries API.
+"""
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, Cursor, CursorPagination, PageNumberPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on the view's ``cursor_ordering``.
+
+    Deep pages cost the same as the first one (no ``COUNT(*)`` or
+    ``OFFSET``), and results stay stable while new rows are inserted.
+    An explicit ``?ordering=`` still takes precedence.
+
+    DRF's cursor stores only the first ordering value and skips rows that
+    share it with an offset, which drifts when rows are inserted into a run
+    of equal values. This cursor stores the value of every ordering field,
+    always ending in ``id``, and filters on the whole tuple, so a position
+    is unique and no offset is needed. Ordering fields must not be null.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        cursor_ordering = getattr(view, 'cursor_ordering', None)
+        if cursor_ordering and not request.query_params.get(OrderingFilter.ordering_param):
+            ordering = tuple(cursor_ordering)
+        else:
+            ordering = super().get_ordering(request, queryset, view)
+        if not any(order.lstrip('-') in ('id', 'pk') for order in ordering):
+            # Break ties on the primary key, in the direction of the first field.
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*[
+                order[1:] if order.startswith('-') else '-' + order for order in self.ordering
+            ])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            try:
+                queryset = queryset.filter(self.get_position_filter(current_position, reverse))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_position_filter(self, position, reverse):
+        """
+        Rows strictly after ``position`` in the (possibly reversed) ordering:
+        ``(a, b, c) > (x, y, z)`` expanded to
+        ``a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)``.
+        """
+        values = json.loads(position)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise ValueError('Cursor position does not match the ordering.')
+
+        condition = Q()
+        equal = Q()
+        for order, value in zip(self.ordering, values):
+            field = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.next_position
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.previous_position
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field_name = order.lstrip('-')
+            attr = instance[field_name] if isinstance(instance, dict) else getattr(instance, field_name)
+            values.append(str(attr))
+        return json.dumps(values)
+
+
+class ArchivePagination(BasePagination):
+    """
+    Page-number pagination by default, keyset cursor pagination on demand.
+
+    A view opts into cursors by default with ``pagination_mode = 'cursor'``;
+    clients choose per request with ``?pagination=cursor`` or
+    ``?pagination=page``. A request carrying a ``cursor`` is always served
+    by the cursor paginator.
+    """
+    mode_query_param = 'pagination'
+
+    def get_mode(self, request, view):
+        mode = request.query_params.get(self.mode_query_param)
+        if request.query_params.get(KeysetCursorPagination.cursor_query_param):
+            mode = 'cursor'
+        if mode not in ('cursor', 'page'):
+            mode = getattr(view, 'pagination_mode', 'page')
+        return mode
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.get_mode(request, view) == 'cursor':
+            self.paginator = KeysetCursorPagination()
+        else:
+            self.paginator = PageNumberPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return PageNumberPagination().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            *PageNumberPagination().get_schema_operation_parameters(view),
+            *KeysetCursorPagination().get_schema_operation_parameters(view),
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': "Pagination style: 'page' or 'cursor'.",
+                'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+            },
+        ]
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return data['results']
@@ -2,6 +2,7 @@
 Serializers for core app.
 """
 from rest_framework import serializers
+from .images import ImageVariantsField
 from .models import ChurchInfo, Staff, Ministry, Announcement, VerseOfTheDay, ContactMessage, Program
 
 
@@ -13,12 +14,13 @@ class ChurchInfoSerializer(serializers.ModelSerializer):
 
 class StaffSerializer(serializers.ModelSerializer):
     position_display = serializers.CharField(source='get_position_display', read_only=True)
+    photo_variants = ImageVariantsField(source='photo')
     
     class Meta:
         model = Staff
         fields = [
             'id', 'name', 'position', 'position_display', 'bio', 
-            'photo', 'email', 'phone', 'qualifications', 'specializations',
+            'photo', 'photo_variants', 'email', 'phone', 'qualifications', 'specializations',
             'order', 'is_active'
         ]
 
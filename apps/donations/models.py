@@ -19,6 +19,7 @@ class DonationCampaign(TimeStampedModel):
     start_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateTimeField(null=True, blank=True)
     image = models.ImageField(upload_to='campaigns/', blank=True, null=True)
+    derivatives_of = models.CharField(max_length=100, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False)
 
@@ -3,6 +3,7 @@ Serializers for donations app.
 """
 from rest_framework import serializers
 from .models import Donation, DonationCampaign
+from apps.core.images import ImageVariantsField
 
 
 class DonationCampaignSerializer(serializers.ModelSerializer):
@@ -11,12 +12,13 @@ class DonationCampaignSerializer(serializers.ModelSerializer):
     """
     progress_percentage = serializers.ReadOnlyField()
     is_completed = serializers.ReadOnlyField()
+    image_variants = ImageVariantsField(source='image')
     
     class Meta:
         model = DonationCampaign
         fields = [
             'id', 'name', 'description', 'goal_amount', 'current_amount',
-            'start_date', 'end_date', 'image', 'is_active', 'is_featured',
+            'start_date', 'end_date', 'image', 'image_variants', 'is_active', 'is_featured',
             'progress_percentage', 'is_completed', 'created_at'
         ]
 
@@ -32,7 +32,7 @@ class EventRegistrationInline(admin.TabularInline):
 class EventAdmin(admin.ModelAdmin):
     list_display = [
         'title', 'category', 'start_datetime', 'location', 
-        'registration_count', 'is_featured', 'is_published'
+        'registration_count', 'seats_taken', 'is_featured', 'is_published'
     ]
     list_filter = [
         'category', 'ministry', 'is_published', 'is_featured',
@@ -73,9 +73,20 @@ class EventAdmin(admin.ModelAdmin):
     
     inlines = [EventRegistrationInline]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('category').with_registration_counts()
+    
     def registration_count(self, obj):
         return obj.registration_count
     registration_count.short_description = 'Registrations'
+    registration_count.admin_order_field = 'num_registrations'
+    
+    def seats_taken(self, obj):
+        if obj.max_attendees:
+            return f"{obj.seats_taken} / {obj.max_attendees}"
+        return obj.seats_taken
+    seats_taken.short_description = 'Seats'
+    seats_taken.admin_order_field = 'num_seats_taken'
 
 
 @admin.register(EventRegistration)
@@ -121,7 +132,7 @@ class EventAttendanceAdmin(admin.ModelAdmin):
 
 @admin.register(EventReminder)
 class EventReminderAdmin(admin.ModelAdmin):
-    list_display = ['user', 'event', 'reminder_datetime', 'is_sent']
+    list_display = ['user', 'event', 'reminder_datetime', 'is_sent', 'sent_at', 'failed_at']
     list_filter = ['is_sent', 'reminder_datetime']
     search_fields = ['user__username', 'event__title']
     ordering = ['-reminder_datetime']
@@ -0,0 +1,127 @@
+"""
+QR check-in sync for events app.
+
+Door devices keep scanning while offline and upload their scans in
+batches. A scan is a registration id or a signed check-in token, plus the
+device's timestamp. Batches are idempotent: each registration is checked
+in at most once (enforced by a unique constraint), so a batch that is sent
+twice, or the same person scanned at two doors, only counts once. A
+registration's check-in time is taken from the earliest scan in the first
+batch that contains it.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .models import EventAttendance, EventRegistration
+
+
+def parse_token(token, event_id):
+    """
+    Return the registration id of a check-in token for ``event_id``, or None.
+    """
+    registration_id, _, signature = token.strip().partition('.')
+    if not registration_id.isdigit():
+        return None
+    expected = EventRegistration.check_in_signature(int(registration_id), event_id)
+    if not constant_time_compare(signature, expected):
+        return None
+    return int(registration_id)
+
+
+def submitted_as(scan):
+    """
+    How the device identified the registration: ``{'registration': id}``
+    or ``{'token': token}``.
+    """
+    if scan.get('registration') is not None:
+        return {'registration': scan['registration']}
+    return {'token': scan['token']}
+
+
+def record_check_ins(event, scans):
+    """
+    Check in a batch of scans (dicts with ``registration`` or ``token`` and
+    an optional ``scanned_at``). Returns a dict with the number of new and
+    repeated check-ins, the rejected scans and the state of every matched
+    registration.
+
+    Rejected scans are reported as submitted (``registration`` or
+    ``token``) with a ``reason``: ``invalid_token`` when the token's
+    signature does not match this event, ``not_registered`` when there is
+    no confirmed registration for the scan.
+    """
+    now = timezone.now()
+    earliest = {}
+    submitted = {}
+    invalid = []
+    for scan in scans:
+        registration_id = scan.get('registration')
+        if registration_id is None:
+            registration_id = parse_token(scan['token'], event.pk)
+        if registration_id is None:
+            invalid.append({**submitted_as(scan), 'reason': 'invalid_token'})
+            continue
+        # Kept to report the scan if the registration turns out unknown.
+        refs = submitted.setdefault(registration_id, [])
+        if submitted_as(scan) not in refs:
+            refs.append(submitted_as(scan))
+        # Device clocks can run ahead; a check-in is never in the future.
+        scanned_at = min(scan.get('scanned_at') or now, now)
+        if registration_id not in earliest or scanned_at < earliest[registration_id]:
+            earliest[registration_id] = scanned_at
+
+    registrations = {
+        registration.pk: registration
+        for registration in EventRegistration.objects.filter(
+            event=event, is_confirmed=True, pk__in=earliest
+        ).select_related('user').only(
+            'pk', 'event_id', 'user_id', 'first_name', 'last_name', 'number_of_attendees', 'attended',
+            'user__first_name', 'user__last_name', 'user__username',
+        )
+    }
+    invalid.extend(
+        {**ref, 'reason': 'not_registered'}
+        for registration_id in earliest if registration_id not in registrations
+        for ref in submitted[registration_id]
+    )
+
+    with transaction.atomic():
+        EventAttendance.objects.bulk_create(
+            [
+                EventAttendance(
+                    event=event,
+                    registration_id=registration.pk,
+                    user_id=registration.user_id,
+                    check_in_time=earliest[registration.pk],
+                )
+                for registration in registrations.values()
+            ],
+            batch_size=settings.EVENT_CHECK_IN_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        EventRegistration.objects.filter(pk__in=registrations, attended=False).update(attended=True)
+
+    check_in_times = dict(
+        EventAttendance.objects.filter(event=event, registration_id__in=registrations).values_list(
+            'registration_id', 'check_in_time'
+        )
+    )
+    repeated = sum(1 for registration in registrations.values() if registration.attended)
+    return {
+        'checked_in': len(registrations) - repeated,
+        'already_checked_in': repeated,
+        'invalid': invalid,
+        'registrations': [
+            {
+                'id': registration.pk,
+                'full_name': registration.full_name,
+                'number_of_attendees': registration.number_of_attendees,
+                'attended': True,
+                'already_checked_in': registration.attended,
+                'check_in_time': check_in_times.get(registration.pk),
+            }
+            for registration in registrations.values()
+        ],
+    }
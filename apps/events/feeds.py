@@ -0,0 +1,460 @@
+"""
+Calendar feeds for events app.
+
+The FullCalendar feed is assembled from per-month buckets of occurrences
+joined with a ``values()`` projection of their events and categories.
+Buckets are cached under the occurrences version, which is bumped whenever
+an event or category changes. The same version gives every window a cheap
+ETag, and the time of the last bump bounds Last-Modified from below.
+
+The iCalendar feeds (all events, or one category's or ministry's) are for
+calendar apps that subscribe and poll. Recurring events are written once
+with an RRULE rather than expanded, in local time with a VTIMEZONE built
+from the zoneinfo database, so they keep their wall-clock time across
+DST changes. A feed is streamed on a cache miss and
+stored as it goes, so later polls are served from the cache or answered
+with 304.
+"""
+import calendar
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from apps.core.models import ChurchInfo, Ministry
+from .models import Event, EventCategory
+from .occurrences import month_occurrences, months_between, occurrences_changed_at, occurrences_version
+
+DEFAULT_COLOR = '#3B82F6'
+
+CALENDAR_FIELDS = [
+    'id', 'title', 'all_day', 'location', 'requires_registration', 'updated_at',
+    'category__name', 'category__color', 'category__updated_at',
+]
+
+
+class InvalidWindow(ValueError):
+    pass
+
+
+def check_window(start, end):
+    """
+    Raise ``InvalidWindow`` unless ``[start, end)`` is a bounded, ordered
+    window no longer than ``EVENT_CALENDAR_MAX_DAYS``.
+    """
+    if start is None or end is None:
+        raise InvalidWindow("Both 'start' and 'end' are required (ISO date or datetime).")
+    if end <= start:
+        raise InvalidWindow("'end' must be after 'start'.")
+    if end - start > timedelta(days=settings.EVENT_CALENDAR_MAX_DAYS):
+        raise InvalidWindow(f"The window may span at most {settings.EVENT_CALENDAR_MAX_DAYS} days.")
+
+
+def calendar_etag(start, end):
+    return f'"{occurrences_version()}-{int(start.timestamp())}-{int(end.timestamp())}"'
+
+
+def month_calendar(year, month):
+    """
+    Return ``(entries, last_modified)`` for one month, cached. Each entry is
+    ``(start, end, payload)`` so windows can be cut without re-reading rows.
+    """
+    key = f'events:calendar:{occurrences_version()}:{year}-{month:02d}'
+    bucket = cache.get(key)
+    if bucket is None:
+        occurrences = month_occurrences(year, month)
+        rows = {
+            row['id']: row
+            for row in Event.objects.filter(
+                id__in={occurrence.event_id for occurrence in occurrences}
+            ).values(*CALENDAR_FIELDS)
+        }
+        entries = []
+        last_modified = None
+        for occurrence in occurrences:
+            row = rows.get(occurrence.event_id)
+            if row is None:
+                continue
+            entries.append((occurrence.start, occurrence.end, {
+                'id': row['id'],
+                'title': row['title'],
+                'start': occurrence.start.isoformat(),
+                'end': occurrence.end.isoformat(),
+                'allDay': row['all_day'],
+                'color': row['category__color'] or DEFAULT_COLOR,
+                'url': f"/events/{row['id']}",
+                'extendedProps': {
+                    'location': row['location'],
+                    'category': row['category__name'] or '',
+                    'requiresRegistration': row['requires_registration'],
+                }
+            }))
+            changed = max(filter(None, [row['updated_at'], row['category__updated_at']]))
+            last_modified = max(last_modified, changed) if last_modified else changed
+        bucket = (entries, last_modified and int(last_modified.timestamp()))
+        cache.set(key, bucket, settings.EVENT_OCCURRENCE_CACHE_TIMEOUT)
+    return bucket
+
+
+def calendar_events(start, end):
+    """
+    Return ``(events, last_modified)`` for the FullCalendar feed of a window.
+    """
+    events = []
+    seen = set()
+    last_modified = occurrences_changed_at()
+    for year, month in months_between(start, end):
+        entries, bucket_modified = month_calendar(year, month)
+        if bucket_modified:
+            last_modified = max(last_modified, bucket_modified)
+        for occurrence_start, occurrence_end, payload in entries:
+            identity = (payload['id'], occurrence_start)
+            if occurrence_start < end and occurrence_end > start and identity not in seen:
+                seen.add(identity)
+                events.append(payload)
+    return events, last_modified
+
+
+ICAL_FIELDS = [
+    'id', 'title', 'description', 'start_datetime', 'end_datetime', 'all_day',
+    'recurrence', 'recurrence_end_date', 'location', 'address', 'online_link',
+    'created_at', 'updated_at', 'category__name',
+]
+
+RRULE_FREQUENCIES = {
+    'daily': 'DAILY',
+    'weekly': 'WEEKLY',
+    'monthly': 'MONTHLY',
+    'yearly': 'YEARLY',
+}
+
+
+def ical_text(value):
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def ical_line(line):
+    """
+    Fold a content line at 75 octets (RFC 5545 3.1) and terminate it.
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    start = 0
+    limit = 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Never split a multi-byte character.
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def ical_utc(value):
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def is_utc(tz_name):
+    return tz_name in ('UTC', 'Etc/UTC')
+
+
+def ical_time(name, value, all_day=False):
+    """
+    A DTSTART/DTEND property: a DATE for all-day events, UTC when the site
+    runs on UTC, else local time with the zone's TZID (defined by
+    ``ical_vtimezone``) so recurrences keep their wall-clock time across
+    DST changes.
+    """
+    if all_day:
+        return f'{name};VALUE=DATE:{value:%Y%m%d}'
+    tz_name = timezone.get_current_timezone_name()
+    if is_utc(tz_name):
+        return f'{name}:{ical_utc(value)}'
+    return f'{name};TZID={tz_name}:{timezone.localtime(value):%Y%m%dT%H%M%S}'
+
+
+def ical_offset(offset):
+    minutes = int(offset.total_seconds()) // 60
+    sign = '-' if minutes < 0 else '+'
+    return f'{sign}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}'
+
+
+def tz_transitions(tz_name, first_year, last_year):
+    """
+    Every UTC offset change of a zone between the two years, as
+    ``(utc instant, offset before, offset after, is_dst, abbreviation)``.
+    zoneinfo has no public transition list, so days are scanned and the
+    instant is found by bisection.
+    """
+    tz = ZoneInfo(tz_name)
+    utc = timezone.utc
+
+    def offset(instant):
+        return instant.astimezone(tz).utcoffset()
+
+    transitions = []
+    day = datetime(first_year, 1, 1, tzinfo=utc)
+    end = datetime(last_year + 1, 1, 1, tzinfo=utc)
+    before = offset(day)
+    while day < end:
+        following = day + timedelta(days=1)
+        after = offset(following)
+        if after != before:
+            low, high = day, following
+            while high - low > timedelta(seconds=1):
+                middle = low + (high - low) / 2
+                if offset(middle) == before:
+                    low = middle
+                else:
+                    high = middle
+            high = high.replace(microsecond=0)
+            local = high.astimezone(tz)
+            transitions.append((high, before, after, bool(local.dst()), local.tzname()))
+            before = after
+        day = following
+    return transitions
+
+
+def yearly_rule(onset):
+    """
+    ``(month, BYDAY)`` of a transition's local onset, e.g. ``(3, '2SU')``
+    or ``(10, '-1SU')`` when it falls in the last week of the month.
+    """
+    weekday = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU'][onset.weekday()]
+    if onset.day + 7 > calendar.monthrange(onset.year, onset.month)[1]:
+        return onset.month, f'-1{weekday}'
+    return onset.month, f'{(onset.day - 1) // 7 + 1}{weekday}'
+
+
+@lru_cache(maxsize=16)
+def ical_vtimezone(tz_name, first_year, last_year):
+    """
+    The VTIMEZONE lines defining ``tz_name`` from ``first_year`` on.
+
+    Transitions that repeat on the same weekday rule in consecutive years
+    are merged into one observance with a yearly RRULE. The run still in
+    force at ``last_year`` is left open, so it also covers later years.
+    """
+    transitions = tz_transitions(tz_name, first_year, last_year)
+    runs = []
+    latest = {}
+    for instant, before, after, dst, name in transitions:
+        onset = (instant + before).replace(tzinfo=None)
+        key = (dst, before, after, name, onset.time(), yearly_rule(onset))
+        run = latest.get(key)
+        if run is not None and run['last'].year == onset.year - 1:
+            run['last'], run['until'], run['count'] = onset, instant, run['count'] + 1
+        else:
+            latest[key] = {'key': key, 'first': onset, 'last': onset, 'until': instant, 'count': 1}
+            runs.append(latest[key])
+
+    # The offset in force before the first transition (or always, for
+    # zones without DST).
+    start = datetime(first_year, 1, 1, tzinfo=timezone.utc).astimezone(ZoneInfo(tz_name))
+    kind = 'DAYLIGHT' if start.dst() else 'STANDARD'
+    lines = [
+        'BEGIN:VTIMEZONE',
+        f'TZID:{tz_name}',
+        f'BEGIN:{kind}',
+        f'DTSTART:{first_year - 1}0101T000000',
+        f'TZOFFSETFROM:{ical_offset(start.utcoffset())}',
+        f'TZOFFSETTO:{ical_offset(start.utcoffset())}',
+        f'TZNAME:{start.tzname()}',
+        f'END:{kind}',
+    ]
+    for run in runs:
+        dst, before, after, name, _, (month, byday) = run['key']
+        kind = 'DAYLIGHT' if dst else 'STANDARD'
+        lines.extend([
+            f'BEGIN:{kind}',
+            f"DTSTART:{run['first']:%Y%m%dT%H%M%S}",
+            f'TZOFFSETFROM:{ical_offset(before)}',
+            f'TZOFFSETTO:{ical_offset(after)}',
+        ])
+        if run['count'] > 1 or run['last'].year >= last_year:
+            rule = f'RRULE:FREQ=YEARLY;BYMONTH={month};BYDAY={byday}'
+            if run['last'].year < last_year:
+                # A day past the last onset: still long before the next one,
+                # and safe with clients that compare UNTIL to local time.
+                rule += f";UNTIL={run['until'] + timedelta(days=1):%Y%m%dT%H%M%SZ}"
+            lines.append(rule)
+        lines.extend([f'TZNAME:{name}', f'END:{kind}'])
+    lines.append('END:VTIMEZONE')
+    return tuple(lines)
+
+
+def ical_rrule(start, recurrence, until, all_day):
+    """
+    The RRULE for ``recurrence``, matching ``occurrences.expand``: a series
+    on the 29th-31st falls on the month's last day when it is shorter.
+    """
+    rule = [f'FREQ={RRULE_FREQUENCIES[recurrence]}']
+    local_start = timezone.localtime(start)
+    if recurrence in ('monthly', 'yearly') and local_start.day > 28:
+        if recurrence == 'yearly':
+            rule.append(f'BYMONTH={local_start.month}')
+        rule.append('BYMONTHDAY=' + ','.join(str(day) for day in range(28, local_start.day + 1)))
+        rule.append('BYSETPOS=-1')
+    if until:
+        if all_day:
+            rule.append(f'UNTIL={until:%Y%m%d}')
+        else:
+            rule.append(f'UNTIL={ical_utc(timezone.make_aware(datetime.combine(until, time(23, 59, 59))))}')
+    return 'RRULE:' + ';'.join(rule)
+
+
+def ical_event(row):
+    """
+    The VEVENT lines of one ``ICAL_FIELDS`` row.
+    """
+    link = f"{settings.EVENT_FEED_SITE_URL.rstrip('/')}/events/{row['id']}"
+    host = urlsplit(settings.EVENT_FEED_SITE_URL).hostname or 'localhost'
+    start, end, all_day = row['start_datetime'], row['end_datetime'], row['all_day']
+    if all_day:
+        start_date = timezone.localdate(start)
+        local_end = timezone.localtime(end)
+        # DTEND of an all-day event is the (exclusive) day after it ends.
+        end_date = local_end.date() + timedelta(days=0 if local_end.time() == time.min else 1)
+        dtstart = ical_time('DTSTART', start_date, all_day=True)
+        dtend = ical_time('DTEND', max(end_date, start_date + timedelta(days=1)), all_day=True)
+    else:
+        dtstart, dtend = ical_time('DTSTART', start), ical_time('DTEND', end)
+
+    description = strip_tags(row['description']).strip()
+    if row['online_link']:
+        description = f"{description}\n\n{row['online_link']}".strip()
+    location = ', '.join(filter(None, [row['location'], row['address'].strip()]))
+
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:event-{row['id']}@{host}",
+        f"DTSTAMP:{ical_utc(row['updated_at'])}",
+        f"CREATED:{ical_utc(row['created_at'])}",
+        f"LAST-MODIFIED:{ical_utc(row['updated_at'])}",
+        dtstart,
+        dtend,
+    ]
+    if row['recurrence'] in RRULE_FREQUENCIES:
+        lines.append(ical_rrule(start, row['recurrence'], row['recurrence_end_date'], all_day))
+    lines.append(f"SUMMARY:{ical_text(row['title'])}")
+    if description:
+        lines.append(f'DESCRIPTION:{ical_text(description)}')
+    if location:
+        lines.append(f'LOCATION:{ical_text(location)}')
+    if row['category__name']:
+        lines.append(f"CATEGORIES:{ical_text(row['category__name'])}")
+    lines.extend([f'URL:{link}', 'END:VEVENT'])
+    return ''.join(ical_line(line) for line in lines)
+
+
+def ical_channel(scope):
+    """
+    Return ``(name, queryset)`` for a scope (``'all'``, ``'category:3'`` or
+    ``'ministry:5'``), or None if the category or ministry does not exist.
+    """
+    church = ChurchInfo.objects.filter(is_active=True).values_list('name', flat=True).first()
+    church_name = church or ChurchInfo._meta.get_field('name').default
+    cutoff = timezone.now() - timedelta(days=settings.EVENT_ICAL_PAST_DAYS)
+    events = Event.objects.filter(is_published=True).filter(
+        Q(occurs_until__isnull=True) | Q(occurs_until__gte=cutoff)
+    )
+
+    kind, _, pk = scope.partition(':')
+    if kind == 'category':
+        category = EventCategory.objects.filter(pk=pk).values_list('name', flat=True).first()
+        if category is None:
+            return None
+        return f'{church_name}: {category}', events.filter(category_id=pk)
+    if kind == 'ministry':
+        ministry = Ministry.objects.filter(pk=pk).values_list('name', flat=True).first()
+        if ministry is None:
+            return None
+        return f'{church_name}: {ministry}', events.filter(ministry_id=pk)
+    return f'{church_name} Events', events
+
+
+def ical_cache_key(scope, what):
+    # Events age out of the feed daily, so the day is part of the key.
+    return f'events:ical:{occurrences_version()}:{timezone.localdate().isoformat()}:{scope}:{what}'
+
+
+def ical_etag(scope):
+    return f'"{occurrences_version()}-{timezone.localdate():%Y%m%d}-{scope}"'
+
+
+def ical_last_modified(scope):
+    """
+    Last-Modified of a feed, cached: the newest ``updated_at`` in it, but
+    never before the last event change (deletions leave no row behind) or
+    the start of today (events age out daily). Returns
+    ``(found, last_modified)``; ``found`` is False for an unknown scope.
+    """
+    key = ical_cache_key(scope, 'modified')
+    found = cache.get(key)
+    if found is None:
+        channel = ical_channel(scope)
+        if channel is None:
+            found = (False, None)
+        else:
+            newest = channel[1].aggregate(
+                event=Max('updated_at'), category=Max('category__updated_at')
+            )
+            today = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+            changed = max(filter(None, [*newest.values(), today]))
+            found = (True, max(int(changed.timestamp()), occurrences_changed_at()))
+        cache.set(key, found, settings.EVENT_OCCURRENCE_CACHE_TIMEOUT)
+    return found
+
+
+def ical_feed(scope):
+    """
+    Yield the iCalendar document for a scope in chunks. A complete render
+    is cached, so it is only streamed from the database once.
+    """
+    key = ical_cache_key(scope, 'document')
+    document = cache.get(key)
+    if document is not None:
+        yield document
+        return
+
+    channel = ical_channel(scope)
+    if channel is None:
+        return
+    name, events = channel
+    tz_name = timezone.get_current_timezone_name()
+    header = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:-//{urlsplit(settings.EVENT_FEED_SITE_URL).hostname or "localhost"}//Events//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{ical_text(name)}',
+        f'X-WR-TIMEZONE:{tz_name}',
+    ]
+    if not is_utc(tz_name):
+        first = events.aggregate(value=Min('start_datetime'))['value']
+        this_year = timezone.localdate().year
+        first_year = timezone.localtime(first).year if first else this_year
+        header.extend(ical_vtimezone(tz_name, min(first_year, this_year), this_year + 2))
+    chunks = [''.join(ical_line(line) for line in header)]
+    yield chunks[0]
+    rows = events.order_by('start_datetime', 'id').values(*ICAL_FIELDS)
+    for row in rows.iterator(chunk_size=500):
+        chunk = ical_event(row)
+        chunks.append(chunk)
+        yield chunk
+    chunks.append(ical_line('END:VCALENDAR'))
+    yield chunks[-1]
+    cache.set(key, ''.join(chunks), settings.EVENT_OCCURRENCE_CACHE_TIMEOUT)
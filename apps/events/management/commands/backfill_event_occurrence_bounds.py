@@ -0,0 +1,36 @@
+"""
+Backfill Event.occurs_until for existing events.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.events.models import Event
+
+
+class Command(BaseCommand):
+    help = "Recompute the series end bound used to prefilter event occurrences, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        events = Event.objects.order_by('pk').only(
+            'pk', 'start_datetime', 'end_datetime', 'recurrence', 'recurrence_end_date', 'occurs_until'
+        )
+        last_pk = 0
+        checked = changed = 0
+        while True:
+            batch = list(events.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            stale = []
+            for event in batch:
+                occurs_until = event.compute_occurs_until()
+                if event.occurs_until != occurs_until:
+                    event.occurs_until = occurs_until
+                    stale.append(event)
+            Event.objects.bulk_update(stale, ['occurs_until'])
+            checked += len(batch)
+            changed += len(stale)
+            last_pk = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} event(s); updated {changed}."))
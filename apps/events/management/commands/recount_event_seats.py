@@ -0,0 +1,39 @@
+"""
+Resynchronise Event.seats_reserved with the confirmed registrations.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from apps.events.models import Event, EventRegistration
+
+
+class Command(BaseCommand):
+    help = "Recount the seats held by confirmed registrations for every event, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        events = Event.objects.order_by('pk').only('pk', 'seats_reserved')
+        last_pk = 0
+        checked = changed = 0
+        while True:
+            batch = list(events.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            seats = dict(
+                EventRegistration.objects.filter(
+                    event__in=batch, is_confirmed=True
+                ).order_by().values('event').annotate(seats=Sum('number_of_attendees')).values_list('event', 'seats')
+            )
+            stale = []
+            for event in batch:
+                if event.seats_reserved != seats.get(event.pk, 0):
+                    event.seats_reserved = seats.get(event.pk, 0)
+                    stale.append(event)
+            Event.objects.bulk_update(stale, ['seats_reserved'])
+            checked += len(batch)
+            changed += len(stale)
+            last_pk = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} event(s); updated {changed}."))
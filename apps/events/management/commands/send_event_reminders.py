@@ -0,0 +1,49 @@
+"""
+Send due event reminders.
+"""
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from apps.events.reminders import dispatch_due_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Send due event reminders in batches over one mail connection. Safe to run "
+        "several at once (rows are leased with SKIP LOCKED before sending). Without --loop it exits "
+        "once nothing is due, so it can also run from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.EVENT_REMINDER_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep polling for due reminders")
+        parser.add_argument(
+            '--interval', type=float, default=settings.EVENT_REMINDER_POLL_INTERVAL,
+            help="Seconds to wait between polls when nothing is due (with --loop)"
+        )
+
+    def handle(self, *args, **options):
+        totals = [0, 0, 0]
+        connection = get_connection()
+        connection.open()
+        try:
+            while True:
+                counts = dispatch_due_reminders(connection, options['batch_size'])
+                totals = [total + count for total, count in zip(totals, counts)]
+                if sum(counts) - counts[2]:
+                    continue
+                # Nothing claimed (or only failures): wait for more to fall due.
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        sent, skipped, failed = totals
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {sent} reminder(s); skipped {skipped}; {failed} failed send(s)."
+        ))
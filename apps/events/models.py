@@ -1,9 +1,13 @@
 """
 Models for events app.
 """
-from django.db import models
+from datetime import datetime, time
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.utils.crypto import salted_hmac
 from ckeditor.fields import RichTextField
 from apps.core.models import TimeStampedModel, Ministry
 
@@ -25,6 +29,75 @@ class EventCategory(TimeStampedModel):
         return self.name
 
 
+RANGE_FIELDS = {'start_datetime', 'end_datetime', 'recurrence', 'recurrence_end_date'}
+
+
+class EventFull(Exception):
+    """
+    Raised when a registration would exceed the event's ``max_attendees``.
+    """
+
+
+class EventQuerySet(models.QuerySet):
+    def occurring_between(self, start, end):
+        """
+        Events with an occurrence that may overlap ``[start, end)``.
+        
+        A cheap indexed prefilter on the series bounds; use
+        ``apps.events.occurrences`` for the actual occurrences.
+        
+        ``occurs_until > start`` is the selective bound (almost every event
+        starts before ``end``), so the index leads with ``occurs_until``.
+        Open-ended series (``occurs_until`` is NULL) are a separate branch,
+        an ``IS NULL`` range on the same index, rather than an OR on the
+        column that would stop the bound from being used.
+        """
+        return self.filter(
+            models.Q(occurs_until__gt=start, start_datetime__lt=end) |
+            models.Q(occurs_until__isnull=True, start_datetime__lt=end)
+        )
+    
+    def reserve_seats(self, event_id, seats):
+        """
+        Atomically take ``seats`` if the event has room. Returns True on success.
+        
+        A single conditional UPDATE, so concurrent registrations can never
+        push ``seats_reserved`` past ``max_attendees``.
+        """
+        has_room = (
+            models.Q(max_attendees__isnull=True) |
+            models.Q(max_attendees=0) |
+            models.Q(max_attendees__gte=models.F('seats_reserved') + seats)
+        )
+        return bool(self.filter(has_room, pk=event_id).update(seats_reserved=models.F('seats_reserved') + seats))
+    
+    def adjust_seats(self, event_id, seats):
+        """
+        Add (or with a negative number, release) seats without a capacity check.
+        """
+        if seats:
+            self.filter(pk=event_id).update(seats_reserved=Greatest(models.F('seats_reserved') + seats, 0))
+    
+    def with_registration_counts(self):
+        """
+        Annotate ``num_registrations`` (confirmed registrations) and
+        ``num_seats_taken`` (their attendees) so the registration properties
+        need no extra queries. Subqueries keep the default ordering intact.
+        """
+        confirmed = EventRegistration.objects.filter(
+            event=models.OuterRef('pk'),
+            is_confirmed=True
+        ).order_by().values('event')
+        return self.annotate(
+            num_registrations=Coalesce(
+                models.Subquery(confirmed.annotate(total=models.Count('pk')).values('total')), 0
+            ),
+            num_seats_taken=Coalesce(
+                models.Subquery(confirmed.annotate(total=models.Sum('number_of_attendees')).values('total')), 0
+            )
+        )
+
+
 class Event(TimeStampedModel):
     """
     Model for church events.
@@ -54,16 +127,21 @@ class Event(TimeStampedModel):
     
     # Media
     image = models.ImageField(upload_to='events/', blank=True, null=True)
+    derivatives_of = models.CharField(max_length=100, blank=True, editable=False)
     
     # Registration
     requires_registration = models.BooleanField(default=False)
     max_attendees = models.PositiveIntegerField(null=True, blank=True)
     registration_deadline = models.DateTimeField(null=True, blank=True)
     registration_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    # Seats held by confirmed registrations (kept by EventRegistration)
+    seats_reserved = models.PositiveIntegerField(default=0, editable=False)
     
     # Recurrence
     recurrence = models.CharField(max_length=10, choices=RECURRENCE_CHOICES, default='none')
     recurrence_end_date = models.DateField(null=True, blank=True)
+    # When the last occurrence ends; null for open-ended series (kept by save())
+    occurs_until = models.DateTimeField(null=True, blank=True, editable=False)
     
     # Publishing
     is_published = models.BooleanField(default=True)
@@ -74,12 +152,36 @@ class Event(TimeStampedModel):
     contact_email = models.EmailField(blank=True)
     contact_phone = models.CharField(max_length=20, blank=True)
     
+    objects = EventQuerySet.as_manager()
+    
     class Meta:
         ordering = ['start_datetime']
+        indexes = [
+            models.Index(
+                fields=['occurs_until', 'start_datetime'],
+                condition=models.Q(is_published=True),
+                name='event_published_range_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.start_datetime.strftime('%Y-%m-%d %H:%M')}"
     
+    def compute_occurs_until(self):
+        if self.recurrence == 'none':
+            return self.end_datetime
+        if self.recurrence_end_date:
+            last_day = timezone.make_aware(datetime.combine(self.recurrence_end_date, time.max))
+            return last_day + (self.end_datetime - self.start_datetime)
+        return None
+    
+    def save(self, *args, **kwargs):
+        self.occurs_until = self.compute_occurs_until()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and RANGE_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'occurs_until'}
+        super().save(*args, **kwargs)
+    
     @property
     def is_upcoming(self):
         return self.start_datetime > timezone.now()
@@ -95,10 +197,24 @@ class Event(TimeStampedModel):
     
     @property
     def registration_count(self):
+        if hasattr(self, 'num_registrations'):
+            return self.num_registrations
         return self.registrations.filter(is_confirmed=True).count()
     
     @property
-    def is_registration_open(self):
+    def seats_taken(self):
+        if hasattr(self, 'num_seats_taken'):
+            return self.num_seats_taken
+        return self.registrations.filter(is_confirmed=True).aggregate(
+            total=Coalesce(models.Sum('number_of_attendees'), 0)
+        )['total']
+    
+    @property
+    def accepts_registrations(self):
+        """
+        Registration is enabled, before the deadline and the event; capacity
+        is checked when seats are reserved.
+        """
         if not self.requires_registration:
             return False
         
@@ -106,10 +222,13 @@ class Event(TimeStampedModel):
         if self.registration_deadline and now > self.registration_deadline:
             return False
         
-        if self.max_attendees and self.registration_count >= self.max_attendees:
-            return False
-        
         return self.is_upcoming
+    
+    @property
+    def is_registration_open(self):
+        if self.max_attendees and self.seats_reserved >= self.max_attendees:
+            return False
+        return self.accepts_registrations
 
 
 class EventRegistration(TimeStampedModel):
@@ -161,6 +280,49 @@ class EventRegistration(TimeStampedModel):
         if self.user:
             return self.user.get_full_name() or self.user.username
         return f"{self.first_name} {self.last_name}".strip()
+    
+    @property
+    def seats(self):
+        return self.number_of_attendees if self.is_confirmed else 0
+    
+    @staticmethod
+    def check_in_signature(registration_id, event_id):
+        return salted_hmac('events.check-in', f'{registration_id}:{event_id}').hexdigest()[:16]
+    
+    @property
+    def check_in_token(self):
+        """
+        Value encoded in the registration's QR code: ``<id>.<signature>``.
+        """
+        return f'{self.pk}.{self.check_in_signature(self.pk, self.event_id)}'
+    
+    def save(self, *args, enforce_capacity=False, **kwargs):
+        """
+        Save and keep ``Event.seats_reserved`` in step in the same transaction.
+        
+        With ``enforce_capacity`` a new registration raises ``EventFull``
+        instead of overbooking; staff edits are never refused.
+        """
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = EventRegistration.objects.filter(pk=self.pk).values(
+                    'event_id', 'is_confirmed', 'number_of_attendees'
+                ).first()
+            if previous is None:
+                if enforce_capacity and self.seats:
+                    if not Event.objects.reserve_seats(self.event_id, self.seats):
+                        raise EventFull(self.event_id)
+                else:
+                    Event.objects.adjust_seats(self.event_id, self.seats)
+            else:
+                previous_seats = previous['number_of_attendees'] if previous['is_confirmed'] else 0
+                if previous['event_id'] != self.event_id:
+                    Event.objects.adjust_seats(previous['event_id'], -previous_seats)
+                    Event.objects.adjust_seats(self.event_id, self.seats)
+                else:
+                    Event.objects.adjust_seats(self.event_id, self.seats - previous_seats)
+            super().save(*args, **kwargs)
 
 
 class EventAttendance(TimeStampedModel):
@@ -176,12 +338,20 @@ class EventAttendance(TimeStampedModel):
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=20, blank=True)
     
-    # Attendance details
-    check_in_time = models.DateTimeField(auto_now_add=True)
+    # Attendance details (check-in time is the scanning device's clock)
+    check_in_time = models.DateTimeField(default=timezone.now)
     check_out_time = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-check_in_time']
+        constraints = [
+            # One check-in per registration, so re-synced scans are no-ops.
+            models.UniqueConstraint(
+                fields=['event', 'registration'],
+                condition=models.Q(registration__isnull=False),
+                name='event_attendance_registration_unique',
+            ),
+        ]
     
     def __str__(self):
         name = self.name
@@ -200,10 +370,24 @@ class EventReminder(TimeStampedModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     reminder_datetime = models.DateTimeField()
     is_sent = models.BooleanField(default=False)
+    sent_at = models.DateTimeField(null=True, blank=True, editable=False)
+    send_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Set when the last allowed attempt fails; the reminder is never retried.
+    failed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # A dispatcher is sending this reminder until then.
+    claimed_until = models.DateTimeField(null=True, blank=True, editable=False)
     
     class Meta:
         unique_together = ['event', 'user']
         ordering = ['reminder_datetime']
+        indexes = [
+            # Only the pending tail is ever scanned by the dispatcher.
+            models.Index(
+                fields=['reminder_datetime', 'id'],
+                condition=models.Q(is_sent=False, failed_at__isnull=True),
+                name='event_reminder_due_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Reminder for {self.user.username} - {self.event.title}"
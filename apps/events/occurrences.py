@@ -0,0 +1,212 @@
+"""
+Recurring event occurrences for events app.
+
+Occurrences are never stored. They are expanded on demand for one
+calendar month at a time (in the current time zone), from only the events
+whose series bounds can intersect that month. Each expanded month is
+cached. Saving or deleting an event bumps a version number that is part of
+every month key, and records the time of the change for Last-Modified
+headers (a deleted or unpublished event leaves no ``updated_at`` behind).
+"""
+import calendar
+import copy
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from apps.core.cache import bump_version, get_version
+from .models import Event
+
+VERSION_KEY = 'events:occurrences:version'
+CHANGED_KEY = 'events:occurrences:changed'
+
+# recurrence -> (unit, step)
+STEPS = {
+    'daily': ('days', 1),
+    'weekly': ('days', 7),
+    'monthly': ('months', 1),
+    'yearly': ('months', 12),
+}
+
+Occurrence = namedtuple('Occurrence', 'event_id start end')
+
+
+def occurrences_version():
+    return get_version(VERSION_KEY)
+
+
+def bump_occurrences_version():
+    bump_version(VERSION_KEY)
+    cache.set(CHANGED_KEY, int(time.time()), None)
+
+
+def occurrences_changed_at():
+    """
+    When events last changed. An evicted marker is reset to now, which can
+    only make clients refetch once.
+    """
+    return cache.get_or_set(CHANGED_KEY, lambda: int(time.time()), None)
+
+
+def add_months(value, months):
+    """
+    Shift a naive datetime by whole months, clamping the day to the month's
+    length (a series on the 31st falls on the 30th in April).
+    """
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def expand(start, end, recurrence, until, window_start, window_end):
+    """
+    Yield ``(start, end)`` of each occurrence overlapping ``[window_start, window_end)``.
+
+    Recurrences are stepped in local time, so a weekly 09:00 service stays
+    at 09:00 across DST changes. Iteration starts just before the window
+    instead of at the first occurrence.
+    """
+    if recurrence not in STEPS:
+        if start < window_end and end > window_start:
+            yield start, end
+        return
+
+    tz = timezone.get_current_timezone()
+    duration = end - start
+    local_start = timezone.localtime(start, tz).replace(tzinfo=None)
+    first_wanted = timezone.localtime(window_start - duration, tz).replace(tzinfo=None)
+    unit, step = STEPS[recurrence]
+    if unit == 'days':
+        index = (first_wanted - local_start) // timedelta(days=step) - 1
+    else:
+        months = (first_wanted.year - local_start.year) * 12 + first_wanted.month - local_start.month
+        index = months // step - 1
+
+    index = max(index, 0)
+    while True:
+        if unit == 'days':
+            naive = local_start + timedelta(days=step * index)
+        else:
+            naive = add_months(local_start, step * index)
+        if until and naive.date() > until:
+            return
+        occurrence_start = timezone.make_aware(naive, tz)
+        if occurrence_start >= window_end:
+            return
+        if occurrence_start + duration > window_start:
+            yield occurrence_start, occurrence_start + duration
+        index += 1
+
+
+def month_bounds(year, month):
+    start = timezone.make_aware(datetime(year, month, 1))
+    following = datetime(year + month // 12, month % 12 + 1, 1)
+    return start, timezone.make_aware(following)
+
+
+def months_between(start, end):
+    """
+    Yield the ``(year, month)`` buckets covering ``[start, end)`` in local time.
+    """
+    local_start, local_end = timezone.localtime(start), timezone.localtime(end)
+    year, month = local_start.year, local_start.month
+    while (year, month) <= (local_end.year, local_end.month):
+        if month_bounds(year, month)[0] >= end:
+            break
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_occurrences(year, month):
+    """
+    All published occurrences overlapping one month, cached.
+    """
+    key = f'events:occurrences:{occurrences_version()}:{year}-{month:02d}'
+    occurrences = cache.get(key)
+    if occurrences is None:
+        start, end = month_bounds(year, month)
+        rows = Event.objects.filter(is_published=True).occurring_between(start, end).values_list(
+            'id', 'start_datetime', 'end_datetime', 'recurrence', 'recurrence_end_date'
+        )
+        occurrences = sorted(
+            (
+                Occurrence(event_id, occurrence_start, occurrence_end)
+                for event_id, event_start, event_end, recurrence, until in rows
+                for occurrence_start, occurrence_end in expand(event_start, event_end, recurrence, until, start, end)
+            ),
+            key=lambda occurrence: (occurrence.start, occurrence.event_id)
+        )
+        cache.set(key, occurrences, settings.EVENT_OCCURRENCE_CACHE_TIMEOUT)
+    return occurrences
+
+
+def occurrences_between(start, end, event_ids=None):
+    """
+    Published occurrences overlapping ``[start, end)``, in start order.
+    """
+    found = {}
+    for year, month in months_between(start, end):
+        for occurrence in month_occurrences(year, month):
+            if occurrence.start < end and occurrence.end > start:
+                if event_ids is None or occurrence.event_id in event_ids:
+                    found[occurrence.event_id, occurrence.start] = occurrence
+    return sorted(found.values(), key=lambda occurrence: (occurrence.start, occurrence.event_id))
+
+
+def upcoming_occurrences(limit, event_ids=None, now=None):
+    """
+    The next ``limit`` occurrences starting after ``now``. Months are
+    expanded one at a time, up to ``EVENT_UPCOMING_HORIZON_DAYS`` ahead.
+    """
+    now = now or timezone.now()
+    horizon = now + timedelta(days=settings.EVENT_UPCOMING_HORIZON_DAYS)
+    found = {}
+    for year, month in months_between(now, horizon):
+        for occurrence in month_occurrences(year, month):
+            if now < occurrence.start < horizon and (event_ids is None or occurrence.event_id in event_ids):
+                found[occurrence.event_id, occurrence.start] = occurrence
+        if len(found) >= limit:
+            break
+    return sorted(found.values(), key=lambda occurrence: (occurrence.start, occurrence.event_id))[:limit]
+
+
+def occurrence_instances(queryset, occurrences):
+    """
+    Event instances from ``queryset``, one per occurrence, with
+    ``start_datetime``/``end_datetime`` set to the occurrence's.
+    """
+    events = queryset.in_bulk({occurrence.event_id for occurrence in occurrences})
+    instances = []
+    for occurrence in occurrences:
+        event = events.get(occurrence.event_id)
+        if event is None:
+            continue
+        instance = copy.copy(event)
+        instance.start_datetime, instance.end_datetime = occurrence.start, occurrence.end
+        instances.append(instance)
+    return instances
+
+
+def parse_bound(value):
+    """
+    Parse an ISO date or datetime query parameter into an aware datetime.
+    """
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value.replace(' ', '+'))
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                return None
+            parsed = datetime.combine(parsed_date, datetime.min.time())
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
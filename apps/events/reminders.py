@@ -0,0 +1,146 @@
+"""
+Event reminder dispatch for events app.
+
+Workers claim due reminders in batches with ``SELECT ... FOR UPDATE SKIP
+LOCKED``, walking the partial index on pending reminders, and lease them
+to themselves by setting ``claimed_until`` before the claiming transaction
+commits. Mail is sent after that commit, so no row lock is held while
+talking to the mail server, and any number of workers can run at once:
+each one skips rows another worker holds a lease on. A batch is sent over
+one open mail connection and its results are recorded with a few UPDATEs,
+which are written even if the batch is cut short.
+
+A worker that dies mid-batch leaves its lease behind; once it expires the
+batch is claimed again, so delivery is at least once. Reminders that fail
+``EVENT_REMINDER_MAX_ATTEMPTS`` times get ``failed_at`` and are dropped.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import EventReminder
+from .occurrences import expand
+
+
+def next_occurrence(event, now):
+    """
+    ``(start, end)`` of the event's next occurrence starting after ``now``, or None.
+    """
+    horizon = now + timedelta(days=settings.EVENT_UPCOMING_HORIZON_DAYS)
+    occurrences = expand(
+        event.start_datetime, event.end_datetime, event.recurrence, event.recurrence_end_date, now, horizon
+    )
+    return next((occurrence for occurrence in occurrences if occurrence[0] >= now), None)
+
+
+def reminder_message(reminder, start):
+    """
+    The reminder email for the occurrence starting at ``start``.
+    """
+    event = reminder.event
+    user = reminder.user
+    local_start = timezone.localtime(start)
+    when = f'{local_start:%A, %B %d}' if event.all_day else f'{local_start:%A, %B %d at %I:%M %p}'
+    lines = [
+        f'Hello {user.get_full_name() or user.username},',
+        '',
+        f'This is a reminder that {event.title} is coming up on {when}.',
+        '',
+    ]
+    where = [line for line in [event.location, event.address.strip(), event.online_link] if line]
+    if where:
+        lines.extend(where + [''])
+    lines.extend([
+        f"Event details: {settings.EVENT_FEED_SITE_URL.rstrip('/')}/events/{event.pk}",
+        '',
+        'Blessings,',
+        'New Class Royal Ministries',
+    ])
+    return EmailMessage(
+        subject=f'Reminder: {event.title}',
+        body='\n'.join(lines),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+
+
+def claim_due_reminders(batch_size, now):
+    """
+    Lease up to ``batch_size`` due reminders to this worker; returns their ids.
+    """
+    with transaction.atomic():
+        ids = list(
+            EventReminder.objects.select_for_update(skip_locked=True).filter(
+                Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+                is_sent=False,
+                failed_at__isnull=True,
+                reminder_datetime__lte=now
+            ).order_by('reminder_datetime', 'id').values_list('pk', flat=True)[:batch_size]
+        )
+        if ids:
+            EventReminder.objects.filter(pk__in=ids).update(
+                claimed_until=now + timedelta(seconds=settings.EVENT_REMINDER_CLAIM_TIMEOUT)
+            )
+    return ids
+
+
+def record_results(claimed, sent, failed, now):
+    """
+    Mark ``sent`` reminders sent, count an attempt against ``failed`` ones
+    and release the lease on everything ``claimed``.
+    """
+    with transaction.atomic():
+        if sent:
+            EventReminder.objects.filter(pk__in=sent).update(is_sent=True, sent_at=now)
+        if failed:
+            EventReminder.objects.filter(pk__in=failed).update(
+                send_attempts=F('send_attempts') + 1,
+                # Compared against the value before this update.
+                failed_at=Case(
+                    When(send_attempts__gte=settings.EVENT_REMINDER_MAX_ATTEMPTS - 1, then=Value(now)),
+                    default=None
+                )
+            )
+        EventReminder.objects.filter(pk__in=claimed).update(claimed_until=None)
+
+
+def dispatch_due_reminders(connection, batch_size=None, now=None):
+    """
+    Claim, send and mark one batch of due reminders.
+
+    Returns ``(sent, skipped, failed)``. Reminders for events with no
+    occurrence left, or users without an email address, are skipped and
+    marked sent. Failed sends are retried up to
+    ``EVENT_REMINDER_MAX_ATTEMPTS`` times. If the mail connection cannot be
+    reopened the batch stops there: what was sent is still marked, the rest
+    is released for the next run, and the error is raised.
+    """
+    batch_size = batch_size or settings.EVENT_REMINDER_BATCH_SIZE
+    now = now or timezone.now()
+    claimed = claim_due_reminders(batch_size, now)
+    sent, skipped, failed = [], [], []
+    try:
+        reminders = EventReminder.objects.filter(pk__in=claimed).select_related('event', 'user').order_by(
+            'reminder_datetime', 'id'
+        )
+        for reminder in reminders:
+            occurrence = next_occurrence(reminder.event, now)
+            if occurrence is None or not reminder.event.is_published or not reminder.user.email:
+                skipped.append(reminder.pk)
+                continue
+            try:
+                connection.send_messages([reminder_message(reminder, occurrence[0])])
+            except Exception:
+                failed.append(reminder.pk)
+                # Start the next message on a fresh connection.
+                connection.close()
+                connection.open()
+            else:
+                sent.append(reminder.pk)
+    finally:
+        record_results(claimed, sent + skipped, failed, now)
+    return len(sent), len(skipped), len(failed)
@@ -2,8 +2,10 @@
 Serializers for events app.
 """
 from rest_framework import serializers
+from django.conf import settings
 from .models import Event, EventCategory, EventRegistration, EventAttendance
 from apps.core.serializers import MinistrySerializer
+from apps.core.images import ImageVariantsField
 
 
 class EventCategorySerializer(serializers.ModelSerializer):
@@ -21,7 +23,9 @@ class EventSerializer(serializers.ModelSerializer):
     """
     category = EventCategorySerializer(read_only=True)
     ministry = MinistrySerializer(read_only=True)
+    image_variants = ImageVariantsField(source='image')
     registration_count = serializers.ReadOnlyField()
+    seats_taken = serializers.ReadOnlyField()
     is_registration_open = serializers.ReadOnlyField()
     is_upcoming = serializers.ReadOnlyField()
     is_ongoing = serializers.ReadOnlyField()
@@ -32,10 +36,10 @@ class EventSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'description', 'category', 'ministry',
             'start_datetime', 'end_datetime', 'all_day', 'location',
-            'address', 'online_link', 'image', 'requires_registration',
+            'address', 'online_link', 'image', 'image_variants', 'requires_registration',
             'max_attendees', 'registration_deadline', 'registration_fee',
             'is_published', 'is_featured', 'contact_person',
-            'contact_email', 'contact_phone', 'registration_count',
+            'contact_email', 'contact_phone', 'registration_count', 'seats_taken',
             'is_registration_open', 'is_upcoming', 'is_ongoing', 'is_past',
             'created_at', 'updated_at'
         ]
@@ -46,15 +50,17 @@ class EventListSerializer(serializers.ModelSerializer):
     Simplified serializer for event lists.
     """
     category = EventCategorySerializer(read_only=True)
+    image_variants = ImageVariantsField(source='image')
     registration_count = serializers.ReadOnlyField()
+    seats_taken = serializers.ReadOnlyField()
     is_registration_open = serializers.ReadOnlyField()
     
     class Meta:
         model = Event
         fields = [
             'id', 'title', 'description', 'category', 'start_datetime',
-            'end_datetime', 'all_day', 'location', 'image',
-            'requires_registration', 'registration_count',
+            'end_datetime', 'all_day', 'location', 'image', 'image_variants',
+            'requires_registration', 'max_attendees', 'registration_count', 'seats_taken',
             'is_registration_open', 'is_featured'
         ]
 
@@ -83,14 +89,46 @@ class EventRegistrationCreateSerializer(serializers.ModelSerializer):
         model = EventRegistration
         fields = [
             'first_name', 'last_name', 'email', 'phone',
-            'number_of_attendees', 'special_requirements'
+            'number_of_attendees', 'special_requirements', 'check_in_token'
         ]
+        read_only_fields = ['check_in_token']
     
     def validate_email(self, value):
         event_id = self.context['view'].kwargs.get('pk')
         if EventRegistration.objects.filter(event_id=event_id, email=value).exists():
             raise serializers.ValidationError("You have already registered for this event.")
         return value
+    
+    def create(self, validated_data):
+        # Seats are reserved atomically; raises EventFull when none are left.
+        registration = EventRegistration(**validated_data)
+        registration.save(enforce_capacity=True)
+        return registration
+
+
+class CheckInScanSerializer(serializers.Serializer):
+    """
+    One QR scan: a registration id or check-in token, and the device time.
+    """
+    registration = serializers.IntegerField(required=False, min_value=1)
+    token = serializers.CharField(required=False, max_length=64)
+    scanned_at = serializers.DateTimeField(required=False)
+    
+    def validate(self, attrs):
+        if 'registration' not in attrs and 'token' not in attrs:
+            raise serializers.ValidationError("Provide a registration id or a check-in token.")
+        return attrs
+
+
+class CheckInBatchSerializer(serializers.Serializer):
+    """
+    A batch of scans uploaded by a door device.
+    """
+    scans = serializers.ListField(
+        child=CheckInScanSerializer(),
+        allow_empty=False,
+        max_length=settings.EVENT_CHECK_IN_MAX_SCANS
+    )
 
 
 class EventAttendanceSerializer(serializers.ModelSerializer):
@@ -0,0 +1,31 @@
+"""
+Signal handlers for events app.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.core.models import ChurchInfo, Ministry
+from .models import Event, EventCategory, EventRegistration
+from .occurrences import bump_occurrences_version
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=EventCategory)
+@receiver(post_delete, sender=EventCategory)
+@receiver(post_save, sender=Ministry)
+@receiver(post_save, sender=ChurchInfo)
+def invalidate_occurrences(sender, **kwargs):
+    """
+    Drop every cached month of expanded occurrences, calendar entries and
+    iCalendar feeds (which are named after the church and ministry).
+    """
+    bump_occurrences_version()
+
+
+@receiver(post_delete, sender=EventRegistration)
+def release_registration_seats(sender, instance, **kwargs):
+    """
+    Give a deleted registration's seats back to its event.
+    """
+    Event.objects.adjust_seats(instance.event_id, -instance.seats)
@@ -0,0 +1,280 @@
+"""
+Tests for events app.
+"""
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+
+from .models import Event, EventCategory, EventFull, EventRegistration, EventReminder
+from .reminders import dispatch_due_reminders
+
+
+def make_event(**kwargs):
+    category = kwargs.pop('category', None) or EventCategory.objects.create(name='Worship')
+    start = kwargs.pop('start_datetime', None) or timezone.now() + timedelta(days=3)
+    kwargs.setdefault('title', 'Sunday Service')
+    kwargs.setdefault('description', 'Weekly worship.')
+    kwargs.setdefault('end_datetime', start + timedelta(hours=2))
+    return Event.objects.create(category=category, start_datetime=start, **kwargs)
+
+
+class EventCalendarTests(TestCase):
+    """
+    Deleting or unpublishing an event invalidates conditional calendar polls.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.event = make_event()
+        self.kept = make_event(title='Prayer Meeting', category=self.event.category)
+        start = timezone.localdate()
+        self.url = reverse('event-calendar') + f'?start={start}&end={start + timedelta(days=14)}'
+
+    def test_removed_event_moves_etag_and_last_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(len(first.data), 2)
+        later = parse_http_date(first['Last-Modified']) + 60
+        with mock.patch('apps.events.occurrences.time.time', return_value=later):
+            self.event.delete()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(parse_http_date(response['Last-Modified']), int(later))
+        self.assertEqual([event['id'] for event in response.data], [self.kept.pk])
+
+    def test_unchanged_calendar_is_not_modified(self):
+        first = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+class EventIcalTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def get_calendar(self):
+        response = self.client.get(reverse('event-ical'))
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_local_times_come_with_their_vtimezone(self):
+        make_event(recurrence='weekly')
+        content = self.get_calendar()
+        self.assertIn('BEGIN:VTIMEZONE\r\nTZID:America/New_York\r\n', content)
+        self.assertIn('TZOFFSETFROM:-0500\r\nTZOFFSETTO:-0400\r\nRRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU\r\n', content)
+        self.assertIn('TZOFFSETFROM:-0400\r\nTZOFFSETTO:-0500\r\nRRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU\r\n', content)
+        self.assertIn('DTSTART;TZID=America/New_York:', content)
+        self.assertLess(content.index('END:VTIMEZONE'), content.index('BEGIN:VEVENT'))
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_utc_sites_write_utc_times(self):
+        make_event()
+        content = self.get_calendar()
+        self.assertNotIn('VTIMEZONE', content)
+        self.assertNotIn('TZID=', content)
+
+    def test_deleted_event_moves_last_modified(self):
+        event = make_event()
+        first = self.client.get(reverse('event-ical'))
+        later = parse_http_date(first['Last-Modified']) + 60
+        with mock.patch('apps.events.occurrences.time.time', return_value=later):
+            event.delete()
+        response = self.client.get(reverse('event-ical'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(parse_http_date(response['Last-Modified']), int(later))
+
+
+class EventSeatTests(TestCase):
+    """
+    ``Event.seats_reserved`` follows the attendees of confirmed registrations.
+    """
+
+    def setUp(self):
+        self.event = make_event(requires_registration=True, max_attendees=10)
+
+    def seats(self, event=None):
+        event = event or self.event
+        event.refresh_from_db()
+        return event.seats_reserved
+
+    def test_confirm_and_unconfirm(self):
+        registration = EventRegistration.objects.create(
+            event=self.event, email='guest@example.com', number_of_attendees=2, is_confirmed=False
+        )
+        self.assertEqual(self.seats(), 0)
+        registration.is_confirmed = True
+        registration.save()
+        self.assertEqual(self.seats(), 2)
+        registration.is_confirmed = False
+        registration.save()
+        self.assertEqual(self.seats(), 0)
+
+    def test_attendee_count_change(self):
+        registration = EventRegistration.objects.create(event=self.event, email='guest@example.com', number_of_attendees=2)
+        registration.number_of_attendees = 5
+        registration.save()
+        self.assertEqual(self.seats(), 5)
+        registration.number_of_attendees = 1
+        registration.save()
+        self.assertEqual(self.seats(), 1)
+
+    def test_move_and_delete(self):
+        other = make_event(category=self.event.category)
+        registration = EventRegistration.objects.create(event=self.event, email='guest@example.com', number_of_attendees=3)
+        registration.event = other
+        registration.save()
+        self.assertEqual((self.seats(), self.seats(other)), (0, 3))
+        registration.delete()
+        self.assertEqual(self.seats(other), 0)
+
+    def test_full_event_refuses_new_registrations(self):
+        EventRegistration.objects.create(event=self.event, email='group@example.com', number_of_attendees=9)
+        with self.assertRaises(EventFull):
+            EventRegistration(event=self.event, email='late@example.com', number_of_attendees=2).save(enforce_capacity=True)
+        self.assertFalse(EventRegistration.objects.filter(email='late@example.com').exists())
+        self.assertEqual(self.seats(), 9)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs a database with concurrent writers')
+class EventOversellTests(TransactionTestCase):
+    """
+    Concurrent registrations for an event one seat from full: exactly one
+    gets the seat.
+    """
+    threads = 8
+
+    def setUp(self):
+        self.event = make_event(requires_registration=True, max_attendees=5)
+        EventRegistration.objects.create(event=self.event, email='group@example.com', number_of_attendees=4)
+
+    def race(self, attempt):
+        start = threading.Barrier(self.threads)
+        results = []
+
+        def worker(n):
+            start.wait()
+            try:
+                results.append(attempt(n))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.event.refresh_from_db()
+        return results
+
+    def test_registrations_take_the_last_seat_once(self):
+        def register(n):
+            try:
+                EventRegistration(event_id=self.event.pk, email=f'guest{n}@example.com').save(enforce_capacity=True)
+            except EventFull:
+                return False
+            return True
+
+        self.assertEqual(self.race(register).count(True), 1)
+        self.assertEqual(self.event.seats_reserved, 5)
+        self.assertEqual(EventRegistration.objects.filter(event=self.event).count(), 2)
+
+    def test_reserve_seats_takes_the_last_seat_once(self):
+        results = self.race(lambda n: Event.objects.reserve_seats(self.event.pk, 1))
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(self.event.seats_reserved, 5)
+
+
+class EventCheckInTests(TestCase):
+    """
+    Rejected scans are reported the way the device submitted them.
+    """
+
+    def test_invalid_scans_echo_what_was_submitted(self):
+        event = make_event(requires_registration=True)
+        other = make_event(category=event.category, requires_registration=True)
+        registration = EventRegistration.objects.create(event=event, email='guest@example.com')
+        elsewhere = EventRegistration.objects.create(event=other, email='guest@example.com')
+        forged = f'{registration.pk}.0000000000000000'
+        self.client.force_login(get_user_model().objects.create_superuser('door', 'door@example.com', 'pw'))
+
+        response = self.client.post(
+            reverse('event-check-in', kwargs={'pk': event.pk}),
+            {'scans': [
+                {'token': registration.check_in_token},
+                {'token': forged},
+                {'registration': elsewhere.pk},
+                {'registration': elsewhere.pk},
+            ]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['checked_in'], 1)
+        self.assertEqual(response.data['invalid'], [
+            {'token': forged, 'reason': 'invalid_token'},
+            {'registration': elsewhere.pk, 'reason': 'not_registered'},
+        ])
+
+
+@override_settings(EVENT_REMINDER_MAX_ATTEMPTS=2)
+class EventReminderDispatchTests(TestCase):
+    """
+    Reminders are leased before sending and their results always recorded.
+    """
+
+    def setUp(self):
+        event = make_event(start_datetime=timezone.now() + timedelta(days=1))
+        self.reminders = [
+            EventReminder.objects.create(
+                event=event,
+                user=get_user_model().objects.create_user(f'member{i}', f'member{i}@example.com'),
+                reminder_datetime=timezone.now() - timedelta(minutes=1),
+            )
+            for i in range(3)
+        ]
+
+    def test_sent_marks_survive_a_failed_reconnect(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [1, OSError('reset')]
+        connection.open.side_effect = OSError('refused')
+        with self.assertRaises(OSError):
+            dispatch_due_reminders(connection)
+        first, second, third = (EventReminder.objects.get(pk=reminder.pk) for reminder in self.reminders)
+        self.assertTrue(first.is_sent)
+        self.assertEqual((second.is_sent, second.send_attempts), (False, 1))
+        self.assertEqual((third.is_sent, third.send_attempts), (False, 0))
+        self.assertFalse(EventReminder.objects.filter(claimed_until__isnull=False).exists())
+
+        # The next run only sends what is left.
+        connection = mock.Mock()
+        self.assertEqual(dispatch_due_reminders(connection), (2, 0, 0))
+        self.assertEqual(connection.send_messages.call_count, 2)
+
+    def test_leased_reminders_are_not_claimed_again(self):
+        EventReminder.objects.filter(pk=self.reminders[0].pk).update(
+            claimed_until=timezone.now() + timedelta(minutes=5)
+        )
+        self.assertEqual(dispatch_due_reminders(mock.Mock()), (2, 0, 0))
+        self.assertFalse(EventReminder.objects.get(pk=self.reminders[0].pk).is_sent)
+
+    def test_reminders_fail_for_good_after_max_attempts(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = OSError('rejected')
+        self.assertEqual(dispatch_due_reminders(connection), (0, 0, 3))
+        self.assertFalse(EventReminder.objects.filter(failed_at__isnull=False).exists())
+        self.assertEqual(dispatch_due_reminders(connection), (0, 0, 3))
+        self.assertEqual(EventReminder.objects.filter(failed_at__isnull=False, send_attempts=2).count(), 3)
+        self.assertEqual(dispatch_due_reminders(connection), (0, 0, 0))
@@ -7,6 +7,10 @@ urlpatterns = [
     path('upcoming/', views.UpcomingEventsView.as_view(), name='upcoming-events'),
     path('featured/', views.FeaturedEventsView.as_view(), name='featured-events'),
     path('<int:pk>/register/', views.EventRegistrationView.as_view(), name='event-register'),
+    path('<int:pk>/check-in/', views.EventCheckInView.as_view(), name='event-check-in'),
     path('categories/', views.EventCategoryListView.as_view(), name='event-categories'),
-    path('calendar/', views.EventCalendarView.as_view(), name='event-calendar'),
+    path('calendar/', views.event_calendar, name='event-calendar'),
+    path('calendar.ics', views.event_ical, name='event-ical'),
+    path('categories/<int:category_id>/calendar.ics', views.event_ical, name='event-category-ical'),
+    path('ministries/<int:ministry_id>/calendar.ics', views.event_ical, name='event-ministry-ical'),
 ]
@@ -3,16 +3,30 @@ Views for events app.
 """
 from rest_framework import generics, status, filters
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from django.utils import timezone
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.db import IntegrityError
 from django.db.models import Q
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Event, EventCategory, EventRegistration
+from apps.core.pagination import ArchivePagination
+
+from .checkin import record_check_ins
+from .models import Event, EventCategory, EventFull, EventRegistration
+from .feeds import (
+    InvalidWindow, calendar_etag, calendar_events, check_window, ical_etag, ical_feed,
+    ical_last_modified,
+)
+from .occurrences import occurrence_instances, parse_bound, upcoming_occurrences
 from .serializers import (
     EventSerializer, EventListSerializer, EventCategorySerializer,
-    EventRegistrationSerializer, EventRegistrationCreateSerializer
+    EventRegistrationSerializer, EventRegistrationCreateSerializer, CheckInBatchSerializer
 )
 
 
@@ -27,27 +41,33 @@ class EventListView(generics.ListAPIView):
     search_fields = ['title', 'description', 'location']
     ordering_fields = ['start_datetime', 'created_at']
     ordering = ['start_datetime']
+    pagination_class = ArchivePagination
+    cursor_ordering = ['start_datetime', 'id']
     
     def get_queryset(self):
         queryset = Event.objects.filter(is_published=True)
         
-        # Filter by date range
-        start_date = self.request.query_params.get('start_date')
-        end_date = self.request.query_params.get('end_date')
+        # Filter by date range (recurring events match if the series may occur in it)
+        start_date = parse_bound(self.request.query_params.get('start_date'))
+        end_date = parse_bound(self.request.query_params.get('end_date'))
         
-        if start_date:
-            queryset = queryset.filter(start_datetime__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(end_datetime__lte=end_date)
+        if start_date and end_date:
+            queryset = queryset.occurring_between(start_date, end_date)
+        elif start_date:
+            queryset = queryset.filter(Q(occurs_until__gt=start_date) | Q(occurs_until__isnull=True))
+        elif end_date:
+            queryset = queryset.filter(start_datetime__lt=end_date)
         
-        return queryset.select_related('category', 'ministry')
+        return queryset.select_related('category', 'ministry').with_registration_counts()
 
 
 class EventDetailView(generics.RetrieveAPIView):
     """
     Get event details.
     """
-    queryset = Event.objects.filter(is_published=True)
+    queryset = Event.objects.filter(is_published=True).select_related(
+        'category', 'ministry'
+    ).with_registration_counts()
     serializer_class = EventSerializer
     permission_classes = [AllowAny]
 
@@ -60,10 +80,12 @@ class UpcomingEventsView(generics.ListAPIView):
     permission_classes = [AllowAny]
     
     def get_queryset(self):
-        return Event.objects.filter(
-            is_published=True,
-            start_datetime__gt=timezone.now()
-        ).select_related('category', 'ministry')[:10]
+        return occurrence_instances(
+            Event.objects.filter(is_published=True).select_related(
+                'category', 'ministry'
+            ).with_registration_counts(),
+            upcoming_occurrences(10)
+        )
 
 
 class FeaturedEventsView(generics.ListAPIView):
@@ -74,11 +96,12 @@ class FeaturedEventsView(generics.ListAPIView):
     permission_classes = [AllowAny]
     
     def get_queryset(self):
-        return Event.objects.filter(
-            is_published=True,
-            is_featured=True,
-            start_datetime__gt=timezone.now()
-        ).select_related('category', 'ministry')[:5]
+        featured = Event.objects.filter(is_published=True, is_featured=True)
+        event_ids = set(featured.values_list('id', flat=True))
+        return occurrence_instances(
+            featured.select_related('category', 'ministry').with_registration_counts(),
+            upcoming_occurrences(5, event_ids=event_ids)
+        )
 
 
 class EventCategoryListView(generics.ListAPIView):
@@ -98,61 +121,92 @@ class EventRegistrationView(generics.CreateAPIView):
     permission_classes = [AllowAny]
     
     def perform_create(self, serializer):
-        event_id = self.kwargs['pk']
-        try:
-            event = Event.objects.get(id=event_id, is_published=True)
-        except Event.DoesNotExist:
-            return Response(
-                {'error': 'Event not found'}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
-        if not event.is_registration_open:
-            return Response(
-                {'error': 'Registration is not open for this event'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        event = get_object_or_404(Event, id=self.kwargs['pk'], is_published=True)
+        if not event.accepts_registrations:
+            raise ValidationError({'error': 'Registration is not open for this event'})
         
         # Set the user if authenticated
         user = self.request.user if self.request.user.is_authenticated else None
-        serializer.save(event=event, user=user)
+        try:
+            serializer.save(event=event, user=user)
+        except EventFull:
+            raise ValidationError({'error': 'This event is full.'})
+        except IntegrityError:
+            # Lost a race with a duplicate submission; its seats were rolled back.
+            raise ValidationError({'email': ['You have already registered for this event.']})
+
+
+class EventCheckInView(generics.GenericAPIView):
+    """
+    Sync a batch of QR check-in scans from a door device.
+    
+    Safe to retry: registrations already checked in are reported, not
+    duplicated. Returns the attended state of every scanned registration.
+    """
+    serializer_class = CheckInBatchSerializer
+    permission_classes = [IsAdminUser]
+    
+    def post(self, request, pk):
+        event = get_object_or_404(Event, pk=pk)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(record_check_ins(event, serializer.validated_data['scans']))
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def event_calendar(request):
     """
-    Get events in calendar format.
+    Get event occurrences in FullCalendar format for a bounded window.
+    
+    ``start`` and ``end`` are required. Responses carry ETag and
+    Last-Modified; a matching ``If-None-Match`` is answered with 304
+    before any event data is loaded.
     """
-    start_date = request.query_params.get('start')
-    end_date = request.query_params.get('end')
+    start = parse_bound(request.query_params.get('start'))
+    end = parse_bound(request.query_params.get('end'))
+    try:
+        check_window(start, end)
+    except InvalidWindow as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
     
-    queryset = Event.objects.filter(is_published=True)
+    etag = calendar_etag(start, end)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        events, last_modified = calendar_events(start, end)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(events)
+        response['Last-Modified'] = http_date(last_modified)
+    response['ETag'] = etag
+    return response
+
+
+@require_safe
+def event_ical(request, category_id=None, ministry_id=None):
+    """
+    iCalendar subscription of published events, optionally limited to one
+    category or ministry. Recurring events are sent as RRULEs.
     
-    if start_date:
-        queryset = queryset.filter(start_datetime__gte=start_date)
-    if end_date:
-        queryset = queryset.filter(end_datetime__lte=end_date)
+    Streamed on a cache miss; polls with a matching ETag or
+    If-Modified-Since get a 304.
+    """
+    if category_id is not None:
+        scope = f'category:{category_id}'
+    elif ministry_id is not None:
+        scope = f'ministry:{ministry_id}'
+    else:
+        scope = 'all'
     
-    events = []
-    for event in queryset:
-        events.append({
-            'id': event.id,
-            'title': event.title,
-            'start': event.start_datetime.isoformat(),
-            'end': event.end_datetime.isoformat(),
-            'allDay': event.all_day,
-            'color': event.category.color if event.category else '#3B82F6',
-            'url': f'/events/{event.id}',
-            'extendedProps': {
-                'location': event.location,
-                'category': event.category.name if event.category else '',
-                'requiresRegistration': event.requires_registration,
-            }
-        })
+    etag = ical_etag(scope)
+    found, last_modified = ical_last_modified(scope)
+    if not found:
+        raise Http404("No such calendar")
     
-    return Response(events)
-
-
-# Add this to urls.py
-EventCalendarView = event_calendar
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = StreamingHttpResponse(ical_feed(scope), content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="calendar.ics"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
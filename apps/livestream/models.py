@@ -53,6 +53,7 @@ class LiveStream(TimeStampedModel):
     
     # Thumbnail and media
     thumbnail = models.ImageField(upload_to='livestreams/', blank=True, null=True)
+    derivatives_of = models.CharField(max_length=100, blank=True, editable=False)
     
     class Meta:
         ordering = ['-scheduled_start']
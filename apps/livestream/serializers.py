@@ -3,6 +3,7 @@ Serializers for livestream app.
 """
 from rest_framework import serializers
 from .models import LiveStream, StreamViewer, StreamComment
+from apps.core.images import ImageVariantsField
 
 
 class LiveStreamSerializer(serializers.ModelSerializer):
@@ -14,6 +15,7 @@ class LiveStreamSerializer(serializers.ModelSerializer):
     is_live = serializers.ReadOnlyField()
     is_upcoming = serializers.ReadOnlyField()
     primary_stream_url = serializers.ReadOnlyField()
+    thumbnail_variants = ImageVariantsField(source='thumbnail')
     
     class Meta:
         model = LiveStream
@@ -22,7 +24,7 @@ class LiveStreamSerializer(serializers.ModelSerializer):
             'youtube_url', 'facebook_url', 'zoom_url', 'other_platform_url',
             'scheduled_start', 'scheduled_end', 'actual_start', 'actual_end',
             'status', 'status_display', 'is_featured', 'is_public',
-            'viewer_count', 'max_viewers', 'thumbnail', 'is_live', 
+            'viewer_count', 'max_viewers', 'thumbnail', 'thumbnail_variants', 'is_live', 
             'is_upcoming', 'primary_stream_url', 'created_at'
         ]
 
@@ -36,13 +38,14 @@ class LiveStreamListSerializer(serializers.ModelSerializer):
     is_live = serializers.ReadOnlyField()
     is_upcoming = serializers.ReadOnlyField()
     primary_stream_url = serializers.ReadOnlyField()
+    thumbnail_variants = ImageVariantsField(source='thumbnail')
     
     class Meta:
         model = LiveStream
         fields = [
             'id', 'title', 'description', 'stream_type', 'stream_type_display',
             'scheduled_start', 'status', 'status_display', 'is_featured',
-            'viewer_count', 'thumbnail', 'is_live', 'is_upcoming', 
+            'viewer_count', 'thumbnail', 'thumbnail_variants', 'is_live', 'is_upcoming', 
             'primary_stream_url'
         ]
 
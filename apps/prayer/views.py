@@ -8,6 +8,8 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 
+from apps.core.pagination import ArchivePagination
+
 from .models import PrayerRequest, Prayer, PrayerCategory
 from .serializers import (
     PrayerRequestSerializer, PrayerRequestListSerializer, PrayerRequestCreateSerializer,
@@ -26,6 +28,8 @@ class PrayerRequestListView(generics.ListAPIView):
     search_fields = ['title', 'request_text']
     ordering_fields = ['created_at', 'urgency', 'prayer_count']
     ordering = ['-urgency', '-created_at']
+    pagination_class = ArchivePagination
+    cursor_ordering = ['-created_at', '-id']
     
     def get_queryset(self):
         return PrayerRequest.objects.filter(
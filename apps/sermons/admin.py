@@ -2,6 +2,7 @@
 Admin configuration for sermons app.
 """
 from django.contrib import admin
+from django.db.models import Count
 from .models import SermonSeries, Sermon, SermonComment, SermonPlaylist, PlaylistItem, SermonDownload
 
 
@@ -12,6 +13,14 @@ class SermonSeriesAdmin(admin.ModelAdmin):
     search_fields = ['title', 'description']
     ordering = ['-start_date']
     readonly_fields = ['sermon_count']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_sermon_count()
+    
+    def sermon_count(self, obj):
+        return obj.sermon_count
+    sermon_count.short_description = "Sermon count"
+    sermon_count.admin_order_field = 'num_sermons'
 
 
 @admin.register(Sermon)
@@ -79,9 +88,15 @@ class SermonPlaylistAdmin(admin.ModelAdmin):
     inlines = [PlaylistItemInline]
     readonly_fields = ['sermons_count']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('created_by').annotate(
+            num_sermons=Count('playlistitem')
+        )
+    
     def sermons_count(self, obj):
-        return obj.sermons.count()
+        return obj.num_sermons
     sermons_count.short_description = "Number of Sermons"
+    sermons_count.admin_order_field = 'num_sermons'
 
 
 @admin.register(SermonDownload)
@@ -5,3 +5,6 @@ class SermonsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.sermons'
     verbose_name = 'Sermons'
+
+    def ready(self):
+        from . import signals  # noqa: F401
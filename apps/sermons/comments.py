@@ -0,0 +1,22 @@
+"""
+Threaded comment loading for sermons app.
+"""
+from collections import defaultdict
+
+from .models import SermonComment
+
+
+def load_reply_map(sermon_id):
+    """
+    Fetch every approved reply on a sermon in one query and group them by
+    parent id, in display order.
+    """
+    replies = defaultdict(list)
+    queryset = SermonComment.objects.filter(
+        sermon_id=sermon_id,
+        is_approved=True,
+        parent__isnull=False
+    ).select_related('user').order_by('created_at', 'id')
+    for comment in queryset:
+        replies[comment.parent_id].append(comment)
+    return replies
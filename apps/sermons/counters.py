@@ -0,0 +1,372 @@
+"""
+Write-behind counters for sermons app.
+
+Hot counters are buffered and written back periodically in batches, so
+that concurrent requests never contend on the same row. View counts are
+buffered in the shared cache, where they survive the worker that took
+them; download events are queued in process memory and flushed by each
+worker on its timer and at exit.
+"""
+import atexit
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_ipv46_address
+from django.db import DataError, IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer(ABC):
+    """
+    Base class for thread-safe write-behind buffers flushed on a
+    background timer.
+
+    Subclasses implement ``_take`` (swap out the pending batch), ``_restore``
+    (put a failed batch back) and ``_write`` (persist a batch).
+    """
+    interval_setting = None
+    default_interval = 30
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def interval(self):
+        return getattr(settings, self.interval_setting, self.default_interval)
+
+    def flush(self):
+        """
+        Write all pending data to the database.
+
+        Data that fails to write is put back into the buffer so it is
+        retried on the next flush.
+        """
+        with self._lock:
+            batch = self._take()
+        if not batch:
+            return 0
+        try:
+            return self._write(batch)
+        except Exception:
+            with self._lock:
+                self._restore(batch)
+            raise
+
+    @abstractmethod
+    def _take(self):
+        """
+        Swap out and return the pending batch. Called with the lock held.
+        """
+
+    @abstractmethod
+    def _restore(self, batch):
+        """
+        Put a batch that failed to write back. Called with the lock held.
+        """
+
+    @abstractmethod
+    def _write(self, batch):
+        """
+        Persist a batch and return the number of items written. Exceptions
+        mean the whole batch can be retried (e.g. the database is down).
+        """
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # Forked child: the parent's timer thread does not exist here.
+                self._stop = threading.Event()
+                self._wake = threading.Event()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush %s buffer', self.name)
+            finally:
+                connections.close_all()
+
+    def shutdown(self):
+        """
+        Stop the background timer and flush whatever is left.
+        """
+        self._stop.set()
+        self._wake.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush %s buffer on shutdown', self.name)
+
+
+def add_to_counter(key, amount, timeout):
+    """
+    Add ``amount`` to the integer at ``key`` in the shared cache, creating
+    it if missing. Returns ``(value, created)``.
+    """
+    try:
+        return cache.incr(key, amount), False
+    except ValueError:
+        if cache.add(key, amount, timeout):
+            return amount, True
+        return cache.incr(key, amount), False
+
+
+class SermonViewCounter(WriteBehindBuffer):
+    """
+    ``Sermon.view_count`` increments, kept in the shared cache as one
+    counter per sermon and day and drained into ``Sermon.view_count`` and
+    that day's ``SermonDailyViews`` bucket.
+
+    The counters outlive the process that took the view, so a worker that
+    is killed loses nothing, and any process can drain them: each web
+    worker on its timer, and ``flush_sermon_counters`` from cron or on
+    deploy. The first view of a sermon on a day also appends the sermon to
+    the day's index, which is what a drain walks. Drains take a short lock
+    in the cache while they claim counts, so two never claim the same ones.
+    """
+    interval_setting = 'SERMON_VIEW_COUNT_FLUSH_INTERVAL'
+    prefix = 'sermon-views'
+    # Days of counters a drain looks at; older ones expire undrained.
+    retain_days = 7
+    lock_timeout = 60
+
+    def __init__(self):
+        super().__init__('sermons.Sermon.view_count')
+
+    @property
+    def timeout(self):
+        return self.retain_days * 24 * 60 * 60
+
+    def _count_key(self, day, pk):
+        return f'{self.prefix}:{day:%Y%m%d}:{pk}'
+
+    def _index_key(self, day):
+        return f'{self.prefix}:{day:%Y%m%d}:index'
+
+    def _days(self):
+        today = timezone.localdate()
+        return [today - timedelta(days=days) for days in range(self.retain_days)]
+
+    def increment(self, pk, amount=1):
+        """
+        Count a view of the given sermon today.
+
+        With an interval of 0 the view is written through immediately.
+        """
+        day = timezone.localdate()
+        if self.interval <= 0:
+            self._write({(pk, day): amount})
+            return
+        self._add(pk, day, amount)
+        self._ensure_worker()
+
+    def _add(self, pk, day, amount):
+        _, created = add_to_counter(self._count_key(day, pk), amount, self.timeout)
+        if created:
+            slot, _ = add_to_counter(self._index_key(day), 1, self.timeout)
+            cache.set(f'{self._index_key(day)}:{slot}', pk, self.timeout)
+
+    def pending(self, pk):
+        """
+        Return the number of views not yet written for ``pk``.
+        """
+        return sum(cache.get_many([self._count_key(day, pk) for day in self._days()]).values())
+
+    def _take(self):
+        if not cache.add(f'{self.prefix}:lock', 1, self.lock_timeout):
+            return {}  # Another process is claiming counts right now
+        try:
+            keys = {}
+            for day in self._days():
+                length = cache.get(self._index_key(day))
+                if not length:
+                    continue
+                slots = cache.get_many([f'{self._index_key(day)}:{slot}' for slot in range(1, length + 1)])
+                for pk in set(slots.values()):
+                    keys[self._count_key(day, pk)] = (pk, day)
+            batch = {}
+            for key, count in cache.get_many(list(keys)).items():
+                if count <= 0:
+                    continue
+                try:
+                    cache.decr(key, count)
+                except ValueError:
+                    pass  # Expired since it was read; the count is ours either way
+                batch[keys[key]] = count
+            return batch
+        finally:
+            cache.delete(f'{self.prefix}:lock')
+
+    def _restore(self, batch):
+        for (pk, day), count in batch.items():
+            self._add(pk, day, count)
+
+    def _write(self, batch):
+        from .models import Sermon, SermonDailyViews
+
+        days = defaultdict(dict)
+        for (pk, day), count in batch.items():
+            days[pk][day] = count
+        with transaction.atomic():
+            # Ordered by pk so concurrent flushers lock rows in the same order.
+            for pk in sorted(days):
+                total = sum(days[pk].values())
+                if not Sermon.objects.filter(pk=pk).update(view_count=F('view_count') + total):
+                    continue  # Sermon deleted since the view was counted
+                for day, views in sorted(days[pk].items()):
+                    bucket = SermonDailyViews.objects.filter(sermon_id=pk, date=day)
+                    if bucket.update(views=F('views') + views):
+                        continue
+                    try:
+                        with transaction.atomic():
+                            SermonDailyViews.objects.create(sermon_id=pk, date=day, views=views)
+                    except IntegrityError:
+                        # Another flusher created the bucket first.
+                        bucket.update(views=F('views') + views)
+        return len(days)
+
+
+class DownloadQueue(WriteBehindBuffer):
+    """
+    Queue of sermon download events.
+
+    Each flush inserts the queued ``SermonDownload`` rows with one
+    ``bulk_create`` and bumps ``Sermon.download_count`` with one aggregated
+    ``F()`` update per sermon. Events for sermons that do not exist or are
+    not published are dropped at flush time, as are events with an invalid
+    IP address; users deleted since are recorded as anonymous. If the batch
+    is still rejected, its rows are retried one by one and rows the database
+    refuses are logged and dropped, so one bad event cannot block the queue.
+    ``created_at`` records the flush time, which trails the download by at
+    most one interval.
+    """
+    interval_setting = 'SERMON_DOWNLOAD_FLUSH_INTERVAL'
+    max_pending_setting = 'SERMON_DOWNLOAD_MAX_PENDING'
+    max_buffered_setting = 'SERMON_DOWNLOAD_MAX_BUFFERED'
+
+    def __init__(self):
+        super().__init__('sermons.SermonDownload')
+        self._pending = []
+
+    @property
+    def max_pending(self):
+        return getattr(settings, self.max_pending_setting, 500)
+
+    @property
+    def max_buffered(self):
+        return getattr(settings, self.max_buffered_setting, 50000)
+
+    def enqueue(self, sermon_id, ip_address, file_type, user_id=None):
+        """
+        Queue a download event without touching the database.
+        """
+        event = {
+            'sermon_id': sermon_id,
+            'user_id': user_id,
+            'ip_address': ip_address,
+            'file_type': file_type,
+        }
+        if self.interval <= 0:
+            self._write([event])
+            return
+        with self._lock:
+            self._pending.append(event)
+            full = len(self._pending) >= self.max_pending
+        self._ensure_worker()
+        if full:
+            self._wake.set()
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _restore(self, batch):
+        self._pending[:0] = batch
+        overflow = len(self._pending) - self.max_buffered
+        if overflow > 0:
+            # The database has been unavailable for a long time; keep the newest events.
+            del self._pending[:overflow]
+            logger.error('Dropped %d queued sermon download(s): buffer full', overflow)
+
+    def _write(self, batch):
+        from .models import Sermon, SermonDownload
+
+        sermon_ids = {event['sermon_id'] for event in batch}
+        published = set(
+            Sermon.objects.filter(pk__in=sermon_ids, is_published=True).values_list('pk', flat=True)
+        )
+        user_ids = {event['user_id'] for event in batch if event['user_id'] is not None}
+        users = set(get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        downloads = []
+        for event in batch:
+            if event['sermon_id'] not in published:
+                continue
+            try:
+                validate_ipv46_address(event['ip_address'])
+            except ValidationError:
+                logger.warning('Dropped sermon download with invalid IP address %r', event['ip_address'])
+                continue
+            downloads.append(SermonDownload(
+                sermon_id=event['sermon_id'],
+                user_id=event['user_id'] if event['user_id'] in users else None,
+                ip_address=event['ip_address'],
+                file_type=event['file_type'],
+            ))
+
+        try:
+            return self._insert(downloads)
+        except (DataError, IntegrityError):
+            logger.warning('Batch of %d sermon download(s) rejected; retrying row by row', len(downloads))
+        written = 0
+        for download in downloads:
+            try:
+                written += self._insert([download])
+            except (DataError, IntegrityError):
+                logger.exception('Dropped sermon download for sermon %s', download.sermon_id)
+        return written
+
+    def _insert(self, downloads):
+        from .models import Sermon, SermonDownload
+
+        counts = Counter(download.sermon_id for download in downloads)
+        with transaction.atomic():
+            SermonDownload.objects.bulk_create(downloads)
+            for sermon_id in sorted(counts):
+                Sermon.objects.filter(pk=sermon_id).update(
+                    download_count=F('download_count') + counts[sermon_id]
+                )
+        return len(downloads)
+
+
+sermon_views = SermonViewCounter()
+sermon_downloads = DownloadQueue()
+
+atexit.register(sermon_views.shutdown)
+atexit.register(sermon_downloads.shutdown)
@@ -0,0 +1,100 @@
+"""
+Facet counts for sermon browsing.
+
+Tag, preacher, series and year counts are computed for a ``SermonFilter``
+result with one grouped aggregate query each, and cached per normalized
+filter key. Any change to sermons, tags, preachers or series bumps a
+version number that is part of every key, invalidating all cached facets
+at once.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+
+from apps.core.cache import bump_version, get_version
+from .filters import SermonFilter
+from .models import Sermon
+
+VERSION_KEY = 'sermons:facets:version'
+
+
+# Filters whose values match regardless of case; tag names are case-sensitive.
+CASE_INSENSITIVE_FILTERS = {'has_audio', 'has_video', 'has_notes', 'is_featured', 'scripture'}
+
+
+def facets_version():
+    return get_version(VERSION_KEY)
+
+
+def bump_facets_version():
+    bump_version(VERSION_KEY)
+
+
+def normalize_filters(params):
+    """
+    Canonical form of the filter parameters that affect the result set.
+    """
+    normalized = {}
+    for name in sorted(SermonFilter.base_filters):
+        value = params.get(name)
+        if value in (None, ''):
+            continue
+        value = str(value).strip()
+        if name == 'tags':
+            value = ','.join(sorted({tag.strip() for tag in value.split(',') if tag.strip()}))
+        elif name in CASE_INSENSITIVE_FILTERS:
+            value = value.lower()
+        normalized[name] = value
+    return normalized
+
+
+def cache_key(normalized):
+    digest = hashlib.md5(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+    return f'sermons:facets:{facets_version()}:{digest}'
+
+
+def compute_facets(queryset):
+    sermons = Sermon.objects.filter(pk__in=queryset.order_by().values('pk'))
+    tags = sermons.exclude(tags__name=None).values('tags__name', 'tags__slug').annotate(
+        count=Count('pk', distinct=True)
+    ).order_by('-count', 'tags__name')
+    preachers = sermons.values('preacher_id', 'preacher__name').annotate(
+        count=Count('pk')
+    ).order_by('-count', 'preacher__name')
+    series = sermons.exclude(series=None).values('series_id', 'series__title').annotate(
+        count=Count('pk')
+    ).order_by('-count', 'series__title')
+    years = sermons.annotate(year=ExtractYear('date_preached')).values('year').annotate(
+        count=Count('pk')
+    ).order_by('-year')
+    return {
+        'tags': [
+            {'name': row['tags__name'], 'slug': row['tags__slug'], 'count': row['count']}
+            for row in tags
+        ],
+        'preachers': [
+            {'id': row['preacher_id'], 'name': row['preacher__name'], 'count': row['count']}
+            for row in preachers
+        ],
+        'series': [
+            {'id': row['series_id'], 'title': row['series__title'], 'count': row['count']}
+            for row in series
+        ],
+        'years': [{'year': row['year'], 'count': row['count']} for row in years],
+    }
+
+
+def sermon_facets(filterset):
+    """
+    Return facet counts for a bound, valid ``SermonFilter``.
+    """
+    key = cache_key(normalize_filters(filterset.data))
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filterset.qs)
+        cache.set(key, facets, getattr(settings, 'SERMON_FACETS_CACHE_TIMEOUT', 600))
+    return facets
@@ -0,0 +1,294 @@
+"""
+Podcast feeds for sermons app.
+
+Feeds (RSS with iTunes tags, or Atom) cover the latest published sermons,
+either all of them or one series' or preacher's. A rendered feed is cached
+with a strong ETag and a Last-Modified. Conditional polls are therefore
+answered from the cache without touching the database. Every URL in a
+feed is built from ``SERMON_FEED_API_URL``, never from the request, so
+the cached document is the same whichever host it was requested on.
+
+Saving or deleting a sermon drops only the cached documents of the feeds
+it appears in and records the time of the change for them; editing a
+preacher, series or the church records it for every feed. Last-Modified
+is the latest of those times, so unpublishing or deleting a sermon moves
+it forward even though no remaining item changed. Rebuilding a feed re-renders only the items whose sermon,
+preacher or series changed; the rest are reused from a per-item fragment
+cache.
+"""
+import hashlib
+import mimetypes
+import time
+from io import StringIO
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Enclosure, Rss201rev2Feed
+from django.utils.html import strip_tags
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from apps.core.cache import bump_version, get_version
+from apps.core.models import ChurchInfo, Staff
+from .models import Sermon, SermonSeries
+
+ITUNES_NS = 'http://www.itunes.com/dtds/podcast-1.0.dtd'
+VERSION_KEY = 'sermons:feeds:version'
+# Time of the last change to a scope's feed; ALL_SCOPES is every feed.
+CHANGED_KEY = 'sermons:feeds:changed:{}'
+ALL_SCOPES = '*'
+
+
+class FragmentFeedMixin:
+    """
+    Writes items from pre-rendered XML fragments (``item['fragment']``).
+    """
+    item_element = 'item'
+
+    def render_item(self, item):
+        stream = StringIO()
+        handler = SimplerXMLGenerator(stream, 'utf-8', short_empty_elements=True)
+        handler.startElement(self.item_element, self.item_attributes(item))
+        self.add_item_elements(handler, item)
+        handler.endElement(self.item_element)
+        return stream.getvalue()
+
+    def write_items(self, handler):
+        for item in self.items:
+            # ignorableWhitespace() writes its argument verbatim.
+            handler.ignorableWhitespace(item['fragment'])
+
+
+class PodcastRssFeed(FragmentFeedMixin, Rss201rev2Feed):
+    """
+    RSS 2.0 with the iTunes podcast tags.
+    """
+
+    def rss_attributes(self):
+        attrs = super().rss_attributes()
+        attrs['xmlns:itunes'] = ITUNES_NS
+        return attrs
+
+    def add_root_elements(self, handler):
+        super().add_root_elements(handler)
+        handler.addQuickElement('itunes:author', self.feed['author_name'])
+        handler.addQuickElement('itunes:summary', self.feed['description'])
+        handler.addQuickElement('itunes:explicit', 'false')
+        if self.feed.get('image'):
+            handler.addQuickElement('itunes:image', '', {'href': self.feed['image']})
+
+    def add_item_elements(self, handler, item):
+        super().add_item_elements(handler, item)
+        handler.addQuickElement('itunes:author', item['author_name'])
+        if item.get('duration'):
+            handler.addQuickElement('itunes:duration', str(item['duration']))
+        if item.get('image'):
+            handler.addQuickElement('itunes:image', '', {'href': item['image']})
+
+
+class PodcastAtomFeed(FragmentFeedMixin, Atom1Feed):
+    item_element = 'entry'
+
+
+FEED_TYPES = {'rss': PodcastRssFeed, 'atom': PodcastAtomFeed}
+
+
+def feeds_version():
+    return get_version(VERSION_KEY)
+
+
+def bump_feeds_version():
+    bump_version(VERSION_KEY)
+    mark_changed([ALL_SCOPES])
+
+
+def mark_changed(scopes):
+    now = int(time.time())
+    cache.set_many({CHANGED_KEY.format(scope): now for scope in scopes}, None)
+
+
+def changed_at(scope):
+    """
+    When the feed of ``scope`` last changed. A marker that was evicted is
+    reset to now, which can only make clients refetch once.
+    """
+    keys = [CHANGED_KEY.format(scope), CHANGED_KEY.format(ALL_SCOPES)]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = int(time.time())
+        cache.set_many({key: now for key in missing}, None)
+        found.update(dict.fromkeys(missing, now))
+    return max(found.values())
+
+
+def feed_cache_key(scope, fmt):
+    return f'sermons:feed:{feeds_version()}:{scope}:{fmt}'
+
+
+def invalidate_feeds(scopes):
+    """
+    Drop the cached documents of the given scopes, e.g. ``'all'``,
+    ``'series:3'`` or ``'preacher:7'``.
+    """
+    mark_changed(scopes)
+    cache.delete_many([feed_cache_key(scope, fmt) for scope in scopes for fmt in FEED_TYPES])
+
+
+def sermon_scopes(series_id, preacher_id):
+    scopes = ['all', f'preacher:{preacher_id}']
+    if series_id:
+        scopes.append(f'series:{series_id}')
+    return scopes
+
+
+def absolute(url):
+    """
+    ``url`` made absolute against ``SERMON_FEED_API_URL``; URLs that
+    already are absolute (remote storage) are returned unchanged.
+    """
+    return urljoin(settings.SERMON_FEED_API_URL, url) if url else ''
+
+
+def feed_url(scope, fmt):
+    kind, _, pk = scope.partition(':')
+    if kind == 'series':
+        return absolute(reverse('sermon-series-feed', kwargs={'series_id': pk, 'fmt': fmt}))
+    if kind == 'preacher':
+        return absolute(reverse('sermon-preacher-feed', kwargs={'preacher_id': pk, 'fmt': fmt}))
+    return absolute(reverse('sermon-feed', kwargs={'fmt': fmt}))
+
+
+def enclosure_for(sermon):
+    """
+    Return ``(url, length, mime_type)`` of the sermon's media, or None.
+    The URL goes through ``sermon_media`` so podcast plays count as downloads.
+    """
+    file_type = 'audio' if sermon.audio_file else 'video' if sermon.video_file else None
+    if file_type is None:
+        return None
+    media = sermon.audio_file or sermon.video_file
+    try:
+        length = media.size
+    except (OSError, ValueError):
+        length = 0
+    mime_type = mimetypes.guess_type(media.name)[0] or 'application/octet-stream'
+    url = reverse('sermon-media', kwargs={'pk': sermon.pk, 'file_type': file_type})
+    return url, length, mime_type
+
+
+def item_fragment(generator, fmt, sermon):
+    """
+    Render one sermon's item, cached by the ``updated_at`` of everything in it.
+    """
+    key = 'sermons:feed-item:{}:{}:{}:{}:{}'.format(
+        fmt,
+        sermon.pk,
+        sermon.updated_at.timestamp(),
+        sermon.preacher.updated_at.timestamp(),
+        sermon.series.updated_at.timestamp() if sermon.series else 0
+    )
+    fragment = cache.get(key)
+    if fragment is not None:
+        return fragment
+
+    link = f"{settings.SERMON_FEED_SITE_URL.rstrip('/')}/sermons/{sermon.pk}"
+    enclosures = []
+    enclosure = enclosure_for(sermon)
+    if enclosure:
+        url, length, mime_type = enclosure
+        enclosures.append(Enclosure(absolute(url), str(length), mime_type))
+    generator.add_item(
+        title=sermon.title,
+        link=link,
+        description=strip_tags(sermon.description),
+        author_name=sermon.preacher.name,
+        pubdate=sermon.date_preached,
+        updateddate=sermon.updated_at,
+        unique_id=link,
+        unique_id_is_permalink=True,
+        categories=[sermon.series.title] if sermon.series else None,
+        enclosures=enclosures,
+        duration=sermon.duration_minutes and sermon.duration_minutes * 60,
+        image=absolute(sermon.thumbnail.url) if sermon.thumbnail else '',
+    )
+    fragment = generator.render_item(generator.items.pop())
+    cache.set(key, fragment, settings.SERMON_FEED_CACHE_TIMEOUT)
+    return fragment
+
+
+def feed_channel(scope):
+    """
+    Return ``(title, description, image, queryset)`` for a scope, or None
+    if the series or preacher does not exist.
+    """
+    church = ChurchInfo.objects.filter(is_active=True).first()
+    church_name = church.name if church else ChurchInfo._meta.get_field('name').default
+    description = church.tagline if church else ''
+    image = church.logo.url if church and church.logo else ''
+    sermons = Sermon.objects.filter(is_published=True).select_related('preacher', 'series')
+
+    kind, _, pk = scope.partition(':')
+    if kind == 'series':
+        series = SermonSeries.objects.filter(pk=pk).first()
+        if series is None:
+            return None
+        description = strip_tags(series.description) or description
+        image = series.image.url if series.image else image
+        return f'{church_name}: {series.title}', description, image, sermons.filter(series=series)
+    if kind == 'preacher':
+        preacher = Staff.objects.filter(pk=pk).first()
+        if preacher is None:
+            return None
+        return f'{church_name}: {preacher.name}', description, image, sermons.filter(preacher=preacher)
+    return f'{church_name} Sermons', description, image, sermons
+
+
+def build_feed(scope, fmt):
+    """
+    Render a feed. Returns ``(content, etag, last_modified)`` or None.
+    """
+    channel = feed_channel(scope)
+    if channel is None:
+        return None
+    title, description, image, sermons = channel
+    sermons = list(sermons.order_by('-date_preached', '-id')[:settings.SERMON_FEED_SIZE])
+
+    generator = FEED_TYPES[fmt](
+        title=title,
+        link=settings.SERMON_FEED_SITE_URL,
+        description=description or title,
+        language=settings.LANGUAGE_CODE,
+        author_name=title,
+        feed_url=feed_url(scope, fmt),
+        image=absolute(image),
+    )
+    for sermon in sermons:
+        generator.add_item(
+            title=sermon.title,
+            link='',
+            description='',
+            pubdate=sermon.date_preached,
+            updateddate=sermon.updated_at,
+            fragment=item_fragment(generator, fmt, sermon)
+        )
+    content = generator.writeString('utf-8').encode('utf-8')
+    etag = '"%s"' % hashlib.md5(content).hexdigest()
+    last_modified = max(
+        [changed_at(scope)] + [int(sermon.updated_at.timestamp()) for sermon in sermons]
+    )
+    return content, etag, last_modified
+
+
+def get_feed(scope, fmt):
+    """
+    Cached ``build_feed``.
+    """
+    key = feed_cache_key(scope, fmt)
+    feed = cache.get(key)
+    if feed is None:
+        feed = build_feed(scope, fmt)
+        if feed is not None:
+            cache.set(key, feed, settings.SERMON_FEED_CACHE_TIMEOUT)
+    return feed
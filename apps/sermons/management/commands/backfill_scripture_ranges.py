@@ -0,0 +1,31 @@
+"""
+Parse the scripture references of existing sermons into verse ranges.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.sermons.models import Sermon, SermonScriptureRange
+
+
+class Command(BaseCommand):
+    help = "Rebuild SermonScriptureRange rows from Sermon.scripture_reference for every sermon."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        sermons = Sermon.objects.order_by('pk').only('pk', 'scripture_reference')
+        last_pk = 0
+        sermon_count = range_count = 0
+        while True:
+            batch = list(sermons.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                range_count += SermonScriptureRange.objects.rebuild_for(batch)
+            sermon_count += len(batch)
+            last_pk = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {range_count} verse range(s) for {sermon_count} sermon(s)."
+        ))
@@ -0,0 +1,39 @@
+"""
+Backfill Sermon.has_audio / has_video / has_notes for existing sermons.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.sermons.models import Sermon
+
+FLAG_FIELDS = ['has_audio', 'has_video', 'has_notes']
+
+
+class Command(BaseCommand):
+    help = "Recompute the media availability flags of every sermon in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        sermons = Sermon.objects.order_by('pk').only(
+            'pk', 'audio_file', 'video_file', 'video_url', 'sermon_notes', *FLAG_FIELDS
+        )
+        last_pk = 0
+        checked = changed = 0
+        while True:
+            batch = list(sermons.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            stale = []
+            for sermon in batch:
+                flags = sermon.media_flags()
+                if any(getattr(sermon, name) != value for name, value in flags.items()):
+                    for name, value in flags.items():
+                        setattr(sermon, name, value)
+                    stale.append(sermon)
+            Sermon.objects.bulk_update(stale, FLAG_FIELDS)
+            checked += len(batch)
+            changed += len(stale)
+            last_pk = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} sermon(s); updated flags on {changed}."))
@@ -0,0 +1,89 @@
+"""
+Benchmark the sermon download tracking endpoint.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from apps.core.models import Staff
+from apps.sermons.counters import sermon_downloads
+from apps.sermons.models import Sermon, SermonDownload
+from apps.sermons.views import track_sermon_download
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def track_download_per_request(request, sermon_id):
+    """
+    The endpoint as it was before downloads were queued: a lookup, an
+    INSERT and a read-modify-save of ``download_count`` on every request.
+    """
+    try:
+        sermon = Sermon.objects.get(id=sermon_id, is_published=True)
+    except Sermon.DoesNotExist:
+        raise Http404("Sermon not found")
+    SermonDownload.objects.create(
+        sermon=sermon,
+        user=request.user if request.user.is_authenticated else None,
+        ip_address=request.META.get('REMOTE_ADDR', ''),
+        file_type=request.data.get('file_type', 'audio')
+    )
+    sermon.download_count += 1
+    sermon.save(update_fields=['download_count'])
+    return Response({'message': 'Download tracked successfully'})
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure requests/sec of sermon download tracking: the old per-request "
+        "writes against the batched download queue. Runs in a throwaway test "
+        "database with a local-memory cache, so neither the configured database "
+        "nor the shared cache is touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per run")
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+                sermon = Sermon.objects.create(
+                    title='Download benchmark', description='Benchmark sermon.',
+                    preacher=Staff.objects.create(name='Download benchmark', position='pastor'),
+                    is_published=True
+                )
+                before = self._run(track_download_per_request, sermon, total)
+                # A long interval keeps the timer idle; the final flush is timed explicitly.
+                with override_settings(SERMON_DOWNLOAD_FLUSH_INTERVAL=3600, SERMON_DOWNLOAD_MAX_PENDING=total + 1):
+                    after = self._run(track_sermon_download, sermon, total, flush=True)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"per request: {before:,.0f} req/s")
+        self.stdout.write(f"batched:     {after:,.0f} req/s")
+        self.stdout.write(self.style.SUCCESS(f"speedup:     {after / before:.1f}x"))
+
+    def _run(self, view, sermon, total, flush=False):
+        factory = RequestFactory()
+        started = time.perf_counter()
+        for _ in range(total):
+            request = factory.post(
+                f'/api/sermons/{sermon.pk}/download/',
+                {'file_type': 'audio'},
+                content_type='application/json'
+            )
+            view(request, sermon_id=sermon.pk)
+        if flush:
+            sermon_downloads.flush()
+        return total / (time.perf_counter() - started)
@@ -0,0 +1,31 @@
+"""
+Flush buffered sermon counters to the database.
+
+View counts are buffered in the shared cache, so this command drains
+every worker's views. Web workers also drain them on their timer; run
+this from cron (or on deploy) so counts are written even while no worker
+is running its timer::
+
+    * * * * * manage.py flush_sermon_counters
+
+Download events are queued in each server process's memory and are
+flushed by that process on its timer and at exit. Run from a shell, the
+command has no downloads of its own to write.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.sermons.counters import sermon_views, sermon_downloads
+
+
+class Command(BaseCommand):
+    help = (
+        "Write buffered sermon view counts from the shared cache (and this process's queued "
+        "download events) to the database. Safe to run from cron alongside the web workers."
+    )
+
+    def handle(self, *args, **options):
+        updated = sermon_views.flush()
+        downloads = sermon_downloads.flush()
+        self.stdout.write(self.style.SUCCESS(
+            f"Flushed view counts for {updated} sermon(s) and {downloads} download(s)."
+        ))
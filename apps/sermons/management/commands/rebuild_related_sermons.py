@@ -0,0 +1,27 @@
+"""
+Rebuild the related-sermon neighbour lists.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.sermons.related import rebuild_all, refresh_pending, top_k
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the top-k content-based neighbours of every published sermon, or with "
+        "--pending only the lists affected by sermons queued since the last run (run that from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pending', action='store_true', help="Only process queued sermons")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            sermons, written = refresh_pending(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Refreshed {written} related sermon list(s) for {sermons} queued sermon(s)."
+            ))
+            return
+        count = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f"Stored up to {top_k()} related sermon(s) for {count} sermon(s)."))
@@ -0,0 +1,26 @@
+"""
+Rebuild the full-text search vectors for all sermons.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.sermons.models import Sermon
+from apps.sermons.search import full_text_supported, update_search_vector
+
+
+class Command(BaseCommand):
+    help = "Recompute Sermon.search_vector for every sermon (PostgreSQL only)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not full_text_supported():
+            self.stdout.write("Full-text search needs PostgreSQL; nothing to do.")
+            return
+
+        batch_size = options['batch_size']
+        ids = list(Sermon.objects.order_by('pk').values_list('pk', flat=True))
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            updated += update_search_vector(Sermon.objects.filter(pk__in=ids[start:start + batch_size]))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search vectors for {updated} sermon(s)."))
@@ -0,0 +1,14 @@
+"""
+Rebuild the trending sermons leaderboard.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.sermons.trending import rebuild_trending
+
+
+class Command(BaseCommand):
+    help = "Score sermons from recent views and downloads and rebuild the trending leaderboard. Run it on a schedule."
+
+    def handle(self, *args, **options):
+        count = rebuild_trending()
+        self.stdout.write(self.style.SUCCESS(f"Trending leaderboard rebuilt with {count} sermon(s)."))
@@ -0,0 +1,23 @@
+"""
+Refresh the "listeners also downloaded" recommendations.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.sermons.recommendations import refresh_recommendations
+
+
+class Command(BaseCommand):
+    help = "Fold new downloads and playlist items into the sermon co-occurrence counts and re-rank affected sermons. Run it on a schedule."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help="Discard the stored counts and rebuild from every download and playlist item."
+        )
+
+    def handle(self, *args, **options):
+        new_rows, ranked = refresh_recommendations(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {new_rows} new row(s); re-ranked recommendations for {ranked} sermon(s)."
+        ))
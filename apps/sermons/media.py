@@ -0,0 +1,162 @@
+"""
+Media delivery helpers for sermons app.
+
+Local files are served with byte-range and conditional-GET support, or
+handed to the front proxy (X-Accel-Redirect / X-Sendfile) so Django
+workers never stream bytes. Files on remote storage are served by
+redirecting to the storage's (signed) URL.
+
+Sermon audio, video and notes can live on their own storage
+(``SERMON_MEDIA_STORAGE``), e.g. private S3 objects behind expiring signed
+URLs, while images stay on the public default storage.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def sermon_media_storage():
+    """
+    Storage for sermon audio, video and notes: built from
+    ``SERMON_MEDIA_STORAGE`` (a ``{'BACKEND': ..., 'OPTIONS': {...}}`` dict)
+    when set, else the default storage.
+    """
+    config = settings.SERMON_MEDIA_STORAGE
+    if not config:
+        return default_storage
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header into an inclusive ``(start, end)``.
+
+    Returns None when the header should be ignored (absent, malformed or
+    multi-range), in which case the whole file is served.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == '':
+        if end == '':
+            return None
+        suffix = int(end)
+        if suffix == 0:
+            raise RangeNotSatisfiable
+        return max(size - suffix, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def file_validators(path):
+    """
+    Return ``(size, etag, last_modified)`` for a local file.
+    """
+    stat = os.stat(path)
+    etag = f'"{stat.st_size:x}-{int(stat.st_mtime * 1000):x}"'
+    return stat.st_size, etag, int(stat.st_mtime)
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def local_path(field_file):
+    try:
+        return field_file.path
+    except NotImplementedError:
+        return None
+
+
+def serve_media(request, field_file):
+    """
+    Build the response delivering ``field_file`` to the client.
+    """
+    path = local_path(field_file)
+    if path is None:
+        return HttpResponseRedirect(field_file.url)
+
+    size, etag, last_modified = file_validators(path)
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    sendfile = getattr(settings, 'SERMON_MEDIA_SENDFILE', '')
+    if sendfile:
+        # The proxy handles ranges itself; Django only authorises the request.
+        response = HttpResponse(content_type=content_type)
+        if sendfile == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.SERMON_MEDIA_ACCEL_PREFIX + quote(field_file.name)
+        else:
+            response['X-Sendfile'] = path
+    else:
+        byte_range = None
+        if request.method == 'GET' and if_range_matches(request, etag, last_modified):
+            try:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        start, end = byte_range or (0, size - 1)
+        length = max(end - start + 1, 0)
+        response = StreamingHttpResponse(
+            read_range(path, start, length) if request.method == 'GET' else [],
+            status=206 if byte_range else 200,
+            content_type=content_type
+        )
+        response['Content-Length'] = str(length)
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def is_initial_request(request):
+    """
+    True unless the request is a follow-up range request (seeking), so a
+    download is recorded once per playback rather than once per chunk.
+    """
+    header = request.META.get('HTTP_RANGE', '')
+    return request.method == 'GET' and (not header or header.replace(' ', '').startswith('bytes=0-'))
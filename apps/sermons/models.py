@@ -3,10 +3,23 @@ Models for sermons app.
 """
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 from ckeditor.fields import RichTextField
 from taggit.managers import TaggableManager
 from apps.core.models import TimeStampedModel, Staff
+from .media import sermon_media_storage
+from .scripture import BOOK_CHOICES, parse_references
+from .search import SearchVectorIndex
+
+
+class SermonSeriesQuerySet(models.QuerySet):
+    def with_sermon_count(self, published_only=False):
+        """
+        Annotate ``num_sermons`` so ``sermon_count`` needs no extra query.
+        """
+        sermon_filter = models.Q(sermons__is_published=True) if published_only else None
+        return self.annotate(num_sermons=models.Count('sermons', filter=sermon_filter))
 
 
 class SermonSeries(TimeStampedModel):
@@ -16,10 +29,13 @@ class SermonSeries(TimeStampedModel):
     title = models.CharField(max_length=200)
     description = RichTextField(blank=True)
     image = models.ImageField(upload_to='sermon_series/', blank=True, null=True)
+    derivatives_of = models.CharField(max_length=100, blank=True, editable=False)
     start_date = models.DateField()
     end_date = models.DateField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     
+    objects = SermonSeriesQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-start_date']
         verbose_name_plural = "Sermon Series"
@@ -29,9 +45,14 @@ class SermonSeries(TimeStampedModel):
     
     @property
     def sermon_count(self):
+        if hasattr(self, 'num_sermons'):
+            return self.num_sermons
         return self.sermons.count()
 
 
+MEDIA_FIELDS = {'audio_file', 'video_file', 'video_url', 'sermon_notes'}
+
+
 class Sermon(TimeStampedModel):
     """
     Model for individual sermons.
@@ -45,13 +66,14 @@ class Sermon(TimeStampedModel):
     scripture_reference = models.CharField(max_length=200, blank=True)
     
     # Media files
-    audio_file = models.FileField(upload_to='sermons/audio/', blank=True, null=True)
-    video_file = models.FileField(upload_to='sermons/video/', blank=True, null=True)
+    audio_file = models.FileField(upload_to='sermons/audio/', storage=sermon_media_storage, blank=True, null=True)
+    video_file = models.FileField(upload_to='sermons/video/', storage=sermon_media_storage, blank=True, null=True)
     video_url = models.URLField(blank=True, help_text="YouTube, Vimeo, or other video URL")
     
     # Additional resources
-    sermon_notes = models.FileField(upload_to='sermons/notes/', blank=True, null=True)
+    sermon_notes = models.FileField(upload_to='sermons/notes/', storage=sermon_media_storage, blank=True, null=True)
     thumbnail = models.ImageField(upload_to='sermons/thumbnails/', blank=True, null=True)
+    derivatives_of = models.CharField(max_length=100, blank=True, editable=False)
     
     # Metadata
     date_preached = models.DateTimeField(default=timezone.now)
@@ -63,22 +85,59 @@ class Sermon(TimeStampedModel):
     is_published = models.BooleanField(default=False)
     is_featured = models.BooleanField(default=False)
     
+    # Media availability (kept in step with the media fields by save())
+    has_audio = models.BooleanField(default=False, editable=False)
+    has_video = models.BooleanField(default=False, editable=False)
+    has_notes = models.BooleanField(default=False, editable=False)
+    
     # Tags for categorization
     tags = TaggableManager(blank=True)
     
+    # Full-text search (maintained by signals, PostgreSQL only)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
     class Meta:
         ordering = ['-date_preached']
+        indexes = [
+            SearchVectorIndex(fields=['search_vector'], name='sermon_search_vector_idx'),
+            models.Index(
+                fields=['has_audio', '-date_preached'],
+                condition=models.Q(is_published=True),
+                name='sermon_published_audio_idx'
+            ),
+            models.Index(
+                fields=['has_video', '-date_preached'],
+                condition=models.Q(is_published=True),
+                name='sermon_published_video_idx'
+            ),
+            models.Index(
+                fields=['has_notes', '-date_preached'],
+                condition=models.Q(is_published=True),
+                name='sermon_published_notes_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.preacher.name}"
     
+    def media_flags(self):
+        return {
+            'has_audio': bool(self.audio_file),
+            'has_video': bool(self.video_file) or bool(self.video_url),
+            'has_notes': bool(self.sermon_notes),
+        }
+    
+    def save(self, *args, **kwargs):
+        for name, value in self.media_flags().items():
+            setattr(self, name, value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and MEDIA_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'has_audio', 'has_video', 'has_notes'}
+        super().save(*args, **kwargs)
+    
     def increment_view_count(self):
+        Sermon.objects.filter(pk=self.pk).update(view_count=models.F('view_count') + 1)
         self.view_count += 1
-        self.save(update_fields=['view_count'])
-    
-    def increment_download_count(self):
-        self.download_count += 1
-        self.save(update_fields=['download_count'])
 
 
 class SermonComment(TimeStampedModel):
@@ -98,6 +157,18 @@ class SermonComment(TimeStampedModel):
         return f"Comment by {self.user.get_full_name()} on {self.sermon.title}"
 
 
+class SermonPlaylistQuerySet(models.QuerySet):
+    def with_items(self):
+        """
+        Load owners and ordered items with their sermons and preachers in a
+        fixed number of queries, however many items the playlists hold.
+        """
+        items = PlaylistItem.objects.select_related('sermon__preacher').order_by('order', 'id')
+        return self.select_related('created_by').prefetch_related(
+            models.Prefetch('playlistitem_set', queryset=items)
+        )
+
+
 class SermonPlaylist(TimeStampedModel):
     """
     Model for sermon playlists.
@@ -108,6 +179,8 @@ class SermonPlaylist(TimeStampedModel):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     is_public = models.BooleanField(default=True)
     
+    objects = SermonPlaylistQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
     
@@ -139,6 +212,188 @@ class SermonDownload(TimeStampedModel):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Trending scores read the downloads of a recent window, per sermon.
+            models.Index(fields=['created_at', 'sermon'], name='sermon_download_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sermon.title} - {self.file_type} download"
+
+
+class SermonDailyViews(models.Model):
+    """
+    Per-day view totals, written by the view counter flusher and used to
+    score trending sermons.
+    """
+    sermon = models.ForeignKey(Sermon, on_delete=models.CASCADE, related_name='daily_views')
+    date = models.DateField(db_index=True)
+    views = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = ['sermon', 'date']
+        verbose_name_plural = "Sermon daily views"
+    
+    def __str__(self):
+        return f"{self.sermon_id} - {self.date}: {self.views}"
+
+
+class TrendingSermon(models.Model):
+    """
+    Precomputed trending leaderboard, rebuilt by ``rebuild_trending_sermons``.
+    """
+    sermon = models.OneToOneField(Sermon, on_delete=models.CASCADE, related_name='trending')
+    rank = models.PositiveIntegerField(unique=True)
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['rank']
+    
+    def __str__(self):
+        return f"#{self.rank} {self.sermon_id} ({self.score:.2f})"
+
+
+class RelatedSermon(models.Model):
+    """
+    Precomputed content-based neighbours of a sermon, maintained by
+    ``apps.sermons.related``.
+    """
+    sermon = models.ForeignKey(Sermon, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Sermon, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        ordering = ['sermon', 'rank']
+        unique_together = ['sermon', 'related']
+    
+    def __str__(self):
+        return f"{self.sermon_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class RelatedSermonRefresh(models.Model):
+    """
+    A sermon whose related-sermon lists are out of date. Queued by signals
+    and drained by ``rebuild_related_sermons --pending``. Not a foreign key,
+    so deleted sermons can be queued too.
+    """
+    sermon_id = models.PositiveBigIntegerField(unique=True)
+    queued_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Refresh related sermons of {self.sermon_id}"
+
+
+class SermonCooccurrence(models.Model):
+    """
+    Number of distinct listeners who consumed both sermons (downloaded them
+    or put them in one of their playlists). Stored in both directions; the
+    ``sermon == related`` row holds the sermon's own listener count.
+    """
+    sermon = models.ForeignKey(Sermon, on_delete=models.CASCADE, related_name='cooccurrences')
+    related = models.ForeignKey(Sermon, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['sermon', 'related']
+    
+    def __str__(self):
+        return f"{self.sermon_id} & {self.related_id}: {self.count}"
+
+
+class SermonRecommendation(models.Model):
+    """
+    Precomputed "listeners also downloaded" list of a sermon.
+    """
+    sermon = models.ForeignKey(Sermon, on_delete=models.CASCADE, related_name='recommendations')
+    related = models.ForeignKey(Sermon, on_delete=models.CASCADE, related_name='recommended_for')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        ordering = ['sermon', 'rank']
+        unique_together = ['sermon', 'related']
+    
+    def __str__(self):
+        return f"{self.sermon_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class SermonRecommendationRun(models.Model):
+    """
+    Checkpoint of a recommendations refresh: the last download and playlist
+    item rows already folded into ``SermonCooccurrence``.
+    """
+    last_download_id = models.PositiveBigIntegerField(default=0)
+    last_playlist_item_id = models.PositiveBigIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-computed_at']
+        get_latest_by = 'computed_at'
+    
+    def __str__(self):
+        return f"Recommendations run {self.computed_at:%Y-%m-%d %H:%M}"
+
+
+class SermonScriptureRangeQuerySet(models.QuerySet):
+    def overlapping(self, ranges):
+        """
+        Ranges sharing at least one verse with any of ``ranges``.
+        """
+        condition = models.Q(pk__in=[])
+        for scripture_range in ranges:
+            condition |= models.Q(
+                book=scripture_range.book,
+                start__lte=scripture_range.end,
+                end__gte=scripture_range.start
+            )
+        return self.filter(condition)
+    
+    def rebuild_for(self, sermons):
+        """
+        Re-parse the references of ``sermons`` and replace their ranges.
+        """
+        sermons = list(sermons)
+        rows = [
+            self.model(
+                sermon_id=sermon.pk,
+                book=scripture_range.book,
+                chapter=scripture_range.chapter,
+                verse_start=scripture_range.verse_start,
+                chapter_end=scripture_range.chapter_end,
+                verse_end=scripture_range.verse_end,
+                start=scripture_range.start,
+                end=scripture_range.end
+            )
+            for sermon in sermons
+            for scripture_range in parse_references(sermon.scripture_reference)
+        ]
+        self.filter(sermon__in=[sermon.pk for sermon in sermons]).delete()
+        self.bulk_create(rows)
+        return len(rows)
+
+
+class SermonScriptureRange(models.Model):
+    """
+    One parsed verse range of ``Sermon.scripture_reference``. ``start`` and
+    ``end`` encode positions as ``chapter * 1000 + verse`` for overlap queries.
+    """
+    sermon = models.ForeignKey(Sermon, on_delete=models.CASCADE, related_name='scripture_ranges')
+    book = models.PositiveSmallIntegerField(choices=BOOK_CHOICES)
+    chapter = models.PositiveSmallIntegerField()
+    verse_start = models.PositiveSmallIntegerField()
+    chapter_end = models.PositiveSmallIntegerField()
+    verse_end = models.PositiveSmallIntegerField()
+    start = models.PositiveIntegerField()
+    end = models.PositiveIntegerField()
+    
+    objects = SermonScriptureRangeQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['book', 'start']
+        indexes = [models.Index(fields=['book', 'start', 'end'], name='sermon_scripture_range_idx')]
+    
+    def __str__(self):
+        return f"{self.get_book_display()} {self.chapter}:{self.verse_start}-{self.chapter_end}:{self.verse_end}"
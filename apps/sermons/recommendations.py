@@ -0,0 +1,206 @@
+"""
+"Listeners also downloaded" recommendations for sermons app.
+
+A listener is a signed-in user. Anonymous downloads are left out: their
+only key is an IP address, which a proxy or a shared network collapses
+into one "listener" who appears to have downloaded everything. Each
+listener contributes the set of sermons they downloaded or added to one
+of their playlists. Item-item co-occurrence counts (``A.T @ A`` of the
+binary listener x sermon matrix) are kept in ``SermonCooccurrence`` and the
+cosine top-N of each sermon is stored in ``SermonRecommendation``.
+
+Refreshes are incremental: only download and playlist item rows newer than
+the last ``SermonRecommendationRun`` checkpoint are read. Rows younger
+than ``SERMON_RECOMMENDATIONS_COMMIT_LAG`` seconds are left for the next
+run: a transaction still open when the checkpoint is taken may commit a
+lower primary key later, and it would be skipped for good. With ``A`` the
+listeners' existing sermons and ``D`` their newly consumed ones, the
+counts grow by ``A.T @ D + D.T @ A + D.T @ D``. Removed playlist items are
+only accounted for by a full rebuild.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from scipy import sparse
+
+from .models import (
+    PlaylistItem, Sermon, SermonCooccurrence, SermonDownload, SermonRecommendation,
+    SermonRecommendationRun,
+)
+
+LISTENER_BATCH_SIZE = 500
+
+
+def consumed(downloads, playlist_items):
+    """
+    Return ``{user_id: {sermon_id, ...}}`` for the given querysets.
+    """
+    listeners = {}
+    downloads = downloads.filter(user__isnull=False)
+    for user_id, sermon_id in downloads.order_by().values_list('user_id', 'sermon_id').distinct():
+        listeners.setdefault(user_id, set()).add(sermon_id)
+    for user_id, sermon_id in playlist_items.order_by().values_list('playlist__created_by_id', 'sermon_id').distinct():
+        listeners.setdefault(user_id, set()).add(sermon_id)
+    return listeners
+
+
+def previously_consumed(listeners, last_download_id, last_playlist_item_id):
+    """
+    Sermons the given listeners had consumed before the checkpoint.
+    """
+    return consumed(
+        SermonDownload.objects.filter(pk__lte=last_download_id, user_id__in=listeners),
+        PlaylistItem.objects.filter(pk__lte=last_playlist_item_id, playlist__created_by_id__in=listeners)
+    )
+
+
+def settled_max_pk(model, last_id, cutoff):
+    """
+    Highest primary key after ``last_id`` among rows created by ``cutoff``.
+    """
+    return model.objects.filter(pk__gt=last_id, created_at__lte=cutoff).aggregate(value=Max('pk'))['value'] or last_id
+
+
+def binary_matrix(rows, size):
+    """
+    Listener x sermon 0/1 matrix from a list of sermon id sets.
+    """
+    indptr = np.cumsum([0] + [len(row) for row in rows])
+    indices = np.fromiter((sermon_id for row in rows for sermon_id in sorted(row)), dtype=np.int64, count=indptr[-1])
+    return sparse.csr_matrix((np.ones(len(indices), dtype=np.int64), indices, indptr), shape=(len(rows), size))
+
+
+def cooccurrence_delta(new, old, size):
+    """
+    Increase of the sermon x sermon co-occurrence counts caused by ``new``.
+    """
+    listeners = list(new)
+    fresh = [new[listener] - old.get(listener, set()) for listener in listeners]
+    existing = [old.get(listener, set()) for listener in listeners]
+    A = binary_matrix(existing, size)
+    D = binary_matrix(fresh, size)
+    cross = A.T @ D
+    return (cross + cross.T + D.T @ D).tocoo()
+
+
+def apply_delta(delta):
+    """
+    Add ``delta`` to the stored counts. Returns the sermon ids whose rows changed.
+    """
+    if not delta.nnz:
+        return set()
+    increments = {
+        (int(sermon_id), int(related_id)): int(count)
+        for sermon_id, related_id, count in zip(delta.row, delta.col, delta.data)
+    }
+    changed = {sermon_id for sermon_id, _ in increments}
+    counts = dict(increments)
+    existing = SermonCooccurrence.objects.filter(sermon_id__in=changed).values_list('sermon_id', 'related_id', 'count')
+    for sermon_id, related_id, count in existing.iterator():
+        if (sermon_id, related_id) in increments:
+            counts[sermon_id, related_id] += count
+    SermonCooccurrence.objects.bulk_create(
+        [
+            SermonCooccurrence(sermon_id=sermon_id, related_id=related_id, count=count)
+            for (sermon_id, related_id), count in counts.items()
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['sermon', 'related'],
+        update_fields=['count']
+    )
+    return changed
+
+
+def rank_recommendations(sermon_ids):
+    """
+    Recompute and store the top-N cosine neighbours of ``sermon_ids``.
+    """
+    top_n = settings.SERMON_RECOMMENDATIONS_TOP_N
+    min_count = settings.SERMON_RECOMMENDATIONS_MIN_COOCCURRENCE
+    published = set(Sermon.objects.filter(is_published=True).values_list('pk', flat=True))
+    listeners = dict(
+        SermonCooccurrence.objects.filter(sermon_id=F('related_id')).values_list('sermon_id', 'count')
+    )
+    entries = []
+    sermon_ids = sorted(sermon_ids)
+    for start in range(0, len(sermon_ids), LISTENER_BATCH_SIZE):
+        batch = sermon_ids[start:start + LISTENER_BATCH_SIZE]
+        rows = np.array(
+            SermonCooccurrence.objects.filter(
+                sermon_id__in=batch,
+                count__gte=min_count
+            ).exclude(related_id=F('sermon_id')).values_list('sermon_id', 'related_id', 'count'),
+            dtype=np.float64
+        ).reshape(-1, 3)
+        if not len(rows):
+            continue
+        sermon, related, count = rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64), rows[:, 2]
+        norms = np.sqrt(
+            np.array([listeners.get(i, 0) for i in sermon], dtype=np.float64) *
+            np.array([listeners.get(i, 0) for i in related], dtype=np.float64)
+        )
+        scores = np.divide(count, norms, out=np.zeros_like(count), where=norms > 0)
+        keep = np.fromiter((i in published for i in related), dtype=bool, count=len(related))
+        sermon, related, scores = sermon[keep], related[keep], scores[keep]
+        # Sort by sermon, best score first, ties by id, then keep the first N per sermon.
+        order = np.lexsort((related, -scores, sermon))
+        sermon, related, scores = sermon[order], related[order], scores[order]
+        starts = np.searchsorted(sermon, sermon, side='left')
+        ranks = np.arange(len(sermon)) - starts + 1
+        for i in np.flatnonzero(ranks <= top_n):
+            entries.append(SermonRecommendation(
+                sermon_id=int(sermon[i]), related_id=int(related[i]), score=float(scores[i]), rank=int(ranks[i])
+            ))
+    SermonRecommendation.objects.filter(sermon_id__in=sermon_ids).delete()
+    SermonRecommendation.objects.bulk_create(entries, batch_size=1000)
+    return len(sermon_ids)
+
+
+def refresh_recommendations(full=False):
+    """
+    Fold downloads and playlist items added since the last run into the
+    co-occurrence counts and re-rank the sermons they touched.
+
+    Returns ``(new_rows, sermons_ranked)``.
+    """
+    with transaction.atomic():
+        if full:
+            SermonCooccurrence.objects.all().delete()
+            SermonRecommendation.objects.all().delete()
+            SermonRecommendationRun.objects.all().delete()
+        checkpoint = SermonRecommendationRun.objects.select_for_update().order_by('-pk').first()
+        last_download_id = checkpoint.last_download_id if checkpoint else 0
+        last_playlist_item_id = checkpoint.last_playlist_item_id if checkpoint else 0
+        cutoff = timezone.now() - timedelta(seconds=settings.SERMON_RECOMMENDATIONS_COMMIT_LAG)
+        max_download_id = settled_max_pk(SermonDownload, last_download_id, cutoff)
+        max_playlist_item_id = settled_max_pk(PlaylistItem, last_playlist_item_id, cutoff)
+
+        new_downloads = SermonDownload.objects.filter(pk__gt=last_download_id, pk__lte=max_download_id)
+        new_items = PlaylistItem.objects.filter(pk__gt=last_playlist_item_id, pk__lte=max_playlist_item_id)
+        new_rows = new_downloads.count() + new_items.count()
+        new = consumed(new_downloads, new_items)
+        size = (Sermon.objects.aggregate(value=Max('pk'))['value'] or 0) + 1
+
+        changed = set()
+        listeners = list(new)
+        for start in range(0, len(listeners), LISTENER_BATCH_SIZE):
+            batch = {listener: new[listener] for listener in listeners[start:start + LISTENER_BATCH_SIZE]}
+            old = previously_consumed(batch, last_download_id, last_playlist_item_id)
+            changed |= apply_delta(cooccurrence_delta(batch, old, size))
+
+        if changed:
+            # Lists pointing at a changed sermon depend on its listener count too.
+            changed |= set(
+                SermonRecommendation.objects.filter(related_id__in=changed).values_list('sermon_id', flat=True)
+            )
+        ranked = rank_recommendations(changed) if changed else 0
+        SermonRecommendationRun.objects.create(
+            last_download_id=max_download_id,
+            last_playlist_item_id=max_playlist_item_id
+        )
+    return new_rows, ranked
@@ -0,0 +1,232 @@
+"""
+Content-based related sermons for sermons app.
+
+Every published sermon is turned into a TF-IDF vector over its title,
+description, scripture book and tags. Cosine similarities are computed
+with sparse matrix products and the top ``SERMON_RELATED_TOP_K``
+neighbours of each sermon are stored in ``RelatedSermon``.
+
+A full rebuild rewrites every row. Publishing, editing, retagging or
+unpublishing a sermon only queues it in ``RelatedSermonRefresh``; saves
+never compute anything. ``rebuild_related_sermons --pending`` (run from
+cron) drains the queue: it fits the matrix once for the whole batch and
+recomputes only the rows that can change, i.e. the queued sermons' own
+lists and the lists they enter or leave. Small score drift caused by
+document frequencies changing elsewhere is corrected by running a full
+``rebuild_related_sermons`` periodically.
+"""
+import math
+import re
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from django.utils.html import strip_tags
+from scipy import sparse
+
+from .models import RelatedSermon, RelatedSermonRefresh, Sermon
+
+WORD_RE = re.compile(r'[a-z]{3,}')
+BOOK_RE = re.compile(r'^\s*((?:[1-3]\s*)?[a-z]+(?:\s+of\s+[a-z]+)?)', re.IGNORECASE)
+STOP_WORDS = frozenset("""
+    about after again also and any are because been before being but can could did does doing
+    down each few for from further had has have having her here hers him his how into its just
+    more most not now off once only other our ours out over own same she should some such than
+    that the their theirs them then there these they this those through too under until very
+    was were what when where which while who whom why will with would you your yours
+""".split())
+
+TITLE_WEIGHT = 2
+TAG_WEIGHT = 3
+BOOK_WEIGHT = 2
+
+
+def top_k():
+    return getattr(settings, 'SERMON_RELATED_TOP_K', 6)
+
+
+def sermon_terms(sermon, tag_names):
+    """
+    Weighted term counts describing one sermon.
+    """
+    terms = Counter()
+    for word in WORD_RE.findall(sermon.title.lower()):
+        if word not in STOP_WORDS:
+            terms[word] += TITLE_WEIGHT
+    for word in WORD_RE.findall(strip_tags(sermon.description).lower()):
+        if word not in STOP_WORDS:
+            terms[word] += 1
+    match = BOOK_RE.match(sermon.scripture_reference or '')
+    if match:
+        book = re.sub(r'\s+', ' ', match.group(1).lower())
+        terms[f'book:{book}'] += BOOK_WEIGHT
+    for name in tag_names:
+        terms[f'tag:{name.lower()}'] += TAG_WEIGHT
+    return terms
+
+
+def build_matrix():
+    """
+    Return ``(sermon_ids, X)`` where X is the L2-normalised TF-IDF matrix
+    of all published sermons, one row per sermon.
+    """
+    sermons = list(
+        Sermon.objects.filter(is_published=True).only(
+            'id', 'title', 'description', 'scripture_reference'
+        ).prefetch_related('tags').order_by('id')
+    )
+    ids = np.array([sermon.pk for sermon in sermons], dtype=np.int64)
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    for row, sermon in enumerate(sermons):
+        for term, count in sermon_terms(sermon, [tag.name for tag in sermon.tags.all()]).items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            values.append(1.0 + math.log(count))
+
+    matrix = sparse.csr_matrix(
+        (np.array(values), (np.array(rows), np.array(cols))),
+        shape=(len(sermons), len(vocabulary))
+    )
+    if not len(sermons) or not len(vocabulary):
+        return ids, matrix
+
+    document_frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+    idf = np.log((1.0 + len(sermons)) / (1.0 + document_frequency)) + 1.0
+    matrix = matrix @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return ids, sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+
+def neighbours(ids, matrix, rows):
+    """
+    Yield ``(sermon_id, [(related_id, score), ...])`` for the given row indexes.
+    """
+    k = top_k()
+    similarities = (matrix[rows] @ matrix.T).tocsr()
+    for position, row in enumerate(rows):
+        start, end = similarities.indptr[position], similarities.indptr[position + 1]
+        columns = similarities.indices[start:end]
+        scores = similarities.data[start:end]
+        keep = (columns != row) & (scores > 0)
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k)[:k]
+            columns, scores = columns[best], scores[best]
+        order = np.lexsort((ids[columns], -scores))
+        yield int(ids[row]), [(int(ids[columns[i]]), float(scores[i])) for i in order]
+
+
+def write_rows(results):
+    """
+    Replace the stored neighbour lists of the sermons in ``results``.
+    """
+    results = dict(results)
+    with transaction.atomic():
+        RelatedSermon.objects.filter(sermon_id__in=list(results)).delete()
+        RelatedSermon.objects.bulk_create([
+            RelatedSermon(sermon_id=sermon_id, related_id=related_id, score=score, rank=rank)
+            for sermon_id, related in results.items()
+            for rank, (related_id, score) in enumerate(related, start=1)
+        ], batch_size=1000)
+    return len(results)
+
+
+def rebuild_all():
+    """
+    Recompute and store the neighbours of every published sermon.
+    """
+    last_queued = RelatedSermonRefresh.objects.order_by('-pk').values_list('pk', flat=True).first()
+    ids, matrix = build_matrix()
+    with transaction.atomic():
+        RelatedSermon.objects.exclude(sermon_id__in=ids.tolist()).delete()
+        if last_queued:
+            # Everything queued before the matrix was built is covered.
+            RelatedSermonRefresh.objects.filter(pk__lte=last_queued).delete()
+        return write_rows(neighbours(ids, matrix, list(range(len(ids)))))
+
+
+def rebuild_for(sermon_ids):
+    """
+    Incrementally refresh the lists affected by changes to ``sermon_ids``.
+
+    The changed sermons' own lists are recomputed, as are the lists of
+    sermons that currently include one of them or that one of them would
+    now enter (its similarity beats the list's weakest entry).
+    """
+    sermon_ids = set(sermon_ids)
+    ids, matrix = build_matrix()
+    index = {int(sermon_id): row for row, sermon_id in enumerate(ids)}
+    changed_rows = [index[sermon_id] for sermon_id in sorted(sermon_ids) if sermon_id in index]
+
+    affected = set(
+        RelatedSermon.objects.filter(related_id__in=sermon_ids).values_list('sermon_id', flat=True)
+    )
+    if changed_rows:
+        k = top_k()
+        similarities = (matrix[changed_rows] @ matrix.T).tocoo()
+        keep = similarities.data > 0
+        candidates = [int(ids[column]) for column in similarities.col[keep]]
+        # Only the candidates' own lists are read, not every stored row.
+        lists = {
+            row['sermon_id']: row
+            for row in RelatedSermon.objects.filter(sermon_id__in=set(candidates)).values(
+                'sermon_id'
+            ).annotate(weakest=Min('score'), size=Count('id'))
+        }
+        for candidate, score in zip(candidates, similarities.data[keep]):
+            stored = lists.get(candidate)
+            if stored is None or stored['size'] < k or score >= stored['weakest']:
+                affected.add(candidate)
+
+    affected -= sermon_ids
+    # Unpublished or deleted sermons keep no list of their own.
+    RelatedSermon.objects.filter(sermon_id__in=sermon_ids - set(index)).delete()
+    rows = changed_rows + [index[sermon_id] for sermon_id in sorted(affected) if sermon_id in index]
+    if not rows:
+        return 0
+    return write_rows(neighbours(ids, matrix, rows))
+
+
+def queue_refresh(sermon_ids):
+    """
+    Mark sermons whose related lists need recomputing.
+
+    A sermon that is already queued has its ``queued_at`` moved forward, so
+    a refresh that read the row before this edit does not dequeue it.
+    """
+    RelatedSermonRefresh.objects.bulk_create(
+        [RelatedSermonRefresh(sermon_id=sermon_id) for sermon_id in sermon_ids],
+        update_conflicts=True,
+        unique_fields=['sermon_id'],
+        update_fields=['queued_at']
+    )
+
+
+def refresh_pending(batch_size=1000):
+    """
+    Recompute the lists affected by every queued sermon. The matrix is
+    built once per batch, however many saves were queued. Returns
+    ``(sermons, lists_written)``.
+    """
+    sermons = written = 0
+    while True:
+        with transaction.atomic():
+            claimed_at = timezone.now()
+            queued = list(
+                RelatedSermonRefresh.objects.select_for_update(skip_locked=True).order_by('pk').values_list(
+                    'pk', 'sermon_id'
+                )[:batch_size]
+            )
+            if not queued:
+                return sermons, written
+            written += rebuild_for({sermon_id for _, sermon_id in queued})
+            # Sermons queued again while the batch was computed stay queued.
+            RelatedSermonRefresh.objects.filter(
+                pk__in=[pk for pk, _ in queued], queued_at__lte=claimed_at
+            ).delete()
+        sermons += len(queued)
@@ -0,0 +1,200 @@
+"""
+Scripture reference parsing for sermons app.
+
+Free-text references such as "Romans 8:28-39; 1 Cor 13" are parsed into
+normalized verse ranges. A position is encoded as ``chapter * 1000 + verse``
+so that "does this sermon cover Romans 8:28" becomes an interval overlap
+test on two integers within one book.
+"""
+import re
+from collections import namedtuple
+
+MAX_VERSE = 999
+
+# (number, canonical name, aliases). Aliases are compared lowercased with
+# dots and spaces removed, numbered books with a leading digit.
+BOOKS = [
+    (1, 'Genesis', ['gen', 'ge', 'gn']),
+    (2, 'Exodus', ['exod', 'exo', 'ex']),
+    (3, 'Leviticus', ['lev', 'le', 'lv']),
+    (4, 'Numbers', ['num', 'nu', 'nm', 'nb']),
+    (5, 'Deuteronomy', ['deut', 'de', 'dt']),
+    (6, 'Joshua', ['josh', 'jos', 'jsh']),
+    (7, 'Judges', ['judg', 'jdg', 'jg', 'jdgs']),
+    (8, 'Ruth', ['rth', 'ru', 'rt']),
+    (9, '1 Samuel', ['1sam', '1sa', '1sm']),
+    (10, '2 Samuel', ['2sam', '2sa', '2sm']),
+    (11, '1 Kings', ['1kgs', '1kg', '1ki', '1kin']),
+    (12, '2 Kings', ['2kgs', '2kg', '2ki', '2kin']),
+    (13, '1 Chronicles', ['1chron', '1chr', '1ch']),
+    (14, '2 Chronicles', ['2chron', '2chr', '2ch']),
+    (15, 'Ezra', ['ezr']),
+    (16, 'Nehemiah', ['neh', 'ne']),
+    (17, 'Esther', ['esth', 'est', 'es']),
+    (18, 'Job', ['jb']),
+    (19, 'Psalms', ['psalm', 'ps', 'psa', 'pss', 'psm', 'pslm']),
+    (20, 'Proverbs', ['prov', 'pro', 'prv', 'pr']),
+    (21, 'Ecclesiastes', ['eccl', 'eccles', 'ecc', 'ec', 'qoh']),
+    (22, 'Song of Solomon', ['songofsongs', 'song', 'sos', 'sng', 'ss', 'canticles']),
+    (23, 'Isaiah', ['isa', 'is']),
+    (24, 'Jeremiah', ['jer', 'je', 'jr']),
+    (25, 'Lamentations', ['lam', 'la', 'lm']),
+    (26, 'Ezekiel', ['ezek', 'eze', 'ezk']),
+    (27, 'Daniel', ['dan', 'da', 'dn']),
+    (28, 'Hosea', ['hos', 'ho']),
+    (29, 'Joel', ['jl']),
+    (30, 'Amos', ['am']),
+    (31, 'Obadiah', ['obad', 'ob']),
+    (32, 'Jonah', ['jnh', 'jon']),
+    (33, 'Micah', ['mic', 'mc', 'mi']),
+    (34, 'Nahum', ['nah', 'na']),
+    (35, 'Habakkuk', ['hab', 'hb']),
+    (36, 'Zephaniah', ['zeph', 'zep', 'zp']),
+    (37, 'Haggai', ['hag', 'hg']),
+    (38, 'Zechariah', ['zech', 'zec', 'zc']),
+    (39, 'Malachi', ['mal', 'ml']),
+    (40, 'Matthew', ['matt', 'mat', 'mtt', 'mt']),
+    (41, 'Mark', ['mrk', 'mar', 'mk', 'mr']),
+    (42, 'Luke', ['luk', 'lk', 'lu']),
+    (43, 'John', ['joh', 'jhn', 'jn']),
+    (44, 'Acts', ['act', 'ac']),
+    (45, 'Romans', ['rom', 'ro', 'rm']),
+    (46, '1 Corinthians', ['1cor', '1co']),
+    (47, '2 Corinthians', ['2cor', '2co']),
+    (48, 'Galatians', ['gal', 'ga']),
+    (49, 'Ephesians', ['ephes', 'eph']),
+    (50, 'Philippians', ['phil', 'php', 'pp']),
+    (51, 'Colossians', ['col']),
+    (52, '1 Thessalonians', ['1thess', '1thes', '1th']),
+    (53, '2 Thessalonians', ['2thess', '2thes', '2th']),
+    (54, '1 Timothy', ['1tim', '1ti', '1tm']),
+    (55, '2 Timothy', ['2tim', '2ti', '2tm']),
+    (56, 'Titus', ['tit']),
+    (57, 'Philemon', ['philem', 'phlm', 'phmn', 'phm', 'pm']),
+    (58, 'Hebrews', ['heb']),
+    (59, 'James', ['jas', 'jam', 'ja', 'jm']),
+    (60, '1 Peter', ['1pet', '1pe', '1pt']),
+    (61, '2 Peter', ['2pet', '2pe', '2pt']),
+    (62, '1 John', ['1joh', '1jhn', '1jn', '1jo']),
+    (63, '2 John', ['2joh', '2jhn', '2jn', '2jo']),
+    (64, '3 John', ['3joh', '3jhn', '3jn', '3jo']),
+    (65, 'Jude', ['jud', 'jd']),
+    (66, 'Revelation', ['revelations', 'rev', 're', 'rv']),
+]
+
+# Bible translation abbreviations, dropped wherever they appear
+# ("Hebrews 11:1 NIV"). Parenthesised notes without digits, such as
+# "(KJV)" or "(N.I.V.)", are dropped as well.
+TRANSLATIONS = [
+    'kjv', 'nkjv', 'akjv', 'niv', 'nirv', 'tniv', 'esv', 'nlt', 'nasb', 'nasb95', 'nasb1995', 'lsb',
+    'rsv', 'nrsv', 'nrsvue', 'asv', 'csb', 'hcsb', 'net', 'nab', 'nabre', 'amp', 'ampc', 'msg', 'tlb',
+    'gnt', 'gnb', 'cev', 'ceb', 'ncv', 'nkj', 'web', 'ylt', 'drb', 'tpt', 'erv', 'gw', 'isv', 'nog',
+]
+
+BOOK_CHOICES = [(number, name) for number, name, _ in BOOKS]
+SINGLE_CHAPTER_BOOKS = {31, 57, 63, 64, 65}
+
+_BOOK_LOOKUP = {}
+for _number, _name, _aliases in BOOKS:
+    for _alias in [_name] + _aliases:
+        _BOOK_LOOKUP[_alias.lower().replace(' ', '')] = _number
+
+ORDINAL_RE = re.compile(r'^(?:(first|1st|i)|(second|2nd|ii)|(third|3rd|iii))\s+')
+TRANSLATION_RE = re.compile(r'\([^)\d]*\)|\b(?:%s)\b' % '|'.join(TRANSLATIONS))
+VERSE_MARKER_RE = re.compile(r'(\d)\s*(?:vv?\.?|verses?)\s*(\d)')
+SEGMENT_RE = re.compile(r'^(?P<book>(?:[1-3]\s*)?[a-z][a-z .]*?)?\s*(?P<spec>\d[\d:.\-\s]*)?$')
+SPEC_RE = re.compile(r'^(\d+)(?:[:.](\d+))?(?:-(\d+)(?:[:.](\d+))?)?$')
+
+
+class ScriptureRange(namedtuple('ScriptureRange', 'book chapter verse_start chapter_end verse_end')):
+    """
+    An inclusive verse range within one book.
+    """
+    __slots__ = ()
+
+    @property
+    def start(self):
+        return self.chapter * 1000 + self.verse_start
+
+    @property
+    def end(self):
+        return self.chapter_end * 1000 + self.verse_end
+
+
+def lookup_book(name):
+    """
+    Return the book number for a name or abbreviation, or None.
+    """
+    name = name.lower().replace('.', ' ').strip()
+    match = ORDINAL_RE.match(name)
+    if match:
+        name = str(match.lastindex) + name[match.end():]
+    return _BOOK_LOOKUP.get(re.sub(r'\s+', '', name))
+
+
+def parse_references(text):
+    """
+    Parse free text into a list of ``ScriptureRange``.
+
+    Segments are separated by ``;``, ``,``, ``&`` or "and". A segment
+    without a book name continues the previous book, and after a verse
+    reference a bare number is read as another verse of the same chapter
+    ("John 3:16, 18"). Unrecognised segments are skipped.
+    """
+    text = (text or '').lower()
+    text = TRANSLATION_RE.sub(' ', text).replace('(', ' ').replace(')', ' ')
+    text = re.sub(r'[‐-―]', '-', text)
+    text = re.sub(r'(\d+)[a-c]\b', r'\1', text)
+    text = VERSE_MARKER_RE.sub(r'\1:\2', text)
+
+    ranges = []
+    book = chapter = None
+    verse_mode = False
+    for segment in re.split(r'[;,&]|\band\b', text):
+        segment = segment.strip()
+        if not segment:
+            continue
+        match = SEGMENT_RE.match(segment)
+        if not match:
+            continue
+        if match.group('book'):
+            book = lookup_book(match.group('book'))
+            chapter, verse_mode = None, False
+        if book is None:
+            continue
+
+        spec = re.sub(r'\s+', '', match.group('spec') or '')
+        if not spec:
+            ranges.append(ScriptureRange(book, 1, 1, MAX_VERSE, MAX_VERSE))
+            continue
+        spec_match = SPEC_RE.match(spec)
+        if not spec_match:
+            continue
+        first, first_verse, second, second_verse = (
+            int(value) if value else None for value in spec_match.groups()
+        )
+
+        if first_verse is None and (book in SINGLE_CHAPTER_BOOKS or (verse_mode and not match.group('book'))):
+            # Bare numbers are verses: "Jude 3", or "John 3:16, 18".
+            chapter = chapter or 1
+            if second_verse is not None:
+                scripture_range = ScriptureRange(book, chapter, first, second, second_verse)
+                chapter = second
+            else:
+                scripture_range = ScriptureRange(book, chapter, first, chapter, second or first)
+            verse_mode = True
+        elif first_verse is None:
+            # Whole chapters: "John 3" or "John 3-4" ("John 3-4:5" ends mid-chapter).
+            last = second or first
+            scripture_range = ScriptureRange(book, first, 1, last, second_verse or MAX_VERSE)
+            chapter, verse_mode = last, second_verse is not None
+        elif second_verse is not None:
+            scripture_range = ScriptureRange(book, first, first_verse, second, second_verse)
+            chapter, verse_mode = second, True
+        else:
+            scripture_range = ScriptureRange(book, first, first_verse, first, second or first_verse)
+            chapter, verse_mode = first, True
+
+        if scripture_range.start <= scripture_range.end and scripture_range not in ranges:
+            ranges.append(scripture_range)
+    return ranges
@@ -0,0 +1,69 @@
+"""
+Full-text search for sermons app.
+
+On PostgreSQL sermons carry a weighted ``search_vector`` column backed by a
+GIN index and results are ordered by relevance. Other databases (SQLite in
+development) fall back to ``icontains`` matching.
+"""
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Index, Q
+
+
+class SearchVectorIndex(GinIndex):
+    """
+    GIN index on PostgreSQL; a plain index elsewhere so that development
+    databases can still be created from the same models.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Index.create_sql(self, model, schema_editor, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+
+def search_config():
+    return getattr(settings, 'SERMON_SEARCH_CONFIG', 'english')
+
+
+def sermon_search_vector():
+    """
+    Weighted vector over a sermon's own text columns.
+    """
+    config = search_config()
+    return (
+        SearchVector('title', weight='A', config=config) +
+        SearchVector('scripture_reference', weight='B', config=config) +
+        SearchVector('description', weight='C', config=config)
+    )
+
+
+def full_text_supported():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vector(queryset):
+    """
+    Recompute ``search_vector`` for the given sermons in one UPDATE.
+    """
+    if not full_text_supported():
+        return 0
+    return queryset.update(search_vector=sermon_search_vector())
+
+
+def search_sermons(queryset, query):
+    """
+    Filter ``queryset`` to sermons matching ``query``, most relevant first.
+    """
+    if not full_text_supported():
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(scripture_reference__icontains=query)
+        )
+    search_query = SearchQuery(query, search_type='websearch', config=search_config())
+    return queryset.filter(search_vector=search_query).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-rank', '-date_preached')
@@ -3,16 +3,18 @@ Serializers for sermons app.
 """
 from rest_framework import serializers
 from taggit.serializers import TagListSerializerField, TaggitSerializer
-from .models import SermonSeries, Sermon, SermonComment, SermonPlaylist, PlaylistItem
+from apps.core.images import ImageVariantsField
+from .models import SermonSeries, Sermon, SermonComment, SermonPlaylist, PlaylistItem, RelatedSermon
 
 
 class SermonSeriesSerializer(serializers.ModelSerializer):
     sermon_count = serializers.ReadOnlyField()
+    image_variants = ImageVariantsField(source='image')
     
     class Meta:
         model = SermonSeries
         fields = [
-            'id', 'title', 'description', 'image', 'start_date', 
+            'id', 'title', 'description', 'image', 'image_variants', 'start_date', 
             'end_date', 'is_active', 'sermon_count', 'created_at'
         ]
 
@@ -21,14 +23,31 @@ class SermonListSerializer(TaggitSerializer, serializers.ModelSerializer):
     preacher_name = serializers.CharField(source='preacher.name', read_only=True)
     series_title = serializers.CharField(source='series.title', read_only=True)
     tags = TagListSerializerField()
+    thumbnail_variants = ImageVariantsField(source='thumbnail')
     
     class Meta:
         model = Sermon
         fields = [
             'id', 'title', 'description', 'preacher', 'preacher_name',
-            'series', 'series_title', 'scripture_reference', 'thumbnail',
+            'series', 'series_title', 'scripture_reference', 'thumbnail', 'thumbnail_variants',
             'date_preached', 'duration_minutes', 'view_count', 'download_count',
-            'is_published', 'is_featured', 'tags', 'created_at'
+            'has_audio', 'has_video', 'has_notes', 'is_published', 'is_featured', 'tags', 'created_at'
+        ]
+
+
+class RelatedSermonSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='related.id', read_only=True)
+    title = serializers.CharField(source='related.title', read_only=True)
+    preacher_name = serializers.CharField(source='related.preacher.name', read_only=True)
+    scripture_reference = serializers.CharField(source='related.scripture_reference', read_only=True)
+    date_preached = serializers.DateTimeField(source='related.date_preached', read_only=True)
+    thumbnail = serializers.ImageField(source='related.thumbnail', read_only=True)
+    
+    class Meta:
+        model = RelatedSermon
+        fields = [
+            'id', 'title', 'preacher_name', 'scripture_reference', 'date_preached',
+            'thumbnail', 'score'
         ]
 
 
@@ -37,20 +56,29 @@ class SermonDetailSerializer(TaggitSerializer, serializers.ModelSerializer):
     preacher_photo = serializers.ImageField(source='preacher.photo', read_only=True)
     series_title = serializers.CharField(source='series.title', read_only=True)
     tags = TagListSerializerField()
+    thumbnail_variants = ImageVariantsField(source='thumbnail')
     comments_count = serializers.SerializerMethodField()
+    related_sermons = serializers.SerializerMethodField()
     
     class Meta:
         model = Sermon
         fields = [
             'id', 'title', 'description', 'preacher', 'preacher_name', 'preacher_photo',
             'series', 'series_title', 'scripture_reference', 'audio_file', 'video_file',
-            'video_url', 'sermon_notes', 'thumbnail', 'date_preached', 'duration_minutes',
-            'view_count', 'download_count', 'is_published', 'is_featured', 'tags',
-            'comments_count', 'created_at', 'updated_at'
+            'video_url', 'sermon_notes', 'thumbnail', 'thumbnail_variants', 'date_preached', 'duration_minutes',
+            'view_count', 'download_count', 'has_audio', 'has_video', 'has_notes',
+            'is_published', 'is_featured', 'tags',
+            'comments_count', 'related_sermons', 'created_at', 'updated_at'
         ]
     
     def get_comments_count(self, obj):
         return obj.comments.filter(is_approved=True).count()
+    
+    def get_related_sermons(self, obj):
+        links = obj.related_links.all()
+        if 'related_links' not in getattr(obj, '_prefetched_objects_cache', {}):
+            links = links.filter(related__is_published=True).select_related('related__preacher')
+        return RelatedSermonSerializer(links, many=True, context=self.context).data
 
 
 class SermonCommentSerializer(serializers.ModelSerializer):
@@ -66,6 +94,13 @@ class SermonCommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'is_approved']
     
     def get_replies(self, obj):
+        reply_map = self.context.get('reply_map')
+        if reply_map is not None:
+            return SermonCommentSerializer(
+                reply_map.get(obj.id, []),
+                many=True,
+                context=self.context
+            ).data
         if obj.replies.exists():
             return SermonCommentSerializer(
                 obj.replies.filter(is_approved=True), 
@@ -109,9 +144,27 @@ class SermonPlaylistSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_by']
     
     def get_sermons_count(self, obj):
+        if 'playlistitem_set' in getattr(obj, '_prefetched_objects_cache', {}):
+            return len(obj.playlistitem_set.all())
         return obj.sermons.count()
 
 
+class PlaylistItemsUpdateSerializer(serializers.Serializer):
+    """
+    The complete, ordered list of sermon ids a playlist should contain.
+    """
+    sermons = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=True)
+    
+    def validate_sermons(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("A sermon can only appear once in a playlist.")
+        found = set(Sermon.objects.filter(pk__in=value, is_published=True).values_list('pk', flat=True))
+        missing = [pk for pk in value if pk not in found]
+        if missing:
+            raise serializers.ValidationError(f"Unknown sermons: {missing}")
+        return value
+
+
 class SermonPlaylistCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = SermonPlaylist
@@ -0,0 +1,111 @@
+"""
+Signal handlers for sermons app.
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from taggit.models import Tag
+
+from apps.core.models import ChurchInfo, Staff
+from .facets import bump_facets_version
+from .feeds import bump_feeds_version, invalidate_feeds, sermon_scopes
+from .models import RelatedSermon, Sermon, SermonScriptureRange, SermonSeries
+from .related import queue_refresh
+from .search import update_search_vector
+
+SEARCH_FIELDS = {'title', 'description', 'scripture_reference'}
+RELATED_FIELDS = SEARCH_FIELDS | {'is_published'}
+
+
+@receiver(post_save, sender=Sermon)
+def refresh_search_vector(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep ``Sermon.search_vector`` in step with the indexed text columns.
+    """
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    update_search_vector(Sermon.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Sermon)
+def refresh_scripture_ranges(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the parsed verse ranges in step with ``scripture_reference``.
+    """
+    if update_fields is not None and 'scripture_reference' not in update_fields:
+        return
+    SermonScriptureRange.objects.rebuild_for([instance])
+
+
+@receiver(post_save, sender=Sermon)
+@receiver(post_delete, sender=Sermon)
+@receiver(m2m_changed, sender=Sermon.tags.through)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Staff)
+@receiver(post_save, sender=SermonSeries)
+def invalidate_facets(sender, **kwargs):
+    """
+    Drop every cached facet count when the data behind them changes.
+    """
+    bump_facets_version()
+
+
+@receiver(post_save, sender=Sermon)
+def refresh_related_sermons(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    Queue the related-sermon lists touched by a publish, unpublish or edit.
+    """
+    if update_fields is not None and not RELATED_FIELDS.intersection(update_fields):
+        return
+    if created and not instance.is_published:
+        return
+    queue_refresh([instance.pk])
+
+
+@receiver(pre_delete, sender=Sermon)
+def refresh_related_sermons_delete(sender, instance, **kwargs):
+    # The lists it appears in lose that row by cascade; queue them to refill.
+    queue_refresh([instance.pk] + list(
+        RelatedSermon.objects.filter(related=instance).values_list('sermon_id', flat=True)
+    ))
+
+
+@receiver(m2m_changed, sender=Sermon.tags.through)
+def refresh_related_sermons_tags(sender, instance, action, reverse=False, pk_set=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        queue_refresh([instance.pk])
+    elif pk_set:
+        queue_refresh(pk_set)
+
+
+@receiver(pre_save, sender=Sermon)
+def remember_feed_scopes(sender, instance, update_fields=None, **kwargs):
+    """
+    Note the feeds a sermon was in before the save, in case it moves.
+    """
+    instance._previous_feed_scopes = []
+    if update_fields is not None and not {'series', 'preacher'}.intersection(update_fields):
+        return
+    if instance.pk:
+        previous = Sermon.objects.filter(pk=instance.pk).values('series_id', 'preacher_id').first()
+        if previous:
+            instance._previous_feed_scopes = sermon_scopes(previous['series_id'], previous['preacher_id'])
+
+
+@receiver(post_save, sender=Sermon)
+@receiver(post_delete, sender=Sermon)
+def invalidate_sermon_feeds(sender, instance, **kwargs):
+    """
+    Drop the cached podcast feeds a sermon appears (or appeared) in.
+    """
+    scopes = sermon_scopes(instance.series_id, instance.preacher_id)
+    invalidate_feeds(set(scopes + getattr(instance, '_previous_feed_scopes', [])))
+
+
+@receiver(post_save, sender=ChurchInfo)
+@receiver(post_save, sender=Staff)
+@receiver(post_save, sender=SermonSeries)
+def invalidate_all_feeds(sender, **kwargs):
+    bump_feeds_version()
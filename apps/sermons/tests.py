@@ -0,0 +1,468 @@
+"""
+Tests for sermons app.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from PIL import Image
+
+from apps.core.images import _build_safely, pending
+from apps.core.models import Staff
+from .counters import SermonViewCounter, sermon_downloads, sermon_views
+from .facets import normalize_filters
+from .media import sermon_media_storage
+from .recommendations import refresh_recommendations
+from .related import refresh_pending
+from .scripture import MAX_VERSE, ScriptureRange, parse_references
+from .models import (
+    RelatedSermonRefresh, Sermon, SermonCooccurrence, SermonDownload, SermonRecommendation, SermonSeries
+)
+
+
+def make_sermon(**kwargs):
+    preacher = kwargs.pop('preacher', None) or Staff.objects.create(name='Test Preacher', position='pastor')
+    kwargs.setdefault('title', 'Walking by Faith')
+    kwargs.setdefault('description', 'A sermon about faith.')
+    kwargs.setdefault('is_published', True)
+    return Sermon.objects.create(preacher=preacher, **kwargs)
+
+
+@override_settings(SERMON_VIEW_COUNT_FLUSH_INTERVAL=3600)
+class BufferedViewCounterTests(TransactionTestCase):
+    """
+    ``sermon_views`` must not lose increments when many request threads
+    hit it while a flush is writing the buffer back.
+    """
+    threads = 8
+    views_per_thread = 250
+
+    def tearDown(self):
+        sermon_views.flush()
+
+    def test_concurrent_increments_are_all_written(self):
+        sermon = make_sermon()
+        start = threading.Barrier(self.threads + 1)
+        done = threading.Event()
+        errors = []
+
+        def view():
+            start.wait()
+            for _ in range(self.views_per_thread):
+                sermon_views.increment(sermon.pk)
+
+        def flusher():
+            start.wait()
+            try:
+                while not done.is_set():
+                    sermon_views.flush()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        flush_thread = threading.Thread(target=flusher)
+        workers = [threading.Thread(target=view) for _ in range(self.threads)]
+        for thread in workers + [flush_thread]:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        done.set()
+        flush_thread.join()
+        sermon_views.flush()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sermon_views.pending(sermon.pk), 0)
+        sermon.refresh_from_db()
+        self.assertEqual(sermon.view_count, self.threads * self.views_per_thread)
+        self.assertEqual(sermon.daily_views.get().views, self.threads * self.views_per_thread)
+
+    def test_views_outlive_the_worker_that_counted_them(self):
+        sermon = make_sermon()
+        for _ in range(3):
+            sermon_views.increment(sermon.pk)
+        # A fresh counter stands in for another process, e.g. the cron flush.
+        self.assertEqual(SermonViewCounter().flush(), 1)
+        self.assertEqual(sermon_views.pending(sermon.pk), 0)
+        sermon.refresh_from_db()
+        self.assertEqual(sermon.view_count, 3)
+        self.assertEqual(sermon.daily_views.get().date, timezone.localdate())
+
+
+@override_settings(SERMON_DOWNLOAD_FLUSH_INTERVAL=3600)
+class DownloadQueueTests(TestCase):
+
+    def tearDown(self):
+        sermon_downloads.flush()
+
+    def test_bad_events_do_not_block_the_queue(self):
+        sermon = make_sermon()
+        user = User.objects.create_user('listener')
+        deleted = User.objects.create_user('gone')
+        deleted_id = deleted.pk
+        deleted.delete()
+
+        sermon_downloads.enqueue(sermon.pk, '10.0.0.1', 'audio', user_id=user.pk)
+        sermon_downloads.enqueue(sermon.pk, '10.0.0.2', 'audio', user_id=deleted_id)
+        sermon_downloads.enqueue(sermon.pk, 'not-an-ip', 'audio')
+
+        self.assertEqual(sermon_downloads.flush(), 2)
+        self.assertEqual(sermon_downloads.flush(), 0)
+        self.assertEqual(
+            sorted(SermonDownload.objects.values_list('ip_address', 'user_id')),
+            [('10.0.0.1', user.pk), ('10.0.0.2', None)]
+        )
+        sermon.refresh_from_db()
+        self.assertEqual(sermon.download_count, 2)
+
+    def test_unknown_or_unpublished_sermon_is_404(self):
+        draft = make_sermon(is_published=False)
+        for pk in (draft.pk, draft.pk + 1000):
+            response = self.client.post(reverse('track-download', kwargs={'sermon_id': pk}), {'file_type': 'audio'})
+            self.assertEqual(response.status_code, 404)
+
+
+@override_settings(SERMON_VIEW_COUNT_FLUSH_INTERVAL=3600)
+class SermonQueryBudgetTests(TestCase):
+    """
+    List and detail endpoints load preacher, series and tags in a fixed
+    number of queries, however many sermons are returned.
+    """
+    # count, rows with preacher and series, tags
+    list_endpoints = ['sermon-list', 'featured-sermons', 'recent-sermons', 'popular-sermons']
+    list_queries = 3
+
+    def setUp(self):
+        self.preacher = Staff.objects.create(name='Test Preacher', position='pastor')
+        self.series = SermonSeries.objects.create(title='Faith', start_date='2024-01-01')
+
+    def add_sermons(self, count):
+        start = Sermon.objects.count()
+        for number in range(start, start + count):
+            sermon = make_sermon(
+                title=f'Sermon {number}', preacher=self.preacher, series=self.series, is_featured=True
+            )
+            sermon.tags.add('faith', f'topic-{number}')
+
+    def tearDown(self):
+        sermon_views.flush()
+
+    def test_list_endpoints(self):
+        for rows in (1, 8):
+            self.add_sermons(rows - Sermon.objects.count())
+            for name in self.list_endpoints:
+                with self.subTest(endpoint=name, rows=rows), self.assertNumQueries(self.list_queries):
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_detail_endpoint(self):
+        self.add_sermons(3)
+        sermon = Sermon.objects.first()
+        # sermon with preacher and series, tags, related sermons, comment count
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('sermon-detail', kwargs={'pk': sermon.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['tags']), 2)
+
+
+class SermonCursorPaginationTests(TestCase):
+    """
+    Cursor pages over sermons preached at the same moment neither skip nor
+    repeat rows, even when sermons are added between requests.
+    """
+
+    def setUp(self):
+        self.preacher = Staff.objects.create(name='Test Preacher', position='pastor')
+        self.preached = timezone.now() - timedelta(days=7)
+        self.sermon_ids = [
+            make_sermon(title=f'Sermon {number}', preacher=self.preacher, date_preached=self.preached).pk
+            for number in range(45)
+        ][::-1]
+
+    def tearDown(self):
+        sermon_views.flush()
+
+    def pages(self, url, link):
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            yield [sermon['id'] for sermon in response.data['results']]
+            url = response.data[link]
+
+    def test_pages_are_stable_under_inserts(self):
+        seen = []
+        for page in self.pages(reverse('sermon-list') + '?pagination=cursor', 'next'):
+            seen.extend(page)
+            make_sermon(title='Late arrival', preacher=self.preacher, date_preached=self.preached)
+        # Newer sermons sort ahead of the cursor, so they never shift later pages.
+        self.assertEqual(seen, self.sermon_ids)
+
+    def test_previous_link_walks_back(self):
+        url = reverse('sermon-list') + '?pagination=cursor'
+        forward = list(self.pages(url, 'next'))
+        last = self.client.get(url)
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        backward = list(self.pages(last.data['previous'], 'previous'))
+        self.assertEqual(backward, forward[-2::-1])
+
+
+@override_settings(SERMON_DOWNLOAD_FLUSH_INTERVAL=3600)
+class SermonMediaTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def tearDown(self):
+        sermon_downloads.flush()
+
+    def test_accel_redirect_path_is_quoted(self):
+        with self.settings(
+            MEDIA_ROOT=self.media_root,
+            SERMON_MEDIA_SENDFILE='x-accel-redirect',
+            SERMON_MEDIA_ACCEL_PREFIX='/protected-media/'
+        ):
+            # Names set outside the upload path are not sanitised.
+            name = 'sermons/audio/Grace & Truth #1?é.mp3'
+            os.makedirs(os.path.join(self.media_root, 'sermons', 'audio'))
+            with open(os.path.join(self.media_root, name), 'wb') as fh:
+                fh.write(b'ID3')
+            sermon = make_sermon(audio_file=name)
+            response = self.client.get(
+                reverse('sermon-media', kwargs={'pk': sermon.pk, 'file_type': 'audio'})
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/sermons/audio/Grace%20%26%20Truth%20%231%3F%C3%A9.mp3'
+        )
+
+    def test_only_sermon_media_use_the_media_storage(self):
+        with self.settings(SERMON_MEDIA_STORAGE={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': self.media_root},
+        }):
+            storage = sermon_media_storage()
+        self.assertIsInstance(storage, FileSystemStorage)
+        self.assertEqual(storage.location, self.media_root)
+        for name in ('audio_file', 'video_file', 'sermon_notes'):
+            self.assertIs(Sermon._meta.get_field(name)._storage_callable, sermon_media_storage)
+        self.assertIs(Sermon._meta.get_field('thumbnail').storage, default_storage)
+
+
+class ImageVariantTests(TestCase):
+    """
+    Variant URLs point at derivatives only once they have been built.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = self.settings(MEDIA_ROOT=media_root, IMAGE_VARIANTS={'thumb': 32})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def thumbnail_variants(self, sermon):
+        response = self.client.get(reverse('sermon-detail', kwargs={'pk': sermon.pk}))
+        sermon_views.flush()
+        return response.data['thumbnail'], response.data['thumbnail_variants']
+
+    def test_original_until_derivatives_are_built(self):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 48), 'purple').save(buffer, 'PNG')
+        sermon = make_sermon()
+        sermon.thumbnail.save('cover.png', ContentFile(buffer.getvalue()))
+
+        original, variants = self.thumbnail_variants(sermon)
+        self.assertEqual(variants, {'thumb': {'webp': original, 'jpeg': original}})
+
+        _build_safely(Sermon, 'thumbnail', sermon.thumbnail.name)
+        original, variants = self.thumbnail_variants(sermon)
+        self.assertTrue(variants['thumb']['webp'].endswith('/derivatives/sermons/thumbnails/cover_thumb.webp'))
+        self.assertTrue(variants['thumb']['jpeg'].endswith('/derivatives/sermons/thumbnails/cover_thumb.jpg'))
+
+    def test_failed_build_keeps_the_original(self):
+        sermon = make_sermon()
+        sermon.thumbnail.save('broken.png', ContentFile(b'not an image'))
+        with self.assertLogs('apps.core.images', 'ERROR'):
+            _build_safely(Sermon, 'thumbnail', sermon.thumbnail.name)
+        original, variants = self.thumbnail_variants(sermon)
+        self.assertEqual(variants, {'thumb': {'webp': original, 'jpeg': original}})
+
+    def test_uploads_are_queued_for_the_build_command(self):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 48), 'purple').save(buffer, 'PNG')
+        sermon = make_sermon()
+        sermon.thumbnail.save('cover.png', ContentFile(buffer.getvalue()))
+        broken = make_sermon()
+        broken.thumbnail.save('broken.png', ContentFile(b'not an image'))
+        self.assertEqual(pending(Sermon, 'thumbnail').count(), 2)
+
+        stdout = StringIO()
+        # Closing the connection would end the test's transaction.
+        with mock.patch('apps.core.management.commands.build_image_derivatives.connections'):
+            call_command('build_image_derivatives', workers=1, stdout=stdout, stderr=StringIO())
+        self.assertIn('Processed 2 image(s): 2 derivative(s) written, 1 failed.', stdout.getvalue())
+        self.assertEqual(list(pending(Sermon, 'thumbnail')), [broken])
+        original, variants = self.thumbnail_variants(sermon)
+        self.assertTrue(variants['thumb']['webp'].endswith('/derivatives/sermons/thumbnails/cover_thumb.webp'))
+
+
+class FacetCacheKeyTests(TestCase):
+
+    def test_tag_case_is_kept(self):
+        self.assertNotEqual(normalize_filters({'tags': 'Faith'}), normalize_filters({'tags': 'faith'}))
+        self.assertEqual(
+            normalize_filters({'tags': ' Hope, Faith,Hope '}), normalize_filters({'tags': 'Faith,Hope'})
+        )
+
+    def test_case_insensitive_filters_are_folded(self):
+        self.assertEqual(
+            normalize_filters({'has_audio': 'True', 'scripture': 'John 3:16'}),
+            normalize_filters({'has_audio': 'true', 'scripture': 'john 3:16'})
+        )
+
+
+class RelatedSermonQueueTests(TestCase):
+    """
+    A sermon edited while its refresh is being computed stays queued.
+    """
+
+    def test_edit_during_refresh_is_not_dequeued(self):
+        sermon = make_sermon()
+        self.assertTrue(RelatedSermonRefresh.objects.filter(sermon_id=sermon.pk).exists())
+        batches = []
+
+        def rebuild_for(sermon_ids):
+            batches.append(sermon_ids)
+            if len(batches) == 1:
+                sermon.title = 'Walking by Sight'
+                sermon.save()
+            return 0
+
+        with mock.patch('apps.sermons.related.rebuild_for', side_effect=rebuild_for):
+            self.assertEqual(refresh_pending(), (2, 0))
+        self.assertEqual(batches, [{sermon.pk}, {sermon.pk}])
+        self.assertFalse(RelatedSermonRefresh.objects.exists())
+
+
+@override_settings(SERMON_RECOMMENDATIONS_MIN_COOCCURRENCE=1)
+class RecommendationRefreshTests(TestCase):
+
+    def setUp(self):
+        preacher = Staff.objects.create(name='Test Preacher', position='pastor')
+        self.first, self.second = make_sermon(preacher=preacher), make_sermon(preacher=preacher)
+        self.user = User.objects.create_user('listener')
+
+    def download(self, sermon, user=None, age=timedelta(hours=1)):
+        download = SermonDownload.objects.create(
+            sermon=sermon, user=user, ip_address='10.0.0.1', file_type='audio'
+        )
+        SermonDownload.objects.filter(pk=download.pk).update(created_at=timezone.now() - age)
+
+    def test_recent_rows_wait_for_the_next_run(self):
+        self.download(self.first, self.user)
+        self.download(self.second, self.user, age=timedelta(seconds=5))
+        refresh_recommendations()
+        self.assertFalse(SermonRecommendation.objects.exists())
+
+        SermonDownload.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        refresh_recommendations()
+        self.assertEqual(
+            set(SermonRecommendation.objects.values_list('sermon_id', 'related_id')),
+            {(self.first.pk, self.second.pk), (self.second.pk, self.first.pk)}
+        )
+
+    def test_anonymous_downloads_are_ignored(self):
+        # Two anonymous listeners behind one proxy share an address.
+        self.download(self.first)
+        self.download(self.second)
+        refresh_recommendations()
+        self.assertFalse(SermonCooccurrence.objects.exists())
+
+
+class ScriptureParserTests(TestCase):
+
+    def assertParses(self, text, *ranges):
+        self.assertEqual(parse_references(text), [ScriptureRange(*scripture_range) for scripture_range in ranges])
+
+    def test_verse_and_chapter_ranges(self):
+        self.assertParses('Romans 8:28-39', (45, 8, 28, 8, 39))
+        self.assertParses('John 3-4:5', (43, 3, 1, 4, 5))
+        self.assertParses('1 Cor 13', (46, 13, 1, 13, MAX_VERSE))
+        self.assertParses('John 3:16, 18; Jude 3', (43, 3, 16, 3, 16), (43, 3, 18, 3, 18), (65, 1, 3, 1, 3))
+
+    def test_translation_tags_are_ignored(self):
+        self.assertParses('Hebrews 11:1 NIV', (58, 11, 1, 11, 1))
+        self.assertParses('John 14:6 (KJV)', (43, 14, 6, 14, 6))
+        self.assertParses('Psalm 23 (N.I.V.); Romans 12:1-2 NKJV', (19, 23, 1, 23, MAX_VERSE), (45, 12, 1, 12, 2))
+
+    def test_short_abbreviations(self):
+        self.assertParses('Is 53', (23, 53, 1, 53, MAX_VERSE))
+        self.assertParses('Is. 53:5', (23, 53, 5, 53, 5))
+        self.assertParses('Mr 16:15', (41, 16, 15, 16, 15))
+        self.assertParses('Ja 1:2-4', (59, 1, 2, 1, 4))
+        self.assertParses('Phlm 6', (57, 1, 6, 1, 6))
+        self.assertParses('Rv 21:4', (66, 21, 4, 21, 4))
+
+    def test_unknown_book_is_skipped(self):
+        self.assertParses('Hezekiah 3:1')
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver', 'api.example.org', 'other.example.org'],
+    SERMON_FEED_API_URL='https://api.example.org'
+)
+class SermonFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.preacher = Staff.objects.create(name='Test Preacher', position='pastor')
+        self.older = make_sermon(title='Older', preacher=self.preacher, audio_file='sermons/audio/older.mp3')
+        self.newer = make_sermon(title='Newer', preacher=self.preacher, audio_file='sermons/audio/newer.mp3')
+
+    def get_feed(self, **extra):
+        return self.client.get(reverse('sermon-feed', kwargs={'fmt': 'rss'}), **extra)
+
+    def test_urls_come_from_settings(self):
+        content = self.get_feed(HTTP_HOST='other.example.org').content.decode()
+        self.assertNotIn('other.example.org', content)
+        self.assertIn(f'https://api.example.org/api/sermons/{self.older.pk}/media/audio/', content)
+        self.assertIn('https://api.example.org/api/sermons/feed/rss/', content)
+        self.assertEqual(self.get_feed(HTTP_HOST='api.example.org').content.decode(), content)
+
+    def test_unpublishing_moves_last_modified(self):
+        first = self.get_feed()
+        later = parse_http_date(first['Last-Modified']) + 60
+        with mock.patch('apps.sermons.feeds.time.time', return_value=later):
+            self.newer.is_published = False
+            self.newer.save()
+        response = self.get_feed(HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(parse_http_date(response['Last-Modified']), int(later))
+        self.assertNotIn(b'Newer', response.content)
+
+    def test_preacher_edit_moves_last_modified(self):
+        first = self.get_feed()
+        later = parse_http_date(first['Last-Modified']) + 60
+        with mock.patch('apps.sermons.feeds.time.time', return_value=later):
+            self.preacher.name = 'Renamed Preacher'
+            self.preacher.save()
+        response = self.get_feed(HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Renamed Preacher', response.content)
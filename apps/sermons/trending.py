@@ -0,0 +1,71 @@
+"""
+Trending sermons leaderboard for sermons app.
+
+Sermons are scored from recent daily views and downloads with exponential
+time decay, and the top entries are stored in ``TrendingSermon`` so that
+serving the leaderboard is a plain indexed read.
+"""
+import heapq
+import math
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import SermonDailyViews, SermonDownload, TrendingSermon
+
+
+def decay_weight(age_days, half_life_days):
+    return math.exp(-math.log(2) * age_days / half_life_days)
+
+
+def score_sermons(now=None):
+    """
+    Return ``{sermon_id: score}`` for published sermons with recent activity.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    half_life = settings.SERMON_TRENDING_HALF_LIFE_DAYS
+    since = today - timedelta(days=settings.SERMON_TRENDING_WINDOW_DAYS)
+    download_weight = settings.SERMON_TRENDING_DOWNLOAD_WEIGHT
+
+    scores = defaultdict(float)
+    views = SermonDailyViews.objects.filter(
+        date__gte=since,
+        sermon__is_published=True
+    ).values_list('sermon_id', 'date', 'views')
+    for sermon_id, date, count in views.iterator():
+        scores[sermon_id] += count * decay_weight((today - date).days, half_life)
+
+    # A range on the raw column (not created_at__date) so the index is used.
+    downloads = SermonDownload.objects.filter(
+        created_at__gte=timezone.make_aware(datetime.combine(since, time.min)),
+        sermon__is_published=True
+    ).annotate(day=TruncDate('created_at')).order_by().values('sermon_id', 'day').annotate(
+        count=Count('id')
+    ).values_list('sermon_id', 'day', 'count')
+    for sermon_id, day, count in downloads.iterator():
+        scores[sermon_id] += download_weight * count * decay_weight((today - day).days, half_life)
+
+    return scores
+
+
+def rebuild_trending(now=None):
+    """
+    Recompute the leaderboard and replace ``TrendingSermon`` atomically.
+    """
+    now = now or timezone.now()
+    scores = score_sermons(now)
+    top = heapq.nlargest(settings.SERMON_TRENDING_SIZE, scores.items(), key=lambda item: (item[1], item[0]))
+    entries = [
+        TrendingSermon(sermon_id=sermon_id, rank=rank, score=score, computed_at=now)
+        for rank, (sermon_id, score) in enumerate(top, start=1)
+    ]
+    with transaction.atomic():
+        TrendingSermon.objects.all().delete()
+        TrendingSermon.objects.bulk_create(entries)
+    return len(entries)
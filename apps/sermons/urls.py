@@ -15,7 +15,15 @@ urlpatterns = [
     path('featured/', views.FeaturedSermonsView.as_view(), name='featured-sermons'),
     path('recent/', views.RecentSermonsView.as_view(), name='recent-sermons'),
     path('popular/', views.PopularSermonsView.as_view(), name='popular-sermons'),
-    path('search/', views.sermon_search, name='sermon-search'),
+    path('trending/', views.TrendingSermonsView.as_view(), name='trending-sermons'),
+    path('search/', views.SermonSearchView.as_view(), name='sermon-search'),
+    path('facets/', views.sermon_facets_view, name='sermon-facets'),
+    path('<int:pk>/also-downloaded/', views.AlsoDownloadedSermonsView.as_view(), name='also-downloaded-sermons'),
+    
+    # Podcast feeds
+    path('feed/<str:fmt>/', views.sermon_feed, name='sermon-feed'),
+    path('series/<int:series_id>/feed/<str:fmt>/', views.sermon_feed, name='sermon-series-feed'),
+    path('preachers/<int:preacher_id>/feed/<str:fmt>/', views.sermon_feed, name='sermon-preacher-feed'),
     
     # Comments
     path('<int:sermon_id>/comments/', views.SermonCommentListView.as_view(), name='sermon-comments'),
@@ -25,7 +33,9 @@ urlpatterns = [
     path('playlists/', views.SermonPlaylistListView.as_view(), name='playlist-list'),
     path('playlists/create/', views.SermonPlaylistCreateView.as_view(), name='playlist-create'),
     path('playlists/<int:pk>/', views.SermonPlaylistDetailView.as_view(), name='playlist-detail'),
+    path('playlists/<int:pk>/items/', views.SermonPlaylistItemsView.as_view(), name='playlist-items'),
     
     # Downloads
     path('<int:sermon_id>/download/', views.track_sermon_download, name='track-download'),
+    path('<int:pk>/media/<str:file_type>/', views.sermon_media, name='sermon-media'),
 ]
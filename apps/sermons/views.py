@@ -5,33 +5,59 @@ from rest_framework import generics, status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
-from django.http import Http404
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
 
-from .models import SermonSeries, Sermon, SermonComment, SermonPlaylist, SermonDownload
+from .models import (
+    SermonSeries, Sermon, SermonComment, SermonPlaylist, PlaylistItem, SermonDownload, RelatedSermon
+)
 from .serializers import (
     SermonSeriesSerializer, SermonListSerializer, SermonDetailSerializer,
     SermonCommentSerializer, SermonCommentCreateSerializer,
-    SermonPlaylistSerializer, SermonPlaylistCreateSerializer
+    SermonPlaylistSerializer, SermonPlaylistCreateSerializer, PlaylistItemsUpdateSerializer
 )
+from apps.core.pagination import ArchivePagination
 from .filters import SermonFilter
+from .counters import sermon_views, sermon_downloads
+from .search import search_sermons
+from .comments import load_reply_map
+from .facets import sermon_facets
+from .media import serve_media, is_initial_request
+from .feeds import FEED_TYPES, get_feed
 
 
-class SermonSeriesListView(generics.ListAPIView):
+class SermonSeriesQueryMixin:
+    """
+    Active sermon series with their sermon count annotated.
+    
+    Pass ``published=true`` to count only published sermons.
+    """
+    def get_queryset(self):
+        published_only = self.request.query_params.get('published', '').lower() in ('1', 'true')
+        return SermonSeries.objects.filter(is_active=True).with_sermon_count(
+            published_only=published_only
+        ).order_by('-start_date')
+
+
+class SermonSeriesListView(SermonSeriesQueryMixin, generics.ListAPIView):
     """
     List all active sermon series.
     """
-    queryset = SermonSeries.objects.filter(is_active=True)
     serializer_class = SermonSeriesSerializer
     permission_classes = [AllowAny]
 
 
-class SermonSeriesDetailView(generics.RetrieveAPIView):
+class SermonSeriesDetailView(SermonSeriesQueryMixin, generics.RetrieveAPIView):
     """
     Get details of a specific sermon series.
     """
-    queryset = SermonSeries.objects.filter(is_active=True)
     serializer_class = SermonSeriesSerializer
     permission_classes = [AllowAny]
 
@@ -40,7 +66,9 @@ class SermonListView(generics.ListAPIView):
     """
     List all published sermons with filtering and search.
     """
-    queryset = Sermon.objects.filter(is_published=True)
+    queryset = Sermon.objects.filter(is_published=True).select_related(
+        'preacher', 'series'
+    ).prefetch_related('tags')
     serializer_class = SermonListSerializer
     permission_classes = [AllowAny]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -48,20 +76,45 @@ class SermonListView(generics.ListAPIView):
     search_fields = ['title', 'description', 'scripture_reference', 'preacher__name']
     ordering_fields = ['date_preached', 'view_count', 'title']
     ordering = ['-date_preached']
+    pagination_class = ArchivePagination
+    cursor_ordering = ['-date_preached', '-id']
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def sermon_facets_view(request):
+    """
+    Tag, preacher, series and year counts for the current sermon filters.
+    """
+    filterset = SermonFilter(request.query_params, queryset=Sermon.objects.filter(is_published=True))
+    if not filterset.is_valid():
+        return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+    return Response(sermon_facets(filterset))
 
 
 class SermonDetailView(generics.RetrieveAPIView):
     """
     Get details of a specific sermon and increment view count.
     """
-    queryset = Sermon.objects.filter(is_published=True)
+    queryset = Sermon.objects.filter(is_published=True).select_related(
+        'preacher', 'series'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'related_links',
+            queryset=RelatedSermon.objects.filter(
+                related__is_published=True
+            ).select_related('related__preacher').order_by('rank')
+        )
+    )
     serializer_class = SermonDetailSerializer
     permission_classes = [AllowAny]
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        # Increment view count
-        instance.increment_view_count()
+        # Buffer the view; it is written back in batches by the flusher
+        sermon_views.increment(instance.pk)
+        instance.view_count += sermon_views.pending(instance.pk) or 1
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
@@ -70,7 +123,9 @@ class FeaturedSermonsView(generics.ListAPIView):
     """
     List featured sermons.
     """
-    queryset = Sermon.objects.filter(is_published=True, is_featured=True)
+    queryset = Sermon.objects.filter(is_published=True, is_featured=True).select_related(
+        'preacher', 'series'
+    ).prefetch_related('tags')
     serializer_class = SermonListSerializer
     permission_classes = [AllowAny]
 
@@ -79,7 +134,9 @@ class RecentSermonsView(generics.ListAPIView):
     """
     List recent sermons (last 10).
     """
-    queryset = Sermon.objects.filter(is_published=True)[:10]
+    queryset = Sermon.objects.filter(is_published=True).select_related(
+        'preacher', 'series'
+    ).prefetch_related('tags')[:10]
     serializer_class = SermonListSerializer
     permission_classes = [AllowAny]
 
@@ -88,9 +145,40 @@ class PopularSermonsView(generics.ListAPIView):
     """
     List popular sermons by view count.
     """
-    queryset = Sermon.objects.filter(is_published=True).order_by('-view_count')[:10]
+    queryset = Sermon.objects.filter(is_published=True).select_related(
+        'preacher', 'series'
+    ).prefetch_related('tags').order_by('-view_count')[:10]
+    serializer_class = SermonListSerializer
+    permission_classes = [AllowAny]
+
+
+class TrendingSermonsView(generics.ListAPIView):
+    """
+    List trending sermons from the precomputed leaderboard.
+    """
+    serializer_class = SermonListSerializer
+    permission_classes = [AllowAny]
+    
+    def get_queryset(self):
+        return Sermon.objects.filter(
+            is_published=True,
+            trending__isnull=False
+        ).select_related('preacher', 'series').prefetch_related('tags').order_by('trending__rank')
+
+
+class AlsoDownloadedSermonsView(generics.ListAPIView):
+    """
+    List sermons that listeners of a sermon also downloaded.
+    """
     serializer_class = SermonListSerializer
     permission_classes = [AllowAny]
+    pagination_class = None
+    
+    def get_queryset(self):
+        return Sermon.objects.filter(
+            is_published=True,
+            recommended_for__sermon_id=self.kwargs['pk']
+        ).select_related('preacher', 'series').prefetch_related('tags').order_by('recommended_for__rank')
 
 
 class SermonCommentListView(generics.ListAPIView):
@@ -106,7 +194,14 @@ class SermonCommentListView(generics.ListAPIView):
             sermon_id=sermon_id, 
             is_approved=True,
             parent__isnull=True  # Only top-level comments
-        )
+        ).select_related('user')
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Replies at every depth come from one query instead of one per comment
+        if 'sermon_id' in self.kwargs:
+            context['reply_map'] = load_reply_map(self.kwargs['sermon_id'])
+        return context
 
 
 class SermonCommentCreateView(generics.CreateAPIView):
@@ -132,8 +227,8 @@ class SermonPlaylistListView(generics.ListAPIView):
         if self.request.user.is_authenticated:
             return SermonPlaylist.objects.filter(
                 Q(is_public=True) | Q(created_by=self.request.user)
-            )
-        return SermonPlaylist.objects.filter(is_public=True)
+            ).with_items()
+        return SermonPlaylist.objects.filter(is_public=True).with_items()
 
 
 class SermonPlaylistCreateView(generics.CreateAPIView):
@@ -158,7 +253,84 @@ class SermonPlaylistDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return SermonPlaylist.objects.filter(
             Q(is_public=True) | Q(created_by=self.request.user)
+        ).with_items()
+
+
+class SermonPlaylistItemsView(generics.GenericAPIView):
+    """
+    Replace the items of one of the user's playlists in a single request.
+    
+    PUT ``{"sermons": [id, ...]}`` with the complete desired order: missing
+    sermons are removed, new ones added and every position rewritten with
+    one batched statement per operation.
+    """
+    serializer_class = PlaylistItemsUpdateSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return SermonPlaylist.objects.filter(created_by=self.request.user)
+    
+    def put(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sermon_ids = serializer.validated_data['sermons']
+        positions = {sermon_id: order for order, sermon_id in enumerate(sermon_ids)}
+        
+        with transaction.atomic():
+            # Lock the playlist so concurrent edits apply one after another
+            playlist = get_object_or_404(self.get_queryset().select_for_update(), pk=kwargs['pk'])
+            items = PlaylistItem.objects.filter(playlist=playlist)
+            items.exclude(sermon_id__in=sermon_ids).delete()
+            
+            existing = list(items.filter(sermon_id__in=sermon_ids))
+            for item in existing:
+                item.order = positions[item.sermon_id]
+            PlaylistItem.objects.bulk_update(existing, ['order'])
+            
+            present = {item.sermon_id for item in existing}
+            PlaylistItem.objects.bulk_create([
+                PlaylistItem(playlist=playlist, sermon_id=sermon_id, order=positions[sermon_id])
+                for sermon_id in sermon_ids if sermon_id not in present
+            ])
+        
+        playlist = SermonPlaylist.objects.with_items().get(pk=playlist.pk)
+        return Response(SermonPlaylistSerializer(playlist, context=self.get_serializer_context()).data)
+
+
+MEDIA_FIELDS = {
+    'audio': 'audio_file',
+    'video': 'video_file',
+    'notes': 'sermon_notes',
+}
+
+
+@require_safe
+def sermon_media(request, pk, file_type):
+    """
+    Deliver a sermon's audio, video or notes file.
+    
+    Supports byte ranges and ETag/Last-Modified validation, offloads local
+    files to the front proxy when configured, and redirects to the storage
+    URL for remote files. The download is queued without blocking the transfer.
+    """
+    field_name = MEDIA_FIELDS.get(file_type)
+    if field_name is None:
+        raise Http404("Unknown media type")
+    
+    sermon = get_object_or_404(Sermon.objects.only('id', field_name), pk=pk, is_published=True)
+    field_file = getattr(sermon, field_name)
+    if not field_file:
+        raise Http404("Sermon has no such media")
+    
+    response = serve_media(request, field_file)
+    if response.status_code in (200, 206, 302) and is_initial_request(request):
+        sermon_downloads.enqueue(
+            sermon_id=sermon.pk,
+            user_id=request.user.pk if request.user.is_authenticated else None,
+            ip_address=request.META.get('REMOTE_ADDR', ''),
+            file_type=file_type
         )
+    return response
 
 
 @api_view(['POST'])
@@ -166,56 +338,106 @@ class SermonPlaylistDetailView(generics.RetrieveUpdateDestroyAPIView):
 def track_sermon_download(request, sermon_id):
     """
     Track sermon download.
+    
+    The event is queued and written in a batch by the download flusher.
     """
-    try:
-        sermon = Sermon.objects.get(id=sermon_id, is_published=True)
-        file_type = request.data.get('file_type', 'audio')
-        
-        # Create download record
-        SermonDownload.objects.create(
-            sermon=sermon,
-            user=request.user if request.user.is_authenticated else None,
-            ip_address=request.META.get('REMOTE_ADDR', ''),
-            file_type=file_type
-        )
-        
-        # Increment download count
-        sermon.increment_download_count()
-        
-        return Response({'message': 'Download tracked successfully'})
-    except Sermon.DoesNotExist:
+    if not Sermon.objects.filter(pk=sermon_id, is_published=True).exists():
         raise Http404("Sermon not found")
+    
+    file_type = request.data.get('file_type', 'audio')
+    if file_type not in dict(SermonDownload._meta.get_field('file_type').choices):
+        return Response(
+            {'error': 'Invalid file type'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    sermon_downloads.enqueue(
+        sermon_id=sermon_id,
+        user_id=request.user.pk if request.user.is_authenticated else None,
+        ip_address=request.META.get('REMOTE_ADDR', ''),
+        file_type=file_type
+    )
+    
+    return Response({'message': 'Download tracked successfully'}, status=status.HTTP_202_ACCEPTED)
 
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def sermon_search(request):
+class SermonSearchView(generics.ListAPIView):
     """
     Advanced sermon search with multiple criteria.
+    
+    Results are paginated; pass ``stream=ndjson`` to stream every match as
+    newline-delimited JSON instead.
     """
-    query = request.GET.get('q', '')
-    preacher = request.GET.get('preacher', '')
-    series = request.GET.get('series', '')
-    tags = request.GET.get('tags', '')
+    serializer_class = SermonListSerializer
+    permission_classes = [AllowAny]
+    filter_backends = []
+    stream_chunk_size = 500
     
-    sermons = Sermon.objects.filter(is_published=True)
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '')
+        preacher = self.request.query_params.get('preacher', '')
+        series = self.request.query_params.get('series', '')
+        tags = self.request.query_params.get('tags', '')
+        
+        sermons = Sermon.objects.filter(is_published=True)
+        
+        if query:
+            sermons = search_sermons(sermons, query)
+        
+        if preacher:
+            sermons = sermons.filter(preacher__name__icontains=preacher)
+        
+        if series:
+            sermons = sermons.filter(series__title__icontains=series)
+        
+        if tags:
+            tag_list = [tag.strip() for tag in tags.split(',')]
+            sermons = sermons.filter(tags__name__in=tag_list).distinct()
+        
+        return sermons.select_related('preacher', 'series').prefetch_related('tags')
     
-    if query:
-        sermons = sermons.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(scripture_reference__icontains=query)
-        )
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('stream') == 'ndjson':
+            return self.stream(self.get_queryset())
+        return super().list(request, *args, **kwargs)
     
-    if preacher:
-        sermons = sermons.filter(preacher__name__icontains=preacher)
+    def stream(self, queryset):
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        encoder = JSONEncoder(separators=(',', ':'))
+        
+        def rows():
+            for sermon in queryset.iterator(chunk_size=self.stream_chunk_size):
+                yield encoder.encode(serializer_class(sermon, context=context).data) + '\n'
+        
+        return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+
+@require_safe
+def sermon_feed(request, fmt, series_id=None, preacher_id=None):
+    """
+    Podcast feed (``rss`` or ``atom``) of published sermons, optionally
+    limited to one series or preacher.
     
-    if series:
-        sermons = sermons.filter(series__title__icontains=series)
+    Served from cache with ETag/Last-Modified, so unchanged polls get a 304.
+    """
+    if fmt not in FEED_TYPES:
+        raise Http404("Unknown feed format")
+    if series_id is not None:
+        scope = f'series:{series_id}'
+    elif preacher_id is not None:
+        scope = f'preacher:{preacher_id}'
+    else:
+        scope = 'all'
     
-    if tags:
-        tag_list = [tag.strip() for tag in tags.split(',')]
-        sermons = sermons.filter(tags__name__in=tag_list).distinct()
+    feed = get_feed(scope, fmt)
+    if feed is None:
+        raise Http404("No such feed")
+    content, etag, last_modified = feed
     
-    serializer = SermonListSerializer(sermons, many=True)
-    return Response(serializer.data)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(content, content_type=FEED_TYPES[fmt].content_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
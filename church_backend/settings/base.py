@@ -62,6 +62,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'allauth.account.middleware.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -185,6 +186,89 @@ DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@newclassroyal
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = config('REDIS_URL', default='redis://localhost:6379/0')
 
+# Cache shared by every worker process. Cache version keys (facets, feeds,
+# event occurrences) must be seen by all processes, so this cannot be a
+# per-process cache outside single-process development.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_URL', default='redis://localhost:6379/1'),
+        'KEY_PREFIX': 'ncrm',
+    }
+}
+
+# Image derivatives (variant name -> longest edge in pixels)
+IMAGE_VARIANTS = {
+    'thumb': 320,
+    'medium': 960,
+}
+# Threads building uploads in the web process (DEBUG only; otherwise build_image_derivatives)
+IMAGE_DERIVATIVE_WORKERS = config('IMAGE_DERIVATIVE_WORKERS', default=2, cast=int)
+# Seconds build_image_derivatives --loop waits when nothing is queued
+IMAGE_DERIVATIVE_POLL_INTERVAL = config('IMAGE_DERIVATIVE_POLL_INTERVAL', default=30, cast=int)
+
+# Sermon counters (seconds between write-behind flushes, 0 writes through)
+SERMON_VIEW_COUNT_FLUSH_INTERVAL = config('SERMON_VIEW_COUNT_FLUSH_INTERVAL', default=30, cast=int)
+SERMON_DOWNLOAD_FLUSH_INTERVAL = config('SERMON_DOWNLOAD_FLUSH_INTERVAL', default=10, cast=int)
+SERMON_DOWNLOAD_MAX_PENDING = config('SERMON_DOWNLOAD_MAX_PENDING', default=500, cast=int)
+SERMON_DOWNLOAD_MAX_BUFFERED = config('SERMON_DOWNLOAD_MAX_BUFFERED', default=50000, cast=int)
+
+# Sermon media delivery: '' streams from Django, 'x-accel-redirect' (nginx)
+# or 'x-sendfile' (Apache/lighttpd) hands local files to the front proxy
+SERMON_MEDIA_SENDFILE = config('SERMON_MEDIA_SENDFILE', default='')
+SERMON_MEDIA_ACCEL_PREFIX = config('SERMON_MEDIA_ACCEL_PREFIX', default='/protected-media/')
+# Storage for sermon audio, video and notes ({'BACKEND': ..., 'OPTIONS': {...}});
+# None keeps them on the default storage
+SERMON_MEDIA_STORAGE = None
+
+# Trending sermons leaderboard
+SERMON_TRENDING_HALF_LIFE_DAYS = config('SERMON_TRENDING_HALF_LIFE_DAYS', default=7, cast=float)
+SERMON_TRENDING_WINDOW_DAYS = config('SERMON_TRENDING_WINDOW_DAYS', default=60, cast=int)
+SERMON_TRENDING_DOWNLOAD_WEIGHT = config('SERMON_TRENDING_DOWNLOAD_WEIGHT', default=3.0, cast=float)
+SERMON_TRENDING_SIZE = config('SERMON_TRENDING_SIZE', default=100, cast=int)
+
+# Sermon facet counts cache lifetime (seconds)
+SERMON_FACETS_CACHE_TIMEOUT = config('SERMON_FACETS_CACHE_TIMEOUT', default=600, cast=int)
+
+# Sermon full-text search (PostgreSQL text search configuration)
+SERMON_SEARCH_CONFIG = config('SERMON_SEARCH_CONFIG', default='english')
+
+# Related sermons (neighbours stored per sermon)
+SERMON_RELATED_TOP_K = config('SERMON_RELATED_TOP_K', default=6, cast=int)
+
+# "Listeners also downloaded" recommendations
+SERMON_RECOMMENDATIONS_TOP_N = config('SERMON_RECOMMENDATIONS_TOP_N', default=10, cast=int)
+SERMON_RECOMMENDATIONS_MIN_COOCCURRENCE = config('SERMON_RECOMMENDATIONS_MIN_COOCCURRENCE', default=2, cast=int)
+# Rows younger than this (seconds) wait for the next refresh, so slow transactions are not skipped
+SERMON_RECOMMENDATIONS_COMMIT_LAG = config('SERMON_RECOMMENDATIONS_COMMIT_LAG', default=300, cast=int)
+
+# Podcast feeds
+SERMON_FEED_SIZE = config('SERMON_FEED_SIZE', default=50, cast=int)
+SERMON_FEED_CACHE_TIMEOUT = config('SERMON_FEED_CACHE_TIMEOUT', default=86400, cast=int)
+SERMON_FEED_SITE_URL = config('SERMON_FEED_SITE_URL', default='http://localhost:3000')
+# Public base URL of this API, used for feed self links, enclosures and media
+SERMON_FEED_API_URL = config('SERMON_FEED_API_URL', default='http://localhost:8000')
+
+# Event occurrences (recurring events are expanded per month on demand)
+EVENT_OCCURRENCE_CACHE_TIMEOUT = config('EVENT_OCCURRENCE_CACHE_TIMEOUT', default=3600, cast=int)
+EVENT_UPCOMING_HORIZON_DAYS = config('EVENT_UPCOMING_HORIZON_DAYS', default=366, cast=int)
+EVENT_CALENDAR_MAX_DAYS = config('EVENT_CALENDAR_MAX_DAYS', default=92, cast=int)
+
+# iCalendar subscriptions (events ending more than EVENT_ICAL_PAST_DAYS ago are left out)
+EVENT_ICAL_PAST_DAYS = config('EVENT_ICAL_PAST_DAYS', default=90, cast=int)
+EVENT_FEED_SITE_URL = config('EVENT_FEED_SITE_URL', default='http://localhost:3000')
+
+# QR check-in sync (scans per uploaded batch, rows per INSERT)
+EVENT_CHECK_IN_MAX_SCANS = config('EVENT_CHECK_IN_MAX_SCANS', default=1000, cast=int)
+EVENT_CHECK_IN_BATCH_SIZE = config('EVENT_CHECK_IN_BATCH_SIZE', default=500, cast=int)
+
+# Event reminder dispatch (send_event_reminders)
+EVENT_REMINDER_BATCH_SIZE = config('EVENT_REMINDER_BATCH_SIZE', default=200, cast=int)
+EVENT_REMINDER_MAX_ATTEMPTS = config('EVENT_REMINDER_MAX_ATTEMPTS', default=5, cast=int)
+EVENT_REMINDER_POLL_INTERVAL = config('EVENT_REMINDER_POLL_INTERVAL', default=30, cast=int)
+# Seconds a dispatcher holds its claimed batch; longer than sending one batch takes
+EVENT_REMINDER_CLAIM_TIMEOUT = config('EVENT_REMINDER_CLAIM_TIMEOUT', default=600, cast=int)
+
 # Payment Configuration
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
@@ -14,6 +14,13 @@ DATABASES = {
     }
 }
 
+# runserver is a single process, so a local-memory cache is enough
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Add debug toolbar for development
 if DEBUG:
     INSTALLED_APPS += ['debug_toolbar']
@@ -42,6 +42,20 @@ AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME', default='')
 AWS_S3_REGION_NAME = config('AWS_S3_REGION_NAME', default='us-east-1')
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
 AWS_DEFAULT_ACL = 'public-read'
+AWS_S3_SIGNATURE_VERSION = 's3v4'
+AWS_QUERYSTRING_EXPIRE = config('AWS_QUERYSTRING_EXPIRE', default=3600, cast=int)
+# Sermon audio, video and notes are private objects served through expiring
+# signed URLs; images stay public on the custom domain so they can be cached.
+SERMON_MEDIA_STORAGE = {
+    'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage',
+    'OPTIONS': {
+        'bucket_name': config('AWS_PRIVATE_STORAGE_BUCKET_NAME', default=AWS_STORAGE_BUCKET_NAME),
+        'default_acl': 'private',
+        'querystring_auth': True,
+        # django-storages does not sign custom-domain URLs.
+        'custom_domain': None,
+    },
+}
 
 # Email for production
 EMAIL_BACKEND = 'django_ses.SESBackend'
@@ -73,6 +73,9 @@ export const apiService = {
   getFeaturedSermons: () => api.get('/sermons/featured/'),
   getRecentSermons: () => api.get('/sermons/recent/'),
   getPopularSermons: () => api.get('/sermons/popular/'),
+  getTrendingSermons: () => api.get('/sermons/trending/'),
+  getAlsoDownloadedSermons: (id) => api.get(`/sermons/${id}/also-downloaded/`),
+  getSermonFeedUrl: (format = 'rss') => `${api.defaults.baseURL}/sermons/feed/${format}/`,
   searchSermons: (params) => api.get('/sermons/search/', { params }),
 
   // Events
@@ -81,7 +84,14 @@ export const apiService = {
   getUpcomingEvents: () => api.get('/events/upcoming/'),
   getFeaturedEvents: () => api.get('/events/featured/'),
   getEventCategories: () => api.get('/events/categories/'),
+  getEventCalendar: (start, end) => api.get('/events/calendar/', { params: { start, end } }),
+  getEventIcalUrl: ({ categoryId, ministryId } = {}) => {
+    if (categoryId) return `${api.defaults.baseURL}/events/categories/${categoryId}/calendar.ics`
+    if (ministryId) return `${api.defaults.baseURL}/events/ministries/${ministryId}/calendar.ics`
+    return `${api.defaults.baseURL}/events/calendar.ics`
+  },
   registerForEvent: (eventId, data) => api.post(`/events/${eventId}/register/`, data),
+  syncEventCheckIns: (eventId, scans) => api.post(`/events/${eventId}/check-in/`, { scans }),
 
   // Prayer
   getPrayerRequests: (params) => api.get('/prayer/', { params }),